@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Client of the admin REST API of Keycloak for the setup of the tests and the bulk admin work.
+# The requests go through the pooled connections of a Transport with the cached admin token of
+# helpers.tokens, at most max_parallel at a time. When Keycloak answers 429 or 503 all the requests
+# of the client wait for its Retry-After (or an exponential backoff), so that a bulk operation slows
+# down to the pace of the server instead of piling up requests.
+
+import time
+import random
+import logging
+import threading
+
+from http import HTTPStatus
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from requests import Request
+
+import helpers.requests as req
+from helpers.logging import log_request
+from helpers.tokens import get_provider
+from helpers.transport import Transport
+
+logger = logging.getLogger('acceptance-tool.helpers.admin')
+
+THROTTLED = (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE)
+
+
+def retry_after(response, default):
+    """
+    :param response: response with a 429 or 503 status
+    :param default: seconds to wait when the response has no valid Retry-After header
+    :return: seconds to wait before the next request
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class KeycloakAdminClient():
+    """
+    Admin REST API of a Keycloak instance, through pooled connections, with a bounded number of requests
+    in flight and a backoff on 429 and 503
+    """
+
+    def __init__(self, idp_settings, transport=None, tokens=None, max_parallel=4, max_retries=5, backoff=0.5,
+                 max_backoff=30):
+        """
+        :param idp_settings: settings of the IDP, e.g. settings["idp"] or settings["idp_external"]
+        :param transport: pooled transport, by default a transport of the client sized for max_parallel
+        :param tokens: AdminTokenProvider of the admin tokens, by default the provider of the process
+        :param max_parallel: maximum number of requests in flight
+        :param max_retries: maximum number of retries of a request answered with 429 or 503
+        :param backoff: first wait, in seconds, of the exponential backoff without Retry-After
+        :param max_backoff: maximum wait, in seconds, between two retries
+        """
+        self.idp = idp_settings
+        self.scheme = idp_settings["http_scheme"]
+        self.ip = idp_settings["ip"]
+        self.port = idp_settings["port"]
+        self.base_url = "{scheme}://{ip}:{port}/auth".format(scheme=self.scheme, ip=self.ip, port=self.port)
+
+        self._owns_transport = transport is None
+        self.transport = transport or Transport(pool_connections=1, pool_maxsize=max_parallel)
+        self.tokens = tokens or get_provider()
+        self.max_parallel = max_parallel
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._slots = threading.BoundedSemaphore(max_parallel)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self.stats = {"requests": 0, "throttled": 0, "unauthorized": 0}
+
+    def session(self):
+        """
+        Session of the calling thread: the sessions are kept, the connections are pooled by the transport
+        """
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = self._local.session = self.transport.session()
+        return s
+
+    def header(self):
+        return req.get_admin_header(self.scheme, self.ip, self.port, self.tokens.admin_token(self.idp))
+
+    def close(self):
+        if self._owns_transport:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_pause(self):
+        while True:
+            with self._lock:
+                delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def request(self, method, path, hop, json=None, params=None):
+        """
+        Send a request to Keycloak, renewing the token once on 401 and retrying on 429 and 503
+        :param method: HTTP method
+        :param path: path after /auth, e.g. admin/realms/master/users
+        :param hop: name of the hop in the metrics
+        :param json: optional JSON body
+        :param params: optional query parameters
+        :return: response
+        """
+        url = "{base}/{path}".format(base=self.base_url, path=path)
+        attempt = 0
+        renewed = False
+        while True:
+            self._wait_pause()
+
+            req_admin = Request(method=method, url=url, headers=self.header(), json=json, params=params)
+            prepared_request = req_admin.prepare()
+            log_request(logger, req_admin)
+
+            with self._slots:
+                response = req.send(self.session(), prepared_request, hop)
+            self._count("requests")
+
+            logger.debug(response.status_code)
+
+            if response.status_code == HTTPStatus.UNAUTHORIZED and not renewed:
+                # e.g. the session of the admin expired on the server before the token
+                self._count("unauthorized")
+                self.tokens.invalidate_admin(self.idp)
+                renewed = True
+                continue
+
+            if response.status_code in THROTTLED and attempt < self.max_retries:
+                self._count("throttled")
+                default = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                delay = min(self.max_backoff, retry_after(response, default))
+                logger.info("{method} {path} answered {status}, retry in {d:.1f}s".format(
+                    method=method, path=path, status=response.status_code, d=delay))
+                self._pause(delay)
+                attempt += 1
+                continue
+
+            return response
+
+    def _json(self, method, path, hop, json=None, params=None, not_found=False):
+        response = self.request(method, path, hop, json, params)
+        if not_found and response.status_code == HTTPStatus.NOT_FOUND:
+            return None
+        response.raise_for_status()
+        if not response.content:
+            return None
+        return response.json()
+
+    @staticmethod
+    def _created_id(response):
+        response.raise_for_status()
+        return response.headers.get("Location", "").rstrip("/").rpartition("/")[2] or None
+
+    def parallel(self, function, items):
+        """
+        Apply a function to items with max_parallel threads, e.g. to delete many users
+        :return: list of the results, in the order of the items
+        """
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            return list(executor.map(function, items))
+
+    # realms
+
+    def get_realm(self, realm):
+        """
+        :return: representation of the realm, None if it does not exist
+        """
+        return self._json('GET', "admin/realms/{realm}".format(realm=quote(realm)), "admin.realm_get",
+                          not_found=True)
+
+    def create_realm(self, representation):
+        response = self.request('POST', "admin/realms", "admin.realm_import", json=representation)
+        response.raise_for_status()
+        return response
+
+    def update_realm(self, realm, representation):
+        response = self.request('PUT', "admin/realms/{realm}".format(realm=quote(realm)), "admin.realm_update",
+                                json=representation)
+        response.raise_for_status()
+        return response
+
+    def delete_realm(self, realm):
+        """
+        :return: response, 404 if the realm did not exist
+        """
+        return self.request('DELETE', "admin/realms/{realm}".format(realm=quote(realm)), "admin.realm_delete")
+
+    def partial_import(self, realm, data):
+        """
+        :param data: partial import representation, e.g. {"ifResourceExists": "SKIP", "users": [...]}
+        :return: response
+        """
+        return self.request('POST', "admin/realms/{realm}/partialImport".format(realm=quote(realm)),
+                            "admin.partial_import", json=data)
+
+    def export_realm(self, realm):
+        """
+        Export of the realm with its users and secrets, by the keycloak-export module
+        :return: response
+        """
+        return self.request('GET', "realms/{realm}/export/realm".format(realm=quote(realm)), "admin.realm_export")
+
+    # users
+
+    def count_users(self, realm):
+        return self._json('GET', "admin/realms/{realm}/users/count".format(realm=quote(realm)), "admin.users_count")
+
+    def get_users(self, realm, first=0, max_results=100, search=None, username=None):
+        params = {"first": first, "max": max_results}
+        if search is not None:
+            params["search"] = search
+        if username is not None:
+            params["username"] = username
+        return self._json('GET', "admin/realms/{realm}/users".format(realm=quote(realm)), "admin.users_get",
+                          params=params)
+
+    def iter_users(self, realm, page_size=500, search=None):
+        """
+        All the users of a realm, page by page
+        """
+        first = 0
+        while True:
+            page = self.get_users(realm, first, page_size, search)
+            yield from page
+            if len(page) < page_size:
+                return
+            first += page_size
+
+    def get_user_by_username(self, realm, username):
+        """
+        :return: representation of the user, None if it does not exist
+        """
+        # the username parameter matches substrings
+        for user in self.get_users(realm, username=username):
+            if user["username"] == username.lower():
+                return user
+        return None
+
+    def create_user(self, realm, representation):
+        """
+        :return: id of the new user
+        """
+        response = self.request('POST', "admin/realms/{realm}/users".format(realm=quote(realm)),
+                                "admin.user_create", json=representation)
+        return self._created_id(response)
+
+    def delete_user(self, realm, user_id):
+        return self.request('DELETE', "admin/realms/{realm}/users/{id}".format(realm=quote(realm), id=user_id),
+                            "admin.user_delete")
+
+    def delete_users(self, realm, user_ids):
+        """
+        Delete users with max_parallel requests in flight
+        :return: number of users deleted
+        """
+        responses = self.parallel(lambda user_id: self.delete_user(realm, user_id), user_ids)
+        return sum(1 for response in responses if response.status_code == HTTPStatus.NO_CONTENT)
+
+    def reset_password(self, realm, user_id, password, temporary=False):
+        response = self.request(
+            'PUT', "admin/realms/{realm}/users/{id}/reset-password".format(realm=quote(realm), id=user_id),
+            "admin.user_password", json={"type": "password", "value": password, "temporary": temporary})
+        response.raise_for_status()
+        return response
+
+    # clients
+
+    def get_clients(self, realm, client_id=None):
+        params = {"clientId": client_id} if client_id is not None else None
+        return self._json('GET', "admin/realms/{realm}/clients".format(realm=quote(realm)), "admin.clients_get",
+                          params=params)
+
+    def get_client(self, realm, client_id):
+        """
+        :param client_id: clientId of the client, e.g. the entity id of a SAML SP
+        :return: representation of the client, None if it does not exist
+        """
+        clients = self.get_clients(realm, client_id)
+        return clients[0] if clients else None
+
+    def update_client(self, realm, representation):
+        response = self.request(
+            'PUT', "admin/realms/{realm}/clients/{id}".format(realm=quote(realm), id=representation["id"]),
+            "admin.client_update", json=representation)
+        response.raise_for_status()
+        return response
+
+    # roles
+
+    def get_realm_roles(self, realm):
+        return self._json('GET', "admin/realms/{realm}/roles".format(realm=quote(realm)), "admin.roles_get")
+
+    def get_realm_role(self, realm, role):
+        """
+        :return: representation of the role, None if it does not exist
+        """
+        return self._json('GET', "admin/realms/{realm}/roles/{role}".format(realm=quote(realm), role=quote(role)),
+                          "admin.role_get", not_found=True)
+
+    def create_realm_role(self, realm, representation):
+        response = self.request('POST', "admin/realms/{realm}/roles".format(realm=quote(realm)),
+                                "admin.role_create", json=representation)
+        response.raise_for_status()
+        return response
+
+    def add_realm_roles(self, realm, user_id, roles):
+        """
+        :param roles: names of the realm roles given to the user
+        """
+        representations = [self.get_realm_role(realm, role) for role in roles]
+        response = self.request(
+            'POST', "admin/realms/{realm}/users/{id}/role-mappings/realm".format(realm=quote(realm), id=user_id),
+            "admin.user_roles", json=representations)
+        response.raise_for_status()
+        return response
+
+    # sessions
+
+    def get_user_sessions(self, realm, user_id):
+        return self._json('GET', "admin/realms/{realm}/users/{id}/sessions".format(realm=quote(realm), id=user_id),
+                          "admin.user_sessions")
+
+    def get_client_sessions(self, realm, client_uuid, first=0, max_results=100):
+        """
+        :param client_uuid: id of the client, not its clientId
+        """
+        return self._json(
+            'GET', "admin/realms/{realm}/clients/{id}/user-sessions".format(realm=quote(realm), id=client_uuid),
+            "admin.client_sessions", params={"first": first, "max": max_results})
+
+    def get_session_stats(self, realm):
+        """
+        :return: number of active and offline sessions per client
+        """
+        return self._json('GET', "admin/realms/{realm}/client-session-stats".format(realm=quote(realm)),
+                          "admin.session_stats")
+
+    def delete_session(self, realm, session_id):
+        return self.request(
+            'DELETE', "admin/realms/{realm}/sessions/{id}".format(realm=quote(realm), id=session_id),
+            "admin.session_delete")
+
+    def logout_user(self, realm, user_id):
+        response = self.request(
+            'POST', "admin/realms/{realm}/users/{id}/logout".format(realm=quote(realm), id=user_id),
+            "admin.user_logout")
+        response.raise_for_status()
+        return response
+
+    def logout_all(self, realm):
+        response = self.request('POST', "admin/realms/{realm}/logout-all".format(realm=quote(realm)),
+                                "admin.logout_all")
+        response.raise_for_status()
+        return response
@@ -0,0 +1,883 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# asyncio twins of the helpers of helpers.requests, with the same signatures and semantics.
+# The session s is an aiohttp ClientSession (see new_session) and the requests are still built and
+# prepared with python requests, so that the cookies, the form encoding and the logging are the same.
+
+import json
+import time
+
+import aiohttp
+
+import helpers.metrics as metrics
+import helpers.results as results
+from helpers.logging import log_request
+from helpers.forms import extract_form, extract_social_providers
+from helpers.saml import parse_redirect_url
+
+from requests import Request
+from requests.exceptions import TooManyRedirects
+from requests.models import DEFAULT_REDIRECT_LIMIT, REDIRECT_STATI
+from http import HTTPStatus
+from urllib.parse import urljoin
+from yarl import URL
+
+
+class AsyncResponse():
+    """
+    Response of an aiohttp request, with its body already read, that exposes the attributes of
+    a python requests Response used by the helpers and the tests
+    """
+
+    def __init__(self, response, content):
+        self.status_code = response.status
+        self.url = str(response.url)
+        self.headers = response.headers
+        self.cookies = {name: morsel.value for name, morsel in response.cookies.items()}
+        self.encoding = response.charset or 'utf-8'
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+    @property
+    def is_redirect(self):
+        return 'Location' in self.headers and self.status_code in REDIRECT_STATI
+
+
+def _trace_stats(stats):
+    """
+    Trace of the requests of a session, and of the connections it opens, into a TransportStats
+    """
+    async def on_request_start(session, context, params):
+        context.host = params.url.host
+        stats.count_request(context.host)
+
+    async def on_request_redirect(session, context, params):
+        context.host = params.url.join(URL(params.response.headers.get('Location', ''))).host or context.host
+        stats.count_request(context.host)
+
+    async def on_connection_create_end(session, context, params):
+        stats.count_connection(context.host)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_redirect.append(on_request_redirect)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+def new_session(limit=0, connector=None, stats=None):
+    """
+    Helper dedicated to create the aiohttp session used by the async helpers
+    :param limit: maximum number of simultaneous connections, 0 for no limit
+    :param connector: optional connector shared with other sessions, the session then does not close it
+    :param stats: optional helpers.transport.TransportStats counting the requests and new connections of the session
+    :return: aiohttp ClientSession
+    """
+    if connector is None:
+        connector = aiohttp.TCPConnector(limit=limit, ssl=False)
+        connector_owner = True
+    else:
+        connector_owner = False
+
+    # the cookie jar has to accept cookies from hosts given by ip
+    return aiohttp.ClientSession(
+        connector=connector,
+        connector_owner=connector_owner,
+        cookie_jar=aiohttp.CookieJar(unsafe=True),
+        trace_configs=[_trace_stats(stats)] if stats is not None else None
+    )
+
+
+async def send(s, prepared_request, hop, allow_redirects=True, flow_state=None):
+    """
+    Helper dedicated to send a prepared python requests request with an aiohttp session, to record
+    the latency of the hop and to stream the request to the results writer, if any
+    :param s: aiohttp session
+    :param prepared_request: prepared request
+    :param hop: name of the hop, e.g. idp.credentials_post
+    :param allow_redirects: follow the redirects or not
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return: AsyncResponse
+    """
+    timestamp = time.time()
+    start = time.perf_counter()
+
+    try:
+        async with s.request(
+            prepared_request.method,
+            URL(prepared_request.url, encoded=True),
+            headers=prepared_request.headers,
+            data=prepared_request.body,
+            allow_redirects=allow_redirects,
+            ssl=False
+        ) as response:
+            content = await response.read()
+    except Exception:
+        results.record_request(hop, timestamp, time.perf_counter() - start, 0, 0, flow_state)
+        raise
+
+    duration = time.perf_counter() - start
+
+    metrics.record(hop, duration, flow_state)
+    results.record_request(hop, timestamp, duration, response.status, len(content), flow_state)
+
+    return AsyncResponse(response, content)
+
+
+async def access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path, flow_state=None):
+    """
+    Helper dedicated to access the service provider in order to obtain the
+    endpoint of the IDP, where the connection protocol is WSFED
+    :param logger:
+    :param s: session s
+    :param header: header used for the request
+    :param sp_ip: service provider ip
+    :param sp_port: service provider port
+    :param sp_scheme: service provider http scheme
+    :param sp_path: service provider path
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return:
+    """
+    # Access to the SP
+    header_sp_page = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=sp_ip, port=sp_port),
+        'Referer': "{ip}:{port}".format(ip=sp_ip, port=sp_port)
+    }
+
+    req_get_sp_page = Request(
+        method='GET',
+        url="{scheme}://{ip}:{port}/{path}".format(
+            scheme=sp_scheme,
+            port=sp_port,
+            ip=sp_ip,
+            path=sp_path
+        ),
+        headers=header_sp_page,
+    )
+
+    prepared_request = req_get_sp_page.prepare()
+
+    log_request(logger, req_get_sp_page, flow_state)
+
+    response = await send(s, prepared_request, "wsfed.sp_access", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    return response
+
+
+async def access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path, idp_ip, idp_port, flow_state=None):
+    """
+    Helper dedicated to access the service provider in order to obtain the
+    endpoint of the IDP, where the connection protocol is SAML, with the HTTP-POST or the HTTP-Redirect binding
+    :param logger:
+    :param s: session s
+    :param header: header used for the request
+    :param sp_ip: service provider ip
+    :param sp_port: service provider port
+    :param sp_scheme: service provider http scheme
+    :param sp_path: service provider path
+    :param idp_ip: identity provider ip
+    :param idp_port: identity provider port
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return:
+    """
+
+    # Access to the SP
+    header_sp_page = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=sp_ip, port=sp_port),
+        'Referer': "{ip}:{port}".format(ip=sp_ip, port=sp_port)
+    }
+
+    req_get_sp_page = Request(
+        method='GET',
+        url="{scheme}://{ip}:{port}/{path}".format(
+            scheme=sp_scheme,
+            port=sp_port,
+            ip=sp_ip,
+            path=sp_path
+        ),
+        headers=header_sp_page,
+    )
+
+    prepared_request = req_get_sp_page.prepare()
+
+    log_request(logger, req_get_sp_page, flow_state)
+
+    response = await send(s, prepared_request, "saml.sp_access", allow_redirects=False, flow_state=flow_state)
+
+    # the redirects of the SP itself are followed, up to the one that carries the SAMLRequest to the IDP
+    redirects = 0
+    while response.is_redirect and parse_redirect_url(response.headers['Location']) is None:
+        redirects += 1
+        if redirects > DEFAULT_REDIRECT_LIMIT:
+            raise TooManyRedirects("Exceeded {max} redirects".format(max=DEFAULT_REDIRECT_LIMIT))
+        prepared_request = Request(
+            method='GET',
+            url=urljoin(response.url, response.headers['Location']),
+            headers=header_sp_page
+        ).prepare()
+        response = await send(s, prepared_request, "saml.sp_access", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    # store the session cookie
+    session_cookie = response.cookies
+
+    header_redirect_idp = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=idp_ip, port=idp_port),
+        'Referer': "{ip}:{port}".format(ip=sp_ip, port=sp_port)
+    }
+
+    if response.is_redirect:
+        # HTTP-Redirect binding: the SAMLRequest, and its signature if any, are in the query string
+        req_idp_saml_request = Request(
+            method='GET',
+            url=response.headers['Location'],
+            headers=header_redirect_idp
+        )
+        hop = "saml.idp_redirect_get"
+    else:
+        # Response returns a form that requests a post with RelayState and SAMLRequest as input
+        form = extract_form(response.content)
+        url_form = form.get('action')
+        method_form = form.get('method')
+        inputs = form.find_all('input')
+
+        # Do a SAML request to the identity provider
+        saml_request = {}
+        for input in inputs:
+            saml_request[input.get('name')] = input.get('value')
+
+        req_idp_saml_request = Request(
+            method=method_form,
+            url="{url}".format(url=url_form),
+            data=saml_request,
+            headers=header_redirect_idp
+        )
+        hop = "saml.idp_redirect"
+
+    prepared_request = req_idp_saml_request.prepare()
+
+    log_request(logger, req_idp_saml_request, flow_state)
+
+    response = await send(s, prepared_request, hop, allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    return session_cookie, response
+
+
+async def access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme, idp_ip, idp_port, method, url, token, session_cookie, keycloak_cookie, flow_state=None):
+    """
+    Helper dedicated to access the service provider endpoint with the token obtained from the identity provider.
+    Requests done in this method are dependent of the functionality of the servide provider.
+    :param logger:
+    :param s: session s
+    :param header: header used for the requests
+    :param sp_ip: service provider ip
+    :param sp_port: service provider port
+    :param idp_scheme: identity provider http scheme
+    :param idp_ip: identity provider ip
+    :param idp_port: identity provider port
+    :param method: method used to do the request, e.g. GET, POST
+    :param url: url used to make the request
+    :param token: token obtained from the identity provider
+    :param session_cookie: session cookie
+    :param keycloak_cookie: keycloak session cookie
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return:
+    """
+
+    # Perform a callback
+    header_callback = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=sp_ip, port=sp_port),
+        'Referer': "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port),
+    }
+
+    req_sp_with_token = Request(
+        method=method,
+        url="{url}".format(url=url),
+        data=token,
+        cookies=session_cookie,
+        headers=header_callback
+    )
+
+    prepared_request = req_sp_with_token.prepare()
+
+    log_request(logger, req_sp_with_token, flow_state)
+
+    response = await send(s, prepared_request, "sp.acs_post", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    sp_cookie = response.cookies
+
+    url_sp = response.headers['Location']
+
+    if url_sp == "/":
+        url_sp = "{scheme}://{ip}:{port}".format(ip=sp_ip, port=sp_port, scheme=sp_scheme)
+
+    header_login_sp = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=sp_ip, port=sp_port),
+        'Referer': "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port),
+    }
+
+    req_get_sp_page_final = Request(
+        method='GET',
+        url="{url}".format(url=url_sp),
+        cookies={**session_cookie, **keycloak_cookie, **response.cookies},
+        headers=header_login_sp
+    )
+
+    prepared_request = req_get_sp_page_final.prepare()
+
+    log_request(logger, req_get_sp_page_final, flow_state)
+
+    response = await send(s, prepared_request, "sp.final_get", flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    return response, sp_cookie
+
+
+async def redirect_to_idp(logger, s, redirect_url, header, cookie, flow_state=None):
+    """
+    Helper dedicated to perform the redirect request to the identity provider
+    :param logger:
+    :param s: session s
+    :param redirect_url: redirect url
+    :param header: header used for the requests
+    :param cookie:
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return:
+    """
+
+    req_get_keycloak = Request(
+        method='GET',
+        url="{url}".format(url=redirect_url),
+        cookies=cookie,
+        headers=header
+    )
+
+    prepared_request = req_get_keycloak.prepare()
+
+    log_request(logger, req_get_keycloak, flow_state)
+
+    response = await send(s, prepared_request, "idp.redirect_get", flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    return response
+
+
+async def send_credentials_to_idp(logger, s, header, idp_ip, idp_port, redirect_url, url_form, credentials_data, cookie, method, flow_state=None):
+    """
+    Helper dedicated to send the credentials to the identity provider
+    :param logger:
+    :param s: session s
+    :param header: header used for the requests
+    :param idp_ip: identity provider ip
+    :param idp_port: identity provider port
+    :param redirect_url: referer url
+    :param url_form: url used for the request
+    :param credentials_data: credentials, e.g. password and username
+    :param cookie: keycloak cookie
+    :param method: method used to do the request, e.g. GET, POST
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return:
+    """
+
+    header_login_keycloak = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=idp_ip, port=idp_port),
+        'Referer': "{host}".format(host=redirect_url),
+    }
+
+    req_login_idp = Request(
+        method=method,
+        url="{url}".format(url=url_form),
+        data=credentials_data,
+        cookies=cookie,
+        headers=header_login_keycloak
+    )
+    prepared_request = req_login_idp.prepare()
+
+    log_request(logger, req_login_idp, flow_state)
+
+    response = await send(s, prepared_request, "idp.credentials_post", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    return response
+
+
+async def login_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path, idp_username, idp_password, flow_state=None):
+    """
+    Helper dedicated to perform the requests needed to authenticate to the identity provider.
+    We are in the case of a scenario with IDP-initiated flow
+    :param logger:
+    :param s: session s
+    :param header: header used for the requests
+    :param idp_ip: identity provider ip
+    :param idp_port: identity provider port
+    :param idp_scheme: identity provider http scheme
+    :param idp_path: identity provider path
+    :param idp_username: username
+    :param idp_password: password
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return:
+    """
+    # Request access to the IDP
+    header_idp_page = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=idp_ip, port=idp_port)
+    }
+
+    req_get_idp_page = Request(
+        method='GET',
+        url="{scheme}://{ip}:{port}/{path}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port, path=idp_path),
+        headers=header_idp_page,
+    )
+
+    prepared_request = req_get_idp_page.prepare()
+
+    log_request(logger, req_get_idp_page, flow_state)
+
+    response = await send(s, prepared_request, "idp.account_access", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    oath_cookie = response.cookies
+
+    url_redirect = response.headers['Location']
+
+    req_idp_redirect = Request(
+        method='GET',
+        url="{url}".format(url=url_redirect),
+        headers=header_idp_page
+    )
+
+    prepared_request = req_idp_redirect.prepare()
+
+    log_request(logger, req_idp_redirect, flow_state)
+
+    response = await send(s, prepared_request, "idp.login_page", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    keycloak_cookie = response.cookies
+
+    form = extract_form(response.content)
+
+    url_form = form.get('action')
+    method_form = form.get('method')
+
+    # Send credentials to the IDP
+    credentials_data = {}
+    credentials_data["username"] = idp_username
+    credentials_data["password"] = idp_password
+
+    header_login_keycloak = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=idp_ip, port=idp_port)
+    }
+
+    req_login_idp = Request(
+        method=method_form,
+        url="{url}".format(url=url_form),
+        data=credentials_data,
+        cookies=keycloak_cookie,
+        headers=header_login_keycloak
+    )
+    prepared_request = req_login_idp.prepare()
+
+    log_request(logger, req_login_idp, flow_state)
+
+    response = await send(s, prepared_request, "idp.credentials_post", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    keycloak_cookie2 = response.cookies
+
+    url_redirect = response.headers['Location']
+
+    req_idp_redirect = Request(
+        method='GET',
+        url="{url}".format(url=url_redirect),
+        headers=header_login_keycloak,
+        cookies=keycloak_cookie2
+    )
+
+    prepared_request = req_idp_redirect.prepare()
+
+    log_request(logger, req_idp_redirect, flow_state)
+
+    response = await send(s, prepared_request, "idp.login_redirect", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    keycloak_cookie3 = response.cookies
+
+    url_redirect = response.headers['Location']
+
+    req_idp_redirect = Request(
+        method='GET',
+        url="{url}".format(url=url_redirect),
+        headers=header_login_keycloak,
+        cookies=keycloak_cookie3
+    )
+
+    prepared_request = req_idp_redirect.prepare()
+
+    log_request(logger, req_idp_redirect, flow_state)
+
+    response = await send(s, prepared_request, "idp.account_page", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    return oath_cookie, keycloak_cookie, keycloak_cookie2, response
+
+
+async def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path, idp_username, idp_password, idp2_ip, idp2_port, idp_broker, idp_form_id, flow_state=None):
+
+    # Request access to the broker IDP
+    header_idp_page = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=idp_ip, port=idp_port)
+    }
+
+    req_get_idp_page = Request(
+        method='GET',
+        url="{scheme}://{ip}:{port}/{path}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port, path=idp_path),
+        headers=header_idp_page,
+    )
+
+    prepared_request = req_get_idp_page.prepare()
+
+    log_request(logger, req_get_idp_page, flow_state)
+
+    response = await send(s, prepared_request, "broker.account_access", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    oath_cookie = response.cookies
+
+    url_redirect = response.headers['Location']
+
+    req_idp_redirect = Request(
+        method='GET',
+        url="{url}".format(url=url_redirect),
+        headers=header_idp_page
+    )
+
+    prepared_request = req_idp_redirect.prepare()
+
+    log_request(logger, req_idp_redirect, flow_state)
+
+    response = await send(s, prepared_request, "broker.login_page", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    keycloak_cookie = response.cookies
+
+    # In the login page we can choose to login with the external IDP
+    providers = extract_social_providers(response.content)
+
+    assert providers is not None
+
+    # we can have several idp external; choose the one needed for the test
+    external_idp_path = providers.get(idp_broker)
+
+    assert external_idp_path is not None
+
+    external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + external_idp_path
+
+    # Select to login with the external IDP
+    req_choose_external_idp = Request(
+        method='GET',
+        url="{url}".format(url=external_idp_url),
+        headers=header,
+        cookies=keycloak_cookie
+    )
+
+    prepared_request = req_choose_external_idp.prepare()
+
+    log_request(logger, req_choose_external_idp, flow_state)
+
+    response = await send(s, prepared_request, "broker.provider_choice", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    # get the HTTP binding response with the url to the external IDP
+    form = extract_form(response.content)
+
+    url_form = form.get('action')
+    inputs = form.find_all('input')
+    method_form = form.get('method')
+
+    params = {}
+    for input in inputs:
+        params[input.get('name')] = input.get('value')
+
+    header_redirect_external_idp = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=idp2_ip, port=idp2_port),
+        'Referer': "{ip}:{port}".format(ip=idp_ip, port=idp_port)
+    }
+
+    # Redirect to external IDP
+    if idp_broker == "cloudtrust_saml":
+        req_redirect_external_idp = Request(
+            method=method_form,
+            url="{url}".format(url=url_form),
+            data=params,
+            headers=header_redirect_external_idp
+        )
+    else:
+        req_redirect_external_idp = Request(
+            method=method_form,
+            url="{url}".format(url=url_form),
+            params=params,
+            headers=header_redirect_external_idp
+        )
+
+    referer_url = url_form
+
+    prepared_request = req_redirect_external_idp.prepare()
+
+    log_request(logger, req_redirect_external_idp, flow_state)
+
+    response = await send(s, prepared_request, "external.authn_request", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    # if we have an identity provider saml, we do an extra redirect
+    if idp_broker == "cloudtrust_saml":
+        redirect_url = response.headers['Location']
+        keycloak_cookie_ext = response.cookies
+        response = await redirect_to_idp(logger, s, redirect_url, header, keycloak_cookie_ext, flow_state=flow_state)
+    else:
+        keycloak_cookie_ext = response.cookies
+
+    form = extract_form(response.content)
+
+    url_form = form.get('action')
+    method_form = form.get('method')
+    inputs = form.find_all('input')
+
+    input_name = []
+    for input in inputs:
+        input_name.append(input.get('name'))
+
+    assert "username" in input_name
+    assert "password" in input_name
+
+    credentials_data = {}
+    credentials_data["username"] = idp_username
+    credentials_data["password"] = idp_password
+
+    # Authenticate to the external IDP
+    response = await send_credentials_to_idp(logger, s, header, idp2_ip, idp2_port, referer_url, url_form,
+                                             credentials_data, {**keycloak_cookie_ext}, method_form,
+                                             flow_state=flow_state)
+
+    # get the HTTP binding response with the url to the broker IDP
+    form = extract_form(response.content)
+
+    url_form = form.get('action')
+    inputs = form.find_all('input')
+    method_form = form.get('method')
+
+    token = {}
+    for input in inputs:
+        token[input.get('name')] = input.get('value')
+
+    req_token_from_external_idp = Request(
+        method=method_form,
+        url="{url}".format(url=url_form),
+        data=token,
+        cookies=keycloak_cookie,
+        headers=header
+    )
+
+    prepared_request = req_token_from_external_idp.prepare()
+
+    log_request(logger, req_token_from_external_idp, flow_state)
+
+    response = await send(s, prepared_request, "broker.token_post", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    keycloak_cookie3 = response.cookies
+
+    url_redirect = response.headers['Location']
+
+    req_idp_redirect = Request(
+        method='GET',
+        url="{url}".format(url=url_redirect),
+        headers=header_idp_page,
+        cookies={**keycloak_cookie, **keycloak_cookie3}
+    )
+
+    prepared_request = req_idp_redirect.prepare()
+
+    log_request(logger, req_idp_redirect, flow_state)
+
+    response = await send(s, prepared_request, "broker.login_redirect", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    if response.status_code == HTTPStatus.OK:
+
+        response = await broker_fill_in_form(logger, s, response, header, keycloak_cookie, response.cookies, idp_broker, idp_form_id, flow_state=flow_state)
+
+    else:
+
+        url_redirect = response.headers['Location']
+
+        req_idp_redirect = Request(
+            method='GET',
+            url="{url}".format(url=url_redirect),
+            headers=header_idp_page,
+            cookies={**keycloak_cookie, **keycloak_cookie3}
+        )
+
+        prepared_request = req_idp_redirect.prepare()
+
+        log_request(logger, req_idp_redirect, flow_state)
+
+        response = await send(s, prepared_request, "broker.account_page", allow_redirects=False, flow_state=flow_state)
+
+        logger.debug(response.status_code)
+
+    return (oath_cookie, response.cookies, response)
+
+
+async def broker_fill_in_form(logger, s, response, header, cookie, new_cookie, idp_broker, idp_form_id, flow_state=None):
+    """
+    Method that simulates the requests that need to be done when a user first logs in using a broker,
+    as he is asked to fill in a form with his email, first name and last name
+    :param logger:
+    :param s:
+    :param response:
+    :param header:
+    :param cookie:
+    :param idp_broker:
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return:
+    """
+    form = extract_form(response.content, form_id=idp_form_id)
+    url_form = form.get('action')
+    method_form = form.get('method')
+    inputs = form.find_all('input')
+
+    for input in inputs:
+        if input.get('name') == "username":
+            username = input.get('value')
+
+    user_data = {}
+    user_data["username"] = username
+    if idp_broker == "cloudtrust_saml":
+        user_data["email"] = "test_email_saml@test.com"
+        user_data["firstName"] = "Mr."
+        user_data["lastName"] = "Test"
+    else:
+        user_data["email"] = "test_email_wsfed@test.com"
+        user_data["firstName"] = "Mr."
+        user_data["lastName"] = "Test"
+
+    req_send_user_data = Request(
+        method=method_form,
+        url="{url}".format(url=url_form),
+        data=user_data,
+        cookies={**cookie, **new_cookie},
+        headers=header
+    )
+    prepared_request = req_send_user_data.prepare()
+
+    log_request(logger, req_send_user_data, flow_state)
+
+    response = await send(s, prepared_request, "broker.profile_post", allow_redirects=False, flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    redirect_url = response.headers['Location']
+    response = await redirect_to_idp(logger, s, redirect_url, header, {**cookie, **new_cookie}, flow_state=flow_state)
+
+    return response
+
+
+async def request_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id, flow_state=None):
+    """
+    Helper dedicated to send a request to the token endpoint of Keycloak
+    :param logger:
+    :param s: session s
+    :param data: payload of the request, e.g. a password or a refresh_token grant
+    :param idp_scheme: identity provider http scheme
+    :param idp_port: identity provider port
+    :param idp_ip: identity provider ip
+    :param realm_id: id of the realm
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return: response, whose JSON holds the tokens and their lifetimes
+    """
+    req_get_access_token = Request(
+        method='POST',
+        url="{scheme}://{ip}:{port}/auth/realms/{realm}/protocol/openid-connect/token".format(
+            scheme=idp_scheme,
+            ip=idp_ip,
+            port=idp_port,
+            realm=realm_id
+        ),
+        data=data
+    )
+
+    prepared_request = req_get_access_token.prepare()
+
+    log_request(logger, req_get_access_token, flow_state)
+
+    response = await send(s, prepared_request, "admin.token", flow_state=flow_state)
+
+    logger.debug(response.status_code)
+
+    return response
+
+
+async def get_access_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id, flow_state=None):
+    """
+    Helper dedicated to obtain the access token for Keycloak
+    :param logger:
+    :param s: session s
+    :param data: payload of the request
+    :param idp_scheme: identity provider http scheme
+    :param idp_port: identity provider port
+    :param idp_ip: identity provider ip
+    :param realm_id: id of the realm
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return:
+    """
+    response = await request_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id, flow_state=flow_state)
+
+    access_token = json.loads(response.text)['access_token']
+
+    return access_token
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Record and replay of the HTTP exchanges of a run, to benchmark the harness (parsing of the pages, logging,
+# cookies...) without Keycloak nor SPs. The adapter of the shared transport records every request and its
+# response, redirects included, to a cassette: a gzip file of JSON lines. In replay, the responses are served
+# from the cassette, with their headers (Set-Cookie, Location) intact, to the requests with the same method,
+# URL and body. The responses of a request sent more often than recorded are served again from the first one.
+
+import io
+import gzip
+import json
+import base64
+import hashlib
+import threading
+
+from http.client import HTTPMessage
+
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.exceptions import ConnectionError
+from urllib3 import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+
+RECORD = "record"
+REPLAY = "replay"
+
+CASSETTE_VERSION = 1
+
+# headers of the raw response that do not describe the recorded content, which is already decoded
+_SKIPPED_HEADERS = {"content-encoding", "transfer-encoding", "content-length"}
+
+
+class CassetteMiss(ConnectionError):
+    """
+    Raised in replay for a request that was not recorded
+    """
+    pass
+
+
+def _body_hash(body):
+    if body is None:
+        return None
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    elif not isinstance(body, bytes):
+        # e.g. a file or a generator, not recorded
+        return None
+    return hashlib.sha256(body).hexdigest()
+
+
+class Cassette():
+    """
+    Recorded exchanges, indexed by method, URL and hash of the body of their request
+    """
+
+    def __init__(self, path, mode=REPLAY):
+        """
+        :param path: path of the cassette file
+        :param mode: record or replay; in replay, the cassette is loaded from the file
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError("Unknown cassette mode {mode}".format(mode=mode))
+        self.path = path
+        self.mode = mode
+
+        self._lock = threading.Lock()
+        self._interactions = []
+        self._index = {}
+        self._served = {}
+        self.stats = {"recorded": 0, "replayed": 0, "missed": 0}
+
+        if mode == REPLAY:
+            self.load()
+
+    @staticmethod
+    def key(method, url, body_hash):
+        return method.upper(), url, body_hash
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError("Unsupported cassette version {v}".format(v=header.get("version")))
+            for line in f:
+                self._add(json.loads(line))
+
+    def save(self):
+        with self._lock:
+            interactions = list(self._interactions)
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"version": CASSETTE_VERSION}) + "\n")
+            for interaction in interactions:
+                f.write(json.dumps(interaction, separators=(',', ':')) + "\n")
+
+    def _add(self, interaction):
+        self._interactions.append(interaction)
+        key = self.key(interaction["method"], interaction["url"], interaction["body"])
+        self._index.setdefault(key, []).append(interaction)
+        # the requests whose body is not matched, e.g. a file, fall back to method and URL
+        self._index.setdefault(self.key(interaction["method"], interaction["url"], "*"), []).append(interaction)
+
+    def record(self, request, response):
+        """
+        :param request: prepared request, as sent
+        :param response: its response, whose content is read
+        """
+        content = response.content or b""
+        try:
+            body = {"text": content.decode('utf-8')}
+        except UnicodeDecodeError:
+            body = {"base64": base64.b64encode(content).decode('ascii')}
+
+        headers = [[name, value] for name, value in response.raw.headers.items()
+                   if name.lower() not in _SKIPPED_HEADERS] if response.raw is not None else \
+            [[name, value] for name, value in response.headers.items() if name.lower() not in _SKIPPED_HEADERS]
+
+        interaction = {
+            "method": request.method,
+            "url": request.url,
+            "body": _body_hash(request.body),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": headers,
+            **body
+        }
+        with self._lock:
+            self._add(interaction)
+            self.stats["recorded"] += 1
+
+    def play(self, request):
+        """
+        :param request: prepared request
+        :return: recorded interaction of the request
+        :raise CassetteMiss: if no exchange with the method, URL and body of the request was recorded
+        """
+        body_hash = _body_hash(request.body)
+        key = self.key(request.method, request.url, body_hash if body_hash is not None or request.body is None
+                       else "*")
+        with self._lock:
+            interactions = self._index.get(key)
+            if not interactions:
+                self.stats["missed"] += 1
+                raise CassetteMiss("{method} {url} not recorded in {path}".format(
+                    method=request.method, url=request.url, path=self.path), request=request)
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            self.stats["replayed"] += 1
+        return interactions[served % len(interactions)]
+
+    def __len__(self):
+        return len(self._interactions)
+
+
+class RecordingAdapter(BaseAdapter):
+    """
+    Adapter that sends the requests with another adapter and records them in a cassette
+    """
+
+    def __init__(self, adapter, cassette):
+        super().__init__()
+        self.adapter = adapter
+        self.cassette = cassette
+
+    def send(self, request, *args, **kwargs):
+        response = self.adapter.send(request, *args, **kwargs)
+        self.cassette.record(request, response)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class _OriginalResponse():
+    """
+    Stand-in of the http.client response that requests reads the cookies from
+    """
+
+    def __init__(self, headers):
+        self.msg = HTTPMessage()
+        for name, value in headers:
+            self.msg[name] = value
+
+    def isclosed(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    Adapter that serves the responses of a cassette, built like the responses of the network
+    """
+
+    def __init__(self, cassette, stats=None):
+        """
+        :param cassette: cassette in replay mode
+        :param stats: optional TransportStats, whose requests are counted
+        """
+        super().__init__(pool_connections=1, pool_maxsize=1)
+        self.cassette = cassette
+        self.stats = stats
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        interaction = self.cassette.play(request)
+
+        if "text" in interaction:
+            content = interaction["text"].encode('utf-8')
+        else:
+            content = base64.b64decode(interaction["base64"])
+
+        headers = HTTPHeaderDict()
+        for name, value in interaction["headers"]:
+            headers.add(name, value)
+        headers["Content-Length"] = str(len(content))
+
+        raw = HTTPResponse(
+            body=io.BytesIO(content),
+            headers=headers,
+            status=interaction["status"],
+            reason=interaction["reason"],
+            preload_content=False,
+            decode_content=False,
+            original_response=_OriginalResponse(interaction["headers"]),
+            request_method=request.method
+        )
+
+        response = self.build_response(request, raw)
+        if self.stats is not None:
+            self.stats.count_request(response.url.split("/")[2])
+        return response
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Load run split across worker processes, so that the TLS handshakes and the parsing of the pages are
+# not bound to a single core. Every worker runs its share of the virtual users (or of the arrival rate)
+# with its share of the credentials, and sends the snapshot of its histograms and counters to the
+# coordinator at a regular interval; the coordinator merges them into a live view and the final report.
+# With a results file, every worker streams its requests to its own file, <path>.<worker>, see helpers.results.
+
+import math
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+
+import helpers.metrics as metrics
+from helpers.metrics import Histogram
+from helpers.results import ResultsWriter, set_results_writer
+
+logger = logging.getLogger('acceptance-tool.helpers.coordinator')
+
+# kinds of runners a worker can run
+THREADS = "threads"
+ASYNC = "async"
+RATE = "rate"
+
+
+def split(total, parts):
+    """
+    Split an integer as evenly as possible
+    :return: list of the parts
+    """
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def _new_runner(kind, settings, options, credentials, flow_logger):
+    # imported here so that the workers only build the runner they run
+    from helpers.load import LoadRunner, AsyncLoadRunner
+    from helpers.scheduler import ArrivalScheduler
+
+    if kind == RATE:
+        return ArrivalScheduler(settings, flow_logger=flow_logger, credentials=credentials, **options)
+    runner_class = AsyncLoadRunner if kind == ASYNC else LoadRunner
+    return runner_class(settings, flow_logger=flow_logger, credentials=credentials, **options)
+
+
+def _snapshot(runner):
+    completed, failed = runner.progress()
+    return {
+        "flows": completed,
+        "errors": failed,
+        "histograms": [[flow, hop, histogram.to_json()]
+                       for (flow, hop), histogram in metrics.get_recorder().snapshot().items()]
+    }
+
+
+def results_path(path, index):
+    """
+    :param path: path of the results file of the run
+    :param index: index of the worker
+    :return: path of the results file of the worker
+    """
+    return "{path}.{index}".format(path=path, index=index)
+
+
+def _worker(index, kind, settings, options, credentials, results, interval, log_level, results_file=None):
+    """
+    Entry point of a worker process: run the runner in a thread and report its progress every interval
+    """
+    flow_logger = logging.getLogger('acceptance-tool.helpers.coordinator.flow')
+    flow_logger.setLevel(log_level)
+
+    writer = None
+    try:
+        if results_file:
+            writer = ResultsWriter(results_path(results_file, index))
+            set_results_writer(writer)
+
+        runner = _new_runner(kind, settings, options, credentials, flow_logger)
+
+        reports = []
+        thread = threading.Thread(target=lambda: reports.append(runner.run()), daemon=True)
+        thread.start()
+        while thread.is_alive():
+            thread.join(interval)
+            results.put(("progress", index, _snapshot(runner)))
+
+        if not reports:
+            raise RuntimeError("the runner stopped without report")
+
+        final = _snapshot(runner)
+        final["report"] = {key: value for key, value in reports[0].items() if key not in ("hops", "latency")}
+        results.put(("done", index, final))
+    except Exception as e:
+        results.put(("failed", index, "{type}: {e}".format(type=type(e).__name__, e=e)))
+    finally:
+        if writer is not None:
+            set_results_writer(None)
+            writer.close()
+
+
+def merge_snapshots(snapshots):
+    """
+    Merge the snapshots of several workers into a single one, e.g. to send it further
+    """
+    snapshots = list(snapshots)
+    return {
+        "flows": sum(snapshot["flows"] for snapshot in snapshots),
+        "errors": sum(snapshot["errors"] for snapshot in snapshots),
+        "histograms": [[flow, hop, histogram.to_json()]
+                       for (flow, hop), histogram in merge_histograms(snapshots).items()]
+    }
+
+
+def merge_histograms(snapshots):
+    """
+    :param snapshots: snapshots sent by the workers
+    :return: dict of (flow, hop) to the merged Histogram
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for flow, hop, data in snapshot["histograms"]:
+            histogram = Histogram.from_json(data)
+            if (flow, hop) in merged:
+                merged[(flow, hop)].merge(histogram)
+            else:
+                merged[(flow, hop)] = histogram
+    return merged
+
+
+class Coordinator():
+    """
+    Run a load test with one worker process per core and merge their metrics
+    """
+
+    def __init__(self, settings, kind=THREADS, options=None, credentials=None, processes=None, interval=5,
+                 log_level=logging.WARNING, results=None):
+        """
+        :param settings: settings of the IDP and SP, as loaded from the config file
+        :param kind: threads or async virtual users, or rate for an arrival rate
+        :param options: arguments of LoadRunner (standard, sp_index, users, ramp_up, duration) or of
+        ArrivalScheduler (standard, sp_index, rate, duration, arrivals, max_in_flight, seed)
+        :param credentials: list of {"username", "password"}, split between the workers
+        :param processes: number of worker processes, by default the number of cores
+        :param interval: seconds between two snapshots of the workers and two lines of the live view
+        :param log_level: level of the logger of the flows in the workers
+        :param results: optional path of the results file of the run, written by every worker to <path>.<worker>
+        """
+        self.settings = settings
+        self.kind = kind
+        self.options = dict(options or {})
+        self.credentials = credentials
+        self.processes = processes or multiprocessing.cpu_count()
+        self.interval = interval
+        self.log_level = log_level
+        self.results = results
+        self.snapshots = []
+
+        standard = self.options.get("standard", "SAML")
+        client = "sps_saml" if standard == "SAML" else "sps_wsfed"
+        sp = settings[client][self.options.get("sp_index", 0)]
+        self.flow = "{protocol}.{sp}".format(protocol=standard.lower(), sp=sp["name"])
+
+        if self.credentials and len(self.credentials) < self.processes:
+            raise ValueError("{n} credentials cannot be split between {p} workers".format(
+                n=len(self.credentials), p=self.processes))
+
+    def _worker_options(self):
+        """
+        Options of every worker: the virtual users, or the arrival rate and the flows in flight, are split
+        """
+        n = self.processes
+        workers = [dict(self.options) for _ in range(n)]
+        if self.kind == RATE:
+            max_in_flight = self.options.get("max_in_flight", 100)
+            seed = self.options.get("seed")
+            for i, options in enumerate(workers):
+                options["rate"] = self.options.get("rate", 10) / n
+                options["max_in_flight"] = max(1, math.ceil(max_in_flight / n))
+                if seed is not None:
+                    options["seed"] = seed + i
+        else:
+            for options, users in zip(workers, split(self.options.get("users", 10), n)):
+                options["users"] = users
+        return workers
+
+    def run(self, on_progress=None):
+        """
+        Start the workers, log the merged live view until they are all done and build the report
+        :param on_progress: optional function called with the merged snapshot of the workers at every live view
+        :return: report of the run
+        """
+        results = multiprocessing.Queue()
+
+        workers = []
+        for i, options in enumerate(self._worker_options()):
+            credentials = self.credentials[i::self.processes] if self.credentials else None
+            process = multiprocessing.Process(
+                target=_worker,
+                args=(i, self.kind, self.settings, options, credentials, results, self.interval, self.log_level,
+                      self.results),
+                name="load-worker-{i}".format(i=i),
+                daemon=True
+            )
+            workers.append(process)
+
+        start = time.monotonic()
+        for process in workers:
+            process.start()
+
+        latest = {}
+        done = {}
+        failed = {}
+        last_seen = [start] * len(workers)
+        next_view = start + self.interval
+        while len(done) + len(failed) < len(workers):
+            try:
+                kind, index, payload = results.get(timeout=self.interval)
+                last_seen[index] = time.monotonic()
+            except queue.Empty:
+                kind = None
+
+            # a worker killed before its last message, e.g. by the OOM killer
+            for i, process in enumerate(workers):
+                if (i not in done and i not in failed and not process.is_alive() and
+                        time.monotonic() - last_seen[i] > 2 * self.interval):
+                    failed[i] = "exited with code {code}".format(code=process.exitcode)
+
+            if kind == "progress":
+                latest[index] = payload
+            elif kind == "done":
+                latest[index] = done[index] = payload
+            elif kind == "failed":
+                failed[index] = payload
+
+            if time.monotonic() >= next_view:
+                logger.info(self.live_view(latest.values(), time.monotonic() - start))
+                if on_progress is not None:
+                    on_progress(merge_snapshots(latest.values()))
+                next_view += self.interval
+
+        elapsed = time.monotonic() - start
+
+        for process in workers:
+            process.join()
+
+        for index, error in sorted(failed.items()):
+            logger.error("worker {i} failed: {e}".format(i=index, e=error))
+
+        self.snapshots = list(done.values())
+
+        return self.report(self.snapshots, elapsed)
+
+    def live_view(self, snapshots, elapsed):
+        """
+        One line summary of the merged snapshots of the workers
+        """
+        snapshots = list(snapshots)
+        flows = sum(snapshot["flows"] for snapshot in snapshots)
+        errors = sum(snapshot["errors"] for snapshot in snapshots)
+        line = "{elapsed:.0f}s: {flows} flows, {errors} errors, {fps:.2f} flows/s".format(
+            elapsed=elapsed, flows=flows, errors=errors, fps=flows / elapsed if elapsed else 0
+        )
+        histogram = merge_histograms(snapshots).get((self.flow, "flow"))
+        if histogram is not None and histogram.total:
+            line += ", flow " + ", ".join("p{p} {v:.1f}ms".format(p=p, v=histogram.percentile(p) * 1000)
+                                          for p in metrics.PERCENTILES)
+        return line
+
+    def report(self, snapshots, elapsed):
+        reports = [snapshot["report"] for snapshot in snapshots]
+        hops = metrics.summarize(merge_histograms(snapshots)).get(self.flow, {})
+        completed = sum(snapshot["flows"] for snapshot in snapshots)
+
+        connections = {}
+        for worker_report in reports:
+            for host, stats in worker_report["connections"].items():
+                merged = connections.setdefault(host, {"requests": 0, "new_connections": 0, "reused_connections": 0})
+                for key in merged:
+                    merged[key] += stats[key]
+
+        report = {
+            "standard": self.options.get("standard", "SAML"),
+            "sp": self.flow.partition(".")[2],
+            "processes": self.processes,
+            "workers_done": len(snapshots),
+            "duration": self.options.get("duration", 60),
+            "elapsed": elapsed,
+            "flows": completed,
+            "errors": sum(snapshot["errors"] for snapshot in snapshots),
+            "flows_per_second": completed / elapsed if elapsed else 0,
+            "connections": connections,
+            "hops": hops
+        }
+
+        if self.kind == RATE:
+            from helpers.scheduler import FLOW_CORRECTED, FLOW_UNCORRECTED
+            report.update({
+                "rate": self.options.get("rate", 10),
+                "arrivals": self.options.get("arrivals", "poisson"),
+                "max_in_flight": self.options.get("max_in_flight", 100),
+                "issued": sum(worker_report["issued"] for worker_report in reports),
+                "late_dispatches": sum(worker_report["late_dispatches"] for worker_report in reports),
+                "latency": {
+                    "corrected": hops.get(FLOW_CORRECTED),
+                    "uncorrected": hops.get(FLOW_UNCORRECTED)
+                }
+            })
+        else:
+            report.update({
+                "users": self.options.get("users", 10),
+                "ramp_up": self.options.get("ramp_up", 0)
+            })
+
+        return report
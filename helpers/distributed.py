@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Load run spread over several hosts. An agent runs on every load host and waits for a controller;
+# the controller splits the run between the agents like the coordinator splits it between its workers.
+# The messages are JSON objects, one per line, over TCP:
+#
+#     agent -> controller    {"type": "challenge", "nonce"}
+#     controller -> agent    {"type": "configure", "settings", "kind", "options", "credentials", "processes",
+#                             "results", "agent", "auth"}
+#     agent -> controller    {"type": "ready", "processes"}
+#     controller -> agent    {"type": "start", "at"}        all the agents start at the same epoch time
+#     agent -> controller    {"type": "progress", "flows", "errors", "histograms"}     every interval
+#     agent -> controller    {"type": "done", "flows", "errors", "histograms", "report"} or {"type": "failed", "error"}
+#
+# The agents start in lockstep only if the clocks of the load hosts are synchronized, e.g. with NTP.
+# An agent only runs the configure message of a controller that shares its token: "auth" is the HMAC-SHA256, keyed
+# with the token, of the nonce of the challenge and of the rest of the message. The messages are not encrypted.
+# The results files of an agent are written to its own --results-dir, never to a path sent by the controller.
+
+import os
+import sys
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import secrets
+import argparse
+
+from helpers.coordinator import Coordinator, merge_snapshots, THREADS
+
+logging.basicConfig(
+    format='%(asctime)s %(name)s %(levelname)s %(message)s',
+    datefmt='%m/%d/%Y %I:%M:%S %p'
+)
+logger = logging.getLogger('acceptance-tool.helpers.distributed')
+logger.setLevel(logging.INFO)
+
+version = "1.0"
+prog_name = sys.argv[0]
+usage = """{pn} [options]
+Load agent: wait for a controller (helpers.load --agents) and run its share of the load
+""".format(
+    pn=prog_name
+)
+parser = argparse.ArgumentParser(prog="{pn} {v}".format(pn=prog_name, v=version), usage=usage)
+
+parser.add_argument('--listen', dest="listen", default="127.0.0.1:7000",
+                    help='Address and port the agent listens on, e.g. 0.0.0.0:7000')
+parser.add_argument('--processes', dest="processes", type=int,
+                    help='Number of worker processes of the agent, by default the number given by the controller')
+parser.add_argument('--token-file', dest="token_file", required=True,
+                    help='File of the token shared with the controllers (helpers.load --agent-token-file)')
+parser.add_argument('--results-dir', dest="results_dir",
+                    help='Directory of the results files of the runs asked with --results, results.<agent>.<worker>')
+
+# the settings and the histograms are sent in a single line
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+
+def parse_address(address, default_port=7000):
+    """
+    :param address: host:port or host
+    :return: host and port
+    """
+    host, _, port = address.rpartition(":")
+    if not host:
+        return port, default_port
+    return host, int(port)
+
+
+def read_token(path):
+    """
+    :param path: file of the token shared by the controller and the agents
+    :return: token, as bytes
+    """
+    with open(path, "rb") as f:
+        token = f.read().strip()
+    if not token:
+        raise ValueError("{path} has no token".format(path=path))
+    return token
+
+
+def sign(token, nonce, message):
+    """
+    :param token: shared token, bytes
+    :param nonce: nonce of the challenge of the agent
+    :param message: message without its "auth" field
+    :return: HMAC-SHA256 of the nonce and of the message
+    """
+    data = nonce.encode('utf-8') + json.dumps(message, sort_keys=True).encode('utf-8')
+    return hmac.new(token, data, hashlib.sha256).hexdigest()
+
+
+async def send_message(writer, message):
+    writer.write(json.dumps(message).encode('utf-8') + b"\n")
+    await writer.drain()
+
+
+async def read_message(reader, expected=None):
+    """
+    :param expected: type of the message, checked if given
+    :return: next message
+    """
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed by the peer")
+    message = json.loads(line.decode('utf-8'))
+    if message.get("type") == "failed":
+        raise RuntimeError("peer failed: {error}".format(error=message.get("error")))
+    if expected is not None and message.get("type") != expected:
+        raise ValueError("expected a {e} message, received {t}".format(e=expected, t=message.get("type")))
+    return message
+
+
+class Agent():
+    """
+    Run the share of a load run pushed by a controller with a local Coordinator, one run at a time
+    """
+
+    def __init__(self, token, host="127.0.0.1", port=7000, processes=None, results_dir=None):
+        """
+        :param token: token shared with the controllers, bytes
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any free port
+        :param processes: number of worker processes, by default the number given by the controller
+        :param results_dir: directory of the results files, runs asking for results fail without it
+        """
+        self.token = token
+        self.host = host
+        self.port = port
+        self.processes = processes
+        self.results_dir = results_dir
+        self._busy = None
+
+    async def start(self):
+        """
+        Listen for the controllers
+        :return: asyncio server; the port is updated if it was 0
+        """
+        self._busy = asyncio.Lock()
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_MESSAGE_SIZE)
+        self.port = server.sockets[0].getsockname()[1]
+        logger.info("agent listening on {host}:{port}".format(host=self.host, port=self.port))
+        return server
+
+    def serve_forever(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.start())
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _configure(self, reader, writer, peer):
+        """
+        Challenge the controller and check the configure message it signed with the token
+        :return: configure message
+        """
+        nonce = secrets.token_hex(16)
+        await send_message(writer, {"type": "challenge", "nonce": nonce})
+
+        message = await read_message(reader, "configure")
+        auth = message.pop("auth", None)
+        if not isinstance(auth, str) or not hmac.compare_digest(auth, sign(self.token, nonce, message)):
+            logger.warning("configure message of {peer} refused".format(peer=peer))
+            raise PermissionError("the controller does not have the token of the agent")
+        return message
+
+    def _results_path(self, message):
+        if not message.get("results"):
+            return None
+        if self.results_dir is None:
+            raise ValueError("the agent has no --results-dir")
+        return os.path.join(self.results_dir, "results.{agent}".format(agent=int(message.get("agent", 0))))
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_event_loop()
+        sending = asyncio.Lock()
+
+        async def send(message):
+            async with sending:
+                await send_message(writer, message)
+
+        try:
+            if self._busy.locked():
+                raise RuntimeError("the agent is already running a load")
+
+            async with self._busy:
+                message = await self._configure(reader, writer, writer.get_extra_info('peername'))
+                coordinator = Coordinator(
+                    message["settings"],
+                    message.get("kind", THREADS),
+                    message.get("options"),
+                    message.get("credentials"),
+                    self.processes or message.get("processes"),
+                    message.get("interval", 5),
+                    message.get("log_level", logging.WARNING),
+                    self._results_path(message)
+                )
+                await send({"type": "ready", "processes": coordinator.processes})
+
+                message = await read_message(reader, "start")
+                delay = message["at"] - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                logger.info("starting {p} worker processes".format(p=coordinator.processes))
+
+                def on_progress(snapshot):
+                    asyncio.run_coroutine_threadsafe(send({"type": "progress", **snapshot}), loop)
+
+                report = await loop.run_in_executor(None, coordinator.run, on_progress)
+
+                final = merge_snapshots(coordinator.snapshots)
+                final["report"] = {key: value for key, value in report.items() if key not in ("hops", "latency")}
+                await send({"type": "done", **final})
+                logger.info("{flows} flows, {errors} errors".format(flows=final["flows"], errors=final["errors"]))
+        except Exception as e:
+            logger.error("run failed: {e}".format(e=e))
+            try:
+                await send({"type": "failed", "error": "{type}: {e}".format(type=type(e).__name__, e=e)})
+            except Exception:
+                pass
+        finally:
+            writer.close()
+
+
+class Controller(Coordinator):
+    """
+    Coordinator whose workers are remote agents: the run is split between the agents, started
+    at the same time on all of them, and their streamed histograms are merged
+    """
+
+    def __init__(self, settings, agents, token, kind=THREADS, options=None, credentials=None, agent_processes=None,
+                 interval=5, start_delay=2, log_level=logging.WARNING, results=False):
+        """
+        :param settings: settings of the IDP and SP, as loaded from the config file
+        :param agents: list of host:port of the agents
+        :param token: token shared with the agents, bytes
+        :param kind: threads or async virtual users, or rate for an arrival rate
+        :param options: options of the runners, see Coordinator
+        :param credentials: list of {"username", "password"}, split between the agents
+        :param agent_processes: number of worker processes of every agent, by default one per core of the agent
+        :param interval: seconds between two progress messages of the agents and two lines of the live view
+        :param start_delay: seconds between the start message and the start of the agents
+        :param log_level: level of the logger of the flows in the agents
+        :param results: whether every worker of every agent writes its requests, on the host of the agent, to
+        results.<agent>.<worker> in the --results-dir of the agent
+        """
+        super().__init__(settings, kind, options, credentials, len(agents), interval, log_level, results)
+        self.agents = [parse_address(agent) for agent in agents]
+        self.token = token
+        self.agent_processes = agent_processes
+        self.start_delay = start_delay
+
+    def run(self, on_progress=None):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.run_async(on_progress))
+        finally:
+            loop.close()
+
+    async def run_async(self, on_progress=None):
+        connections = await asyncio.gather(*[
+            asyncio.open_connection(host, port, limit=MAX_MESSAGE_SIZE) for host, port in self.agents
+        ])
+
+        try:
+            challenges = await asyncio.gather(*[read_message(reader, "challenge") for reader, _ in connections])
+            for i, (options, (_, writer)) in enumerate(zip(self._worker_options(), connections)):
+                message = {
+                    "type": "configure",
+                    "settings": self.settings,
+                    "kind": self.kind,
+                    "options": options,
+                    "credentials": self.credentials[i::self.processes] if self.credentials else None,
+                    "processes": self.agent_processes,
+                    "interval": self.interval,
+                    "log_level": self.log_level,
+                    "results": bool(self.results),
+                    "agent": i
+                }
+                message["auth"] = sign(self.token, challenges[i]["nonce"], message)
+                await send_message(writer, message)
+
+            readies = await asyncio.gather(*[read_message(reader, "ready") for reader, _ in connections])
+            logger.info("{a} agents ready with {p} worker processes".format(
+                a=len(readies), p=sum(ready["processes"] for ready in readies)))
+
+            at = time.time() + self.start_delay
+            for _, writer in connections:
+                await send_message(writer, {"type": "start", "at": at})
+            start = time.monotonic() + self.start_delay
+
+            latest = {}
+            done = {}
+            failed = {}
+
+            async def receive(index, reader):
+                try:
+                    while True:
+                        message = await read_message(reader)
+                        if message["type"] == "progress":
+                            latest[index] = message
+                        elif message["type"] == "done":
+                            latest[index] = done[index] = message
+                            return
+                except Exception as e:
+                    failed[index] = str(e)
+
+            receivers = asyncio.gather(*[receive(i, reader) for i, (reader, _) in enumerate(connections)])
+            while not receivers.done():
+                await asyncio.wait([receivers], timeout=self.interval)
+                if time.monotonic() > start and not receivers.done():
+                    logger.info(self.live_view(latest.values(), time.monotonic() - start))
+                    if on_progress is not None:
+                        on_progress(merge_snapshots(latest.values()))
+
+            elapsed = time.monotonic() - start
+        finally:
+            for _, writer in connections:
+                writer.close()
+
+        for index, error in sorted(failed.items()):
+            host, port = self.agents[index]
+            logger.error("agent {host}:{port} failed: {e}".format(host=host, port=port, e=error))
+
+        self.snapshots = list(done.values())
+
+        report = self.report(self.snapshots, elapsed)
+        report["agents"] = ["{host}:{port}".format(host=host, port=port) for host, port in self.agents]
+        return report
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    host, port = parse_address(args.listen)
+
+    if args.results_dir:
+        os.makedirs(args.results_dir, exist_ok=True)
+
+    Agent(read_token(args.token_file), host, port, args.processes, args.results_dir).serve_forever()
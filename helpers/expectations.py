@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Checks of the pages returned by the IDPs and SPs against the messages of the config file (logged_in_message,
+# logged_out_message, not_authorized_message). The messages are compiled once, as regular expressions over bytes,
+# and searched in the raw body of the responses, which is never decoded to text:
+#
+#     assert expect(response, sp["logged_in_message"])
+#
+# Several messages are searched in a single pass, by one alternation of all of them that stops as soon as every
+# message was seen.
+#
+# The tests used to search the messages with re.search in response.text, the body decoded with the charset of the
+# response. The messages are now encoded to UTF-8 and searched in the bytes, which finds the same ASCII messages in
+# the pages in UTF-8, ASCII or ISO-8859-1, e.g. the pages of Keycloak, but:
+# - a message with non-ASCII characters is only found in the pages in UTF-8;
+# - \w, \s, \b and re.IGNORECASE only know the ASCII characters, and . matches one byte, not one character;
+# - the pages in UTF-16 or UTF-32 are not supported.
+#
+# The claims are not checked with patterns: the tests look up their names (attr_name, external_attr_name) in the
+# attributes of the token parsed once by helpers.saml.
+
+import re
+import threading
+
+# keys of the messages of the IDP and SP sections of the config file
+MESSAGES = ("logged_in_message", "logged_out_message", "not_authorized_message")
+
+
+class ResponseMatcher():
+    """
+    Cache of the compiled patterns, alone and combined, searched in the bodies of the responses
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._patterns = {}
+        self._combined = {}
+
+    def compile(self, *patterns):
+        """
+        :param patterns: regular expressions, as str
+        :return: compiled patterns over bytes
+        """
+        compiled = []
+        for pattern in patterns:
+            regex = self._patterns.get(pattern)
+            if regex is None:
+                regex = re.compile(pattern.encode('utf-8'))
+                with self._lock:
+                    self._patterns[pattern] = regex
+            compiled.append(regex)
+        return compiled
+
+    def _combine(self, patterns):
+        combined = self._combined.get(patterns)
+        if combined is None:
+            # every pattern is a named group of the alternation; a pattern with back references cannot be combined
+            try:
+                combined = re.compile(b"|".join(b"(?P<p%d>%s)" % (i, pattern.encode('utf-8'))
+                                                for i, pattern in enumerate(patterns)))
+            except re.error:
+                combined = False
+            with self._lock:
+                self._combined[patterns] = combined
+        return combined
+
+    def missing(self, content, patterns):
+        """
+        :param content: body of a response, as bytes
+        :param patterns: regular expressions, as str
+        :return: list of the patterns not found in content
+        """
+        patterns = tuple(dict.fromkeys(patterns))
+        if len(patterns) == 1:
+            return [] if self.compile(patterns[0])[0].search(content) else list(patterns)
+
+        found = set()
+        combined = self._combine(patterns)
+        if combined:
+            groups = {"p{i}".format(i=i): pattern for i, pattern in enumerate(patterns)}
+            for match in combined.finditer(content):
+                found.update(groups[name] for name, value in match.groupdict().items()
+                             if value is not None and name in groups)
+                if len(found) == len(patterns):
+                    return []
+
+        # the alternation does not report a pattern that only matches within the match of another one
+        return [pattern for pattern, regex in zip(patterns, self.compile(*patterns))
+                if pattern not in found and regex.search(content) is None]
+
+
+_matcher = ResponseMatcher()
+
+
+def get_matcher():
+    """
+    :return: the matcher used by expect
+    """
+    return _matcher
+
+
+def compile_expectations(settings):
+    """
+    Compile the messages of the IDPs and SPs of the settings, once for the run
+    :param settings: settings of the IDP and SP, as loaded from the config file
+    """
+    sections = [settings.get("idp", {}), settings.get("idp_external", {})]
+    sections += settings.get("sps_saml", []) + settings.get("sps_wsfed", [])
+    _matcher.compile(*{section[key] for section in sections for key in MESSAGES if section.get(key)})
+
+
+def expect(response, *patterns):
+    """
+    :param response: response of a helper, i.e. with its body in response.content
+    :param patterns: regular expressions, e.g. the messages of the config file, that the body has to contain
+    :return: True if all the patterns are found in the body of the response
+    """
+    return not _matcher.missing(response.content, patterns)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+import time
+import threading
+
+import helpers.metrics as metrics
+import helpers.requests as req
+import helpers.async_requests as async_req
+from helpers.expectations import expect
+from helpers.forms import extract_form
+
+from http import HTTPStatus
+
+
+class FlowError(Exception):
+    """
+    Raised when a hop of a SSO flow does not answer as the acceptance tests expect
+    """
+    pass
+
+
+class FailureLog():
+    """
+    Log of the failed flows of a load run: the first failures are logged at WARNING level, so that a run that
+    only fails says why, the next ones at DEBUG level
+    """
+
+    def __init__(self, logger, limit=10):
+        """
+        :param logger: logger of the runner
+        :param limit: number of failures logged at WARNING level
+        """
+        self.logger = logger
+        self.limit = limit
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def log(self, name, error):
+        """
+        :param name: name of the virtual user or of the flow that failed
+        :param error: exception raised by the flow
+        """
+        with self._lock:
+            self.count += 1
+            count = self.count
+
+        message = "{name}: flow failed: {type}: {e}".format(name=name, type=type(error).__name__, e=error)
+        if count <= self.limit:
+            self.logger.warning(message)
+            if count == self.limit:
+                self.logger.warning("the next flow failures are logged at DEBUG level")
+        else:
+            self.logger.debug(message)
+
+
+def _expect(response, *status_codes):
+    if response.status_code not in status_codes:
+        raise FlowError("Unexpected status code {code} for {url}".format(code=response.status_code, url=response.url))
+
+
+def sp_initiated_login(logger, s, header, standard, sp, idp, username, password, verifier=None):
+    """
+    Helper dedicated to perform a complete SP-initiated login, the same way the login_sso_form fixture does:
+    access to the SP, redirect to the IDP, post of the credentials and access to the SP with the token.
+    :param logger:
+    :param s: session s
+    :param header: header used for the requests
+    :param standard: connection protocol, SAML or WSFED
+    :param sp: service provider settings, i.e. an entry of settings["sps_saml"] or settings["sps_wsfed"]
+    :param idp: identity provider settings, i.e. settings["idp"]
+    :param username: username
+    :param password: password
+    :param verifier: optional SignatureVerifier of the tokens, see helpers.signatures
+    :return: the response of the SP once logged in
+    """
+    sp_ip = sp["ip"]
+    sp_port = sp["port"]
+    sp_scheme = sp["http_scheme"]
+    sp_path = sp["path"]
+
+    idp_ip = idp["ip"]
+    idp_port = idp["port"]
+    idp_scheme = idp["http_scheme"]
+
+    if standard == "SAML":
+        (session_cookie, response) = req.access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path,
+                                                         idp_ip, idp_port)
+    elif standard == "WSFED":
+        response = req.access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path)
+        session_cookie = response.cookies
+    else:
+        raise ValueError("Unknown standard {standard}".format(standard=standard))
+
+    _expect(response, HTTPStatus.FOUND)
+
+    keycloak_cookie = response.cookies
+
+    redirect_url = response.headers['Location']
+
+    header_redirect_idp = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=idp_ip, port=idp_port),
+        'Referer': "{ip}:{port}".format(ip=sp_ip, port=sp_port)
+    }
+
+    response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie)
+
+    _expect(response, HTTPStatus.OK)
+
+    # with WSFED the keycloak cookie is only set by the IDP on the redirect
+    if standard == "WSFED":
+        keycloak_cookie = response.cookies
+
+    form = extract_form(response.content, form_id=idp["login_form_id"])
+
+    if form is None:
+        raise FlowError("No login form found at {url}".format(url=response.url))
+
+    url_form = form.get('action')
+    method_form = form.get('method')
+
+    credentials_data = {}
+    credentials_data["username"] = username
+    credentials_data["password"] = password
+
+    response = req.send_credentials_to_idp(logger, s, header, idp_ip, idp_port, redirect_url, url_form,
+                                           credentials_data, keycloak_cookie, method_form)
+
+    _expect(response, HTTPStatus.OK, HTTPStatus.FOUND)
+
+    keycloak_cookie_2 = response.cookies
+
+    form = extract_form(response.content)
+
+    if form is None:
+        raise FlowError("No token form found at {url}".format(url=response.url))
+
+    url_form = form.get('action')
+    inputs = form.find_all('input')
+    method_form = form.get('method')
+
+    # Get the token from the IDP
+    token = {}
+    for input in inputs:
+        token[input.get('name')] = input.get('value')
+
+    if verifier is not None:
+        started = time.perf_counter()
+        verifier.verify(token)
+        metrics.record("harness.signature", time.perf_counter() - started)
+
+    (response, sp_cookie) = req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme,
+                                                     idp_ip, idp_port, method_form, url_form, token, session_cookie,
+                                                     keycloak_cookie_2)
+
+    _expect(response, HTTPStatus.OK)
+
+    if not expect(response, sp["logged_in_message"]):
+        raise FlowError("Not logged in to {url}".format(url=response.url))
+
+    return response
+
+
+async def async_sp_initiated_login(logger, s, header, standard, sp, idp, username, password, verifier=None,
+                                   flow_state=None):
+    """
+    Async twin of sp_initiated_login, built on the helpers of helpers.async_requests
+    :param logger:
+    :param s: aiohttp session s
+    :param header: header used for the requests
+    :param standard: connection protocol, SAML or WSFED
+    :param sp: service provider settings, i.e. an entry of settings["sps_saml"] or settings["sps_wsfed"]
+    :param idp: identity provider settings, i.e. settings["idp"]
+    :param username: username
+    :param password: password
+    :param verifier: optional SignatureVerifier of the tokens, see helpers.signatures
+    :param flow_state: optional helpers.logging.FlowState of the virtual user, by default the state of the thread
+    :return: the response of the SP once logged in
+    """
+    sp_ip = sp["ip"]
+    sp_port = sp["port"]
+    sp_scheme = sp["http_scheme"]
+    sp_path = sp["path"]
+
+    idp_ip = idp["ip"]
+    idp_port = idp["port"]
+    idp_scheme = idp["http_scheme"]
+
+    if standard == "SAML":
+        (session_cookie, response) = await async_req.access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme,
+                                                                     sp_path, idp_ip, idp_port, flow_state=flow_state)
+    elif standard == "WSFED":
+        response = await async_req.access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path,
+                                                    flow_state=flow_state)
+        session_cookie = response.cookies
+    else:
+        raise ValueError("Unknown standard {standard}".format(standard=standard))
+
+    _expect(response, HTTPStatus.FOUND)
+
+    keycloak_cookie = response.cookies
+
+    redirect_url = response.headers['Location']
+
+    header_redirect_idp = {
+        **header,
+        'Host': "{ip}:{port}".format(ip=idp_ip, port=idp_port),
+        'Referer': "{ip}:{port}".format(ip=sp_ip, port=sp_port)
+    }
+
+    response = await async_req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie,
+                                               flow_state=flow_state)
+
+    _expect(response, HTTPStatus.OK)
+
+    # with WSFED the keycloak cookie is only set by the IDP on the redirect
+    if standard == "WSFED":
+        keycloak_cookie = response.cookies
+
+    form = extract_form(response.content, form_id=idp["login_form_id"])
+
+    if form is None:
+        raise FlowError("No login form found at {url}".format(url=response.url))
+
+    url_form = form.get('action')
+    method_form = form.get('method')
+
+    credentials_data = {}
+    credentials_data["username"] = username
+    credentials_data["password"] = password
+
+    response = await async_req.send_credentials_to_idp(logger, s, header, idp_ip, idp_port, redirect_url, url_form,
+                                                       credentials_data, keycloak_cookie, method_form,
+                                                       flow_state=flow_state)
+
+    _expect(response, HTTPStatus.OK, HTTPStatus.FOUND)
+
+    keycloak_cookie_2 = response.cookies
+
+    form = extract_form(response.content)
+
+    if form is None:
+        raise FlowError("No token form found at {url}".format(url=response.url))
+
+    url_form = form.get('action')
+    inputs = form.find_all('input')
+    method_form = form.get('method')
+
+    # Get the token from the IDP
+    token = {}
+    for input in inputs:
+        token[input.get('name')] = input.get('value')
+
+    if verifier is not None:
+        started = time.perf_counter()
+        await verifier.verify_async(token)
+        metrics.record("harness.signature", time.perf_counter() - started, flow_state)
+
+    (response, sp_cookie) = await async_req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme,
+                                                                 idp_scheme, idp_ip, idp_port, method_form, url_form,
+                                                                 token, session_cookie, keycloak_cookie_2,
+                                                                 flow_state=flow_state)
+
+    _expect(response, HTTPStatus.OK)
+
+    if not expect(response, sp["logged_in_message"]):
+        raise FlowError("Not logged in to {url}".format(url=response.url))
+
+    return response
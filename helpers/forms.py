@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Targeted extraction of the forms of the Keycloak and SP pages.
+# The pages are scanned once for the tags we need (form, input, the social providers links),
+# without building a DOM, which is what a full BeautifulSoup parse costs on every hop.
+
+import re
+
+from html import unescape
+
+# A tag whose attributes may contain quoted '>'
+_FORM_TAG = re.compile(rb'<(/?)(form|input)\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>', re.IGNORECASE)
+_ATTRIBUTE = re.compile(rb'([^\s=/>"\']+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>"\']+)))?')
+_SOCIAL_PROVIDERS = re.compile(rb'<div\b[^>]*\bid\s*=\s*["\']kc-social-providers["\'][^>]*>(.*?)</div>',
+                               re.IGNORECASE | re.DOTALL)
+_LINK = re.compile(rb'<a\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>(.*?)</a>', re.IGNORECASE | re.DOTALL)
+_SPAN = re.compile(rb'<span\b[^>]*>(.*?)</span>', re.IGNORECASE | re.DOTALL)
+
+
+def _decode(value, encoding):
+    return unescape(value.decode(encoding, errors='replace'))
+
+
+def _attributes(raw, encoding):
+    """
+    Parse the attributes of a tag
+    :param raw: bytes between the tag name and the closing '>'
+    :param encoding: encoding of the page
+    :return: dict of the attributes, with lower case names and unescaped values
+    """
+    attributes = {}
+    for match in _ATTRIBUTE.finditer(raw):
+        name, double_quoted, single_quoted, unquoted = match.groups()
+        value = double_quoted if double_quoted is not None else single_quoted
+        if value is None:
+            value = unquoted if unquoted is not None else b''
+        attributes.setdefault(name.decode('ascii', errors='replace').lower(), _decode(value, encoding))
+    return attributes
+
+
+class Form():
+    """
+    Form of a page, with its attributes and its inputs.
+    It answers get() and find_all('input') like the BeautifulSoup tag it replaces.
+    """
+
+    def __init__(self, attributes, inputs):
+        self.attributes = attributes
+        self.inputs = inputs
+
+    @property
+    def action(self):
+        return self.attributes.get('action')
+
+    @property
+    def method(self):
+        return self.attributes.get('method')
+
+    @property
+    def fields(self):
+        """
+        Name and value of the inputs, i.e. the payload posted by the form
+        """
+        return {input.get('name'): input.get('value') for input in self.inputs}
+
+    @property
+    def input_names(self):
+        return [input.get('name') for input in self.inputs]
+
+    def get(self, attribute, default=None):
+        return self.attributes.get(attribute, default)
+
+    def find_all(self, name):
+        if name != 'input':
+            raise ValueError("Only the inputs of a form are extracted")
+        return self.inputs
+
+
+def extract_form(content, form_id=None, encoding='utf-8'):
+    """
+    Extract the first form of a page, or the form with the given id, in a single pass over the page
+    :param content: body of the response, bytes
+    :param form_id: id of the form, e.g. kc-form-login; None for the first form of the page
+    :param encoding: encoding of the page
+    :return: Form, None if the page has no such form
+    """
+    if isinstance(content, str):
+        content = content.encode(encoding)
+
+    form = None
+    for match in _FORM_TAG.finditer(content):
+        closing, tag, raw = match.groups()
+        tag = tag.lower()
+
+        if form is None:
+            if tag != b'form' or closing:
+                continue
+            attributes = _attributes(raw, encoding)
+            if form_id is None or attributes.get('id') == form_id:
+                form = Form(attributes, [])
+        elif closing:
+            if tag == b'form':
+                return form
+        elif tag == b'input':
+            form.inputs.append(_attributes(raw, encoding))
+
+    # an unclosed form ends with the page
+    return form
+
+
+def extract_social_providers(content, encoding='utf-8'):
+    """
+    Extract the identity providers proposed on the Keycloak login page
+    :param content: body of the response, bytes
+    :param encoding: encoding of the page
+    :return: dict of the display name of the providers to the link used to login with them,
+             None if the page has no kc-social-providers list
+    """
+    if isinstance(content, str):
+        content = content.encode(encoding)
+
+    match = _SOCIAL_PROVIDERS.search(content)
+    if match is None:
+        return None
+
+    providers = {}
+    for link in _LINK.finditer(match.group(1)):
+        raw, inner = link.groups()
+        span = _SPAN.search(inner)
+        if span is None:
+            continue
+        name = _decode(span.group(1), encoding).strip()
+        providers[name] = _attributes(raw, encoding).get('href')
+
+    return providers
@@ -0,0 +1,1079 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Local stand-in of the Keycloak IDP, to benchmark the harness without the shared Keycloak instances.
+# It serves the realm exports of tests_config with the pages and the redirects the helpers expect:
+#
+#     POST|GET /auth/realms/{realm}/protocol/saml            SAMLRequest: 302 to the login page, or the
+#                                                            auto-post SAMLResponse form with a SSO session;
+#                                                            LogoutRequest: auto-post LogoutResponse form
+#     GET      /auth/realms/{realm}/protocol/saml/clients/x  IDP-initiated SSO
+#     GET      /auth/realms/{realm}/protocol/wsfed           wsignin1.0: login page, or the auto-post wresult form;
+#                                                            wsignout1.0: auto-post form to the wreply
+#     GET|POST /auth/realms/{realm}/login-actions/authenticate   kc-form-login form, with kc-social-providers
+#     GET      /auth/realms/{realm}/account                  302 to the login page, then the account page
+#     GET|POST /auth/realms/{realm}/broker/{alias}/...       login with, and response of, an identity provider
+#     POST     /auth/realms/{realm}/protocol/openid-connect/token    password and refresh_token grants
+#     ...      /auth/admin/realms[/{realm}[/partialImport]]  import, update and deletion of the realms
+#
+# The assertions are not signed and the authorization policies of the clients are not evaluated (see
+# IdpStandIn.authorize); the stand-in measures the cost of the harness, not the one of Keycloak.
+
+import sys
+import json
+import time
+import zlib
+import base64
+import asyncio
+import hashlib
+import logging
+import secrets
+import argparse
+
+from datetime import datetime, timedelta
+from html import escape
+from urllib.parse import urlsplit, urlencode
+from xml.etree import ElementTree
+from xml.parsers.expat import ExpatError
+
+from aiohttp import web
+
+from helpers.saml import SAMLP, SAML, SAML11, WST, WSA, decode_saml_message, parse_saml_response, parse_wresult
+from helpers.servers import BoundedDict, BackgroundServer
+
+logging.basicConfig(
+    format='%(asctime)s %(name)s %(levelname)s %(message)s',
+    datefmt='%m/%d/%Y %I:%M:%S %p'
+)
+logger = logging.getLogger('acceptance-tool.helpers.idp_stand_in')
+logger.setLevel(logging.INFO)
+
+version = "1.0"
+prog_name = sys.argv[0]
+usage = """{pn} [options]
+Local stand-in of the Keycloak IDP serving the test realms, to benchmark the harness offline
+""".format(
+    pn=prog_name
+)
+parser = argparse.ArgumentParser(prog="{pn} {v}".format(pn=prog_name, v=version), usage=usage)
+
+parser.add_argument('--listen', dest="listen", default="127.0.0.1:8080",
+                    help='Address and port the stand-in listens on')
+parser.add_argument('--realm', dest="realms", action="append", default=[],
+                    help='Path of a realm export to serve, e.g. tests_config/test_realm.json; can be repeated')
+parser.add_argument('--admin', dest="admin", default="admin:admin",
+                    help='username:password of the admin of the master realm')
+
+WSP = "http://schemas.xmlsoap.org/ws/2004/09/policy"
+
+MASTER_REALM = "master"
+
+
+def _now(offset=0):
+    return (datetime.utcnow() + timedelta(seconds=offset)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _id():
+    return "ID_" + secrets.token_hex(16)
+
+
+def _attribute_values(attributes):
+    for name, values in sorted(attributes.items()):
+        if not isinstance(values, list):
+            values = [values]
+        yield name, [str(value) for value in values]
+
+
+def saml2_assertion(issuer, name_id, audience, attributes, session_index, lifetime=300):
+    """
+    :param attributes: dict of attribute name to its list of values
+    :return: unsigned SAML 2.0 assertion, as a string
+    """
+    statements = "".join(
+        '<saml:Attribute Name="{name}" NameFormat="urn:oasis:names:tc:SAML:2.0:attrname-format:basic">{values}'
+        '</saml:Attribute>'.format(
+            name=escape(name),
+            values="".join('<saml:AttributeValue xmlns:xs="http://www.w3.org/2001/XMLSchema" '
+                           'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:type="xs:string">'
+                           '{v}</saml:AttributeValue>'.format(v=escape(value)) for value in values))
+        for name, values in _attribute_values(attributes))
+
+    return (
+        '<saml:Assertion xmlns:saml="{saml}" ID="{id}" IssueInstant="{now}" Version="2.0">'
+        '<saml:Issuer>{issuer}</saml:Issuer>'
+        '<saml:Subject><saml:NameID Format="urn:oasis:names:tc:SAML:1.1:nameid-format:unspecified">{name_id}'
+        '</saml:NameID><saml:SubjectConfirmation Method="urn:oasis:names:tc:SAML:2.0:cm:bearer">'
+        '<saml:SubjectConfirmationData NotOnOrAfter="{end}" Recipient="{audience}"/></saml:SubjectConfirmation>'
+        '</saml:Subject>'
+        '<saml:Conditions NotBefore="{now}" NotOnOrAfter="{end}"><saml:AudienceRestriction>'
+        '<saml:Audience>{audience}</saml:Audience></saml:AudienceRestriction></saml:Conditions>'
+        '<saml:AuthnStatement AuthnInstant="{now}" SessionIndex="{session_index}"><saml:AuthnContext>'
+        '<saml:AuthnContextClassRef>urn:oasis:names:tc:SAML:2.0:ac:classes:unspecified</saml:AuthnContextClassRef>'
+        '</saml:AuthnContext></saml:AuthnStatement>'
+        '<saml:AttributeStatement>{statements}</saml:AttributeStatement>'
+        '</saml:Assertion>'
+    ).format(saml=SAML, id=_id(), now=_now(), end=_now(lifetime), issuer=escape(issuer), name_id=escape(name_id),
+             audience=escape(audience), session_index=escape(session_index), statements=statements)
+
+
+def saml11_assertion(issuer, name_id, audience, attributes, lifetime=300):
+    """
+    :return: unsigned SAML 1.1 assertion, as a string
+    """
+    subject = ('<saml:Subject><saml:NameIdentifier>{name_id}</saml:NameIdentifier><saml:SubjectConfirmation>'
+               '<saml:ConfirmationMethod>urn:oasis:names:tc:SAML:1.0:cm:bearer</saml:ConfirmationMethod>'
+               '</saml:SubjectConfirmation></saml:Subject>').format(name_id=escape(name_id))
+    statements = "".join(
+        '<saml:Attribute AttributeName="{name}" AttributeNamespace="http://schemas.xmlsoap.org/claims">{values}'
+        '</saml:Attribute>'.format(
+            name=escape(name),
+            values="".join('<saml:AttributeValue>{v}</saml:AttributeValue>'.format(v=escape(value))
+                           for value in values))
+        for name, values in _attribute_values(attributes))
+
+    return (
+        '<saml:Assertion xmlns:saml="{saml}" MajorVersion="1" MinorVersion="1" AssertionID="{id}" '
+        'Issuer="{issuer}" IssueInstant="{now}">'
+        '<saml:Conditions NotBefore="{now}" NotOnOrAfter="{end}"><saml:AudienceRestrictionCondition>'
+        '<saml:Audience>{audience}</saml:Audience></saml:AudienceRestrictionCondition></saml:Conditions>'
+        '<saml:AuthenticationStatement AuthenticationInstant="{now}" '
+        'AuthenticationMethod="urn:oasis:names:tc:SAML:1.0:am:password">{subject}</saml:AuthenticationStatement>'
+        '<saml:AttributeStatement>{subject}{statements}</saml:AttributeStatement>'
+        '</saml:Assertion>'
+    ).format(saml=SAML11, id=_id(), now=_now(), end=_now(lifetime), issuer=escape(issuer),
+             audience=escape(audience), subject=subject, statements=statements)
+
+
+def saml_response(issuer, destination, in_response_to, assertion):
+    """
+    :return: SAML 2.0 Response carrying the assertion, as a string
+    """
+    in_response_to = ' InResponseTo="{id}"'.format(id=escape(in_response_to)) if in_response_to else ""
+    return (
+        '<samlp:Response xmlns:samlp="{samlp}" xmlns:saml="{saml}" Destination="{destination}" ID="{id}"'
+        '{in_response_to} IssueInstant="{now}" Version="2.0"><saml:Issuer>{issuer}</saml:Issuer>'
+        '<samlp:Status><samlp:StatusCode Value="urn:oasis:names:tc:SAML:2.0:status:Success"/></samlp:Status>'
+        '{assertion}</samlp:Response>'
+    ).format(samlp=SAMLP, saml=SAML, destination=escape(destination), id=_id(), in_response_to=in_response_to,
+             now=_now(), issuer=escape(issuer), assertion=assertion)
+
+
+def logout_response(issuer, destination, in_response_to):
+    """
+    :return: SAML 2.0 LogoutResponse, as a string
+    """
+    return (
+        '<samlp:LogoutResponse xmlns:samlp="{samlp}" xmlns:saml="{saml}" Destination="{destination}" ID="{id}" '
+        'InResponseTo="{in_response_to}" IssueInstant="{now}" Version="2.0"><saml:Issuer>{issuer}</saml:Issuer>'
+        '<samlp:Status><samlp:StatusCode Value="urn:oasis:names:tc:SAML:2.0:status:Success"/></samlp:Status>'
+        '</samlp:LogoutResponse>'
+    ).format(samlp=SAMLP, saml=SAML, destination=escape(destination), id=_id(),
+             in_response_to=escape(in_response_to or ""), now=_now(), issuer=escape(issuer))
+
+
+def logout_request(issuer, destination, name_id, session_index):
+    """
+    :return: SAML 2.0 LogoutRequest, as a string
+    """
+    return (
+        '<samlp:LogoutRequest xmlns:samlp="{samlp}" xmlns:saml="{saml}" Destination="{destination}" ID="{id}" '
+        'IssueInstant="{now}" Version="2.0"><saml:Issuer>{issuer}</saml:Issuer>'
+        '<saml:NameID Format="urn:oasis:names:tc:SAML:1.1:nameid-format:unspecified">{name_id}</saml:NameID>'
+        '<samlp:SessionIndex>{session_index}</samlp:SessionIndex></samlp:LogoutRequest>'
+    ).format(samlp=SAMLP, saml=SAML, destination=escape(destination), id=_id(), now=_now(), issuer=escape(issuer),
+             name_id=escape(name_id), session_index=escape(session_index))
+
+
+def authn_request(issuer, destination, acs_url):
+    """
+    :return: SAML 2.0 AuthnRequest, as a string
+    """
+    return (
+        '<samlp:AuthnRequest xmlns:samlp="{samlp}" xmlns:saml="{saml}" AssertionConsumerServiceURL="{acs}" '
+        'Destination="{destination}" ID="{id}" IssueInstant="{now}" '
+        'ProtocolBinding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST" Version="2.0">'
+        '<saml:Issuer>{issuer}</saml:Issuer></samlp:AuthnRequest>'
+    ).format(samlp=SAMLP, saml=SAML, acs=escape(acs_url), destination=escape(destination), id=_id(), now=_now(),
+             issuer=escape(issuer))
+
+
+def wsfed_wresult(audience, assertion, lifetime=300, token_type=SAML):
+    """
+    :param token_type: type of the assertion, SAML for SAML 2.0 or SAML11 for SAML 1.1
+    :return: WS-Trust RequestSecurityTokenResponse carrying the assertion, i.e. the wresult of WS-Fed
+    """
+    return (
+        '<t:RequestSecurityTokenResponse xmlns:t="{wst}"><t:Lifetime>'
+        '<wsu:Created xmlns:wsu="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd">'
+        '{now}</wsu:Created>'
+        '<wsu:Expires xmlns:wsu="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd">'
+        '{end}</wsu:Expires></t:Lifetime>'
+        '<wsp:AppliesTo xmlns:wsp="{wsp}"><wsa:EndpointReference xmlns:wsa="{wsa}"><wsa:Address>{audience}'
+        '</wsa:Address></wsa:EndpointReference></wsp:AppliesTo>'
+        '<t:RequestedSecurityToken>{assertion}</t:RequestedSecurityToken>'
+        '<t:TokenType>{token_type}</t:TokenType>'
+        '<t:RequestType>http://schemas.xmlsoap.org/ws/2005/02/trust/Issue</t:RequestType>'
+        '<t:KeyType>http://schemas.xmlsoap.org/ws/2005/05/identity/NoProofKey</t:KeyType>'
+        '</t:RequestSecurityTokenResponse>'
+    ).format(wst=WST, wsp=WSP, wsa=WSA, now=_now(), end=_now(lifetime), audience=escape(audience),
+             assertion=assertion, token_type=token_type)
+
+
+def auto_post_page(title, action, fields):
+    """
+    Page of the HTTP-POST binding, submitted by the browser as soon as it is loaded
+    """
+    inputs = "".join('<INPUT TYPE="HIDDEN" NAME="{name}" VALUE="{value}"/>'.format(
+        name=escape(name), value=escape(value)) for name, value in fields.items() if value is not None)
+    return (
+        '<HTML><HEAD><TITLE>{title}</TITLE></HEAD><BODY Onload="document.forms[0].submit()">'
+        '<FORM METHOD="POST" ACTION="{action}">{inputs}<NOSCRIPT><P>JavaScript is disabled. We strongly recommend '
+        'to enable it. Click the button below to continue.</P><INPUT TYPE="SUBMIT" VALUE="CONTINUE" /></NOSCRIPT>'
+        '</FORM></BODY></HTML>'
+    ).format(title=escape(title), action=escape(action), inputs=inputs)
+
+
+def verify_password(credentials, password):
+    """
+    :param credentials: credentials of a user representation, plain values or pbkdf2 hashes of a realm export
+    :return: True if one of the password credentials matches
+    """
+    for credential in credentials or []:
+        if credential.get("type", "password") != "password":
+            continue
+        if "value" in credential:
+            if secrets.compare_digest(credential["value"], password):
+                return True
+            continue
+        algorithm = credential.get("algorithm", "pbkdf2-sha256")
+        digest = {"pbkdf2": "sha1", "pbkdf2-sha256": "sha256", "pbkdf2-sha512": "sha512"}.get(algorithm)
+        if digest is None or "hashedSaltedValue" not in credential:
+            continue
+        expected = base64.b64decode(credential["hashedSaltedValue"])
+        computed = hashlib.pbkdf2_hmac(digest, password.encode('utf-8'), base64.b64decode(credential["salt"]),
+                                       credential.get("hashIterations", 27500), len(expected))
+        if secrets.compare_digest(computed, expected):
+            return True
+    return False
+
+
+class StandInRealm():
+    """
+    Realm representation with the indexes used by the stand-in
+    """
+
+    def __init__(self, representation):
+        self.representation = representation
+        self.reindex()
+
+    @property
+    def name(self):
+        return self.representation["realm"]
+
+    def reindex(self):
+        rep = self.representation
+        self.users = {user["username"].lower(): user for user in rep.get("users", [])}
+        self.clients = {client["clientId"]: client for client in rep.get("clients", [])}
+        self.sso_url_names = {client["attributes"]["saml_idp_initiated_sso_url_name"]: client
+                              for client in rep.get("clients", [])
+                              if client.get("attributes", {}).get("saml_idp_initiated_sso_url_name")}
+        self.identity_providers = {idp["alias"]: idp for idp in rep.get("identityProviders", [])
+                                   if idp.get("enabled", True)}
+        self.mappers = {}
+        for mapper in rep.get("identityProviderMappers", []):
+            self.mappers.setdefault(mapper["identityProviderAlias"], []).append(mapper)
+
+    def client(self, client_id):
+        """
+        :param client_id: clientId, e.g. the issuer of an AuthnRequest; clients named after a realm URL
+        (the brokers) are also found by the path of the URL, whatever the host
+        """
+        client = self.clients.get(client_id)
+        if client is None and "/auth/realms/" in client_id:
+            path = urlsplit(client_id).path
+            client = next((c for cid, c in self.clients.items() if "/auth/realms/" in cid and
+                           urlsplit(cid).path == path), None)
+        return client
+
+
+class IdpStandIn(BackgroundServer):
+    """
+    asyncio server standing in for Keycloak, see the comment of the module
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, realms=(), admin_username="admin", admin_password="admin",
+                 token_lifespan=60, refresh_lifespan=1800, assertion_lifespan=300, cache_passwords=True):
+        """
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any free port
+        :param realms: realm representations served, as dicts
+        :param admin_username: username of the admin of the master realm
+        :param admin_password: password of the admin of the master realm
+        :param token_lifespan: seconds of validity of the access tokens
+        :param refresh_lifespan: seconds of validity of the refresh tokens
+        :param assertion_lifespan: seconds of validity of the assertions
+        :param cache_passwords: keep the passwords already checked, instead of hashing them at every login
+        """
+        self.host = host
+        self.port = port
+        self.admin = (admin_username, admin_password)
+        self.token_lifespan = token_lifespan
+        self.refresh_lifespan = refresh_lifespan
+        self.assertion_lifespan = assertion_lifespan
+        self.cache_passwords = cache_passwords
+
+        # the master realm only serves the tokens of the admin
+        self.realms = {MASTER_REALM: StandInRealm({"realm": MASTER_REALM, "enabled": True})}
+        for representation in realms:
+            self.add_realm(representation)
+
+        self._auth_sessions = BoundedDict()
+        self._sso_sessions = BoundedDict()
+        self._codes = BoundedDict()
+        self._access_tokens = BoundedDict()
+        self._refresh_tokens = BoundedDict()
+        self._checked_passwords = BoundedDict()
+
+        self.stats = {"logins": 0, "failed_logins": 0, "assertions": 0, "tokens": 0}
+
+        self._runner = None
+
+    # realms
+
+    def add_realm(self, representation):
+        self.realms[representation["realm"]] = StandInRealm(representation)
+
+    def _realm(self, request):
+        realm = self.realms.get(request.match_info["realm"])
+        if realm is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "Realm does not exist"}), content_type="application/json")
+        return realm
+
+    # server
+
+    def app(self):
+        app = web.Application()
+        realm = "/auth/realms/{realm}"
+        app.router.add_route('GET', realm, self.realm_info)
+        app.router.add_route('*', realm + "/protocol/saml", self.saml_endpoint)
+        app.router.add_route('GET', realm + "/protocol/saml/clients/{name}", self.idp_initiated_sso)
+        app.router.add_route('GET', realm + "/protocol/wsfed", self.wsfed_endpoint)
+        app.router.add_route('GET', realm + "/login-actions/authenticate", self.login_page)
+        app.router.add_route('POST', realm + "/login-actions/authenticate", self.authenticate)
+        app.router.add_route('GET', realm + "/account", self.account)
+        app.router.add_route('GET', realm + "/account/login-redirect", self.account_login_redirect)
+        app.router.add_route('GET', realm + "/protocol/openid-connect/auth", self.openid_connect_auth)
+        app.router.add_route('GET', realm + "/protocol/openid-connect/logout", self.logout)
+        app.router.add_route('POST', realm + "/protocol/openid-connect/token", self.token)
+        app.router.add_route('GET', realm + "/broker/{alias}/login", self.broker_login)
+        app.router.add_route('*', realm + "/broker/{alias}/endpoint", self.broker_endpoint)
+        app.router.add_route('GET', realm + "/export/realm", self.export_realm)
+        app.router.add_route('POST', "/auth/admin/realms", self.admin_create_realm)
+        app.router.add_route('GET', "/auth/admin/realms/{realm}", self.admin_get_realm)
+        app.router.add_route('PUT', "/auth/admin/realms/{realm}", self.admin_update_realm)
+        app.router.add_route('DELETE', "/auth/admin/realms/{realm}", self.admin_delete_realm)
+        app.router.add_route('POST', "/auth/admin/realms/{realm}/partialImport", self.admin_partial_import)
+        return app
+
+    @property
+    def url(self):
+        return "http://{host}:{port}".format(host=self.host, port=self.port)
+
+    async def start(self):
+        """
+        Listen on the address of the stand-in; the port is updated if it was 0
+        """
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.info("IDP stand-in listening on {url} with realms {realms}".format(
+            url=self.url, realms=", ".join(sorted(self.realms))))
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def idp_settings(self, realm, username, password):
+        """
+        Settings of the stand-in in the format of the "idp" section of the config files
+        :param realm: name of the test realm
+        :param username: username of the test user
+        :param password: password of the test user
+        """
+        return {
+            "ip": self.host,
+            "port": str(self.port),
+            "http_scheme": "http",
+            "login_form_id": "kc-form-login",
+            "login_form_update": "kc-update-profile-form",
+            "logged_in_message": "Keycloak Account Management",
+            "not_authorized_message": "not_authorized",
+            "master_realm": {
+                "name": MASTER_REALM,
+                "username": self.admin[0],
+                "password": self.admin[1],
+                "client_id": "admin-cli"
+            },
+            "test_realm": {
+                "name": realm,
+                "username": username,
+                "password": password
+            }
+        }
+
+    # pages
+
+    @staticmethod
+    def _base_url(request):
+        return "{scheme}://{host}".format(scheme=request.scheme, host=request.host)
+
+    def _realm_url(self, request, realm):
+        return "{base}/auth/realms/{realm}".format(base=self._base_url(request), realm=realm.name)
+
+    @staticmethod
+    def _redirect(location):
+        return web.Response(status=302, headers={"Location": location})
+
+    @staticmethod
+    def _html(body, status=200):
+        return web.Response(status=status, text=body, content_type="text/html", charset="utf-8")
+
+    def _error_page(self, message, status=400):
+        return self._html("<html><head><title>Error</title></head><body><div id=\"kc-error-message\">"
+                          "<p class=\"instruction\">{message}</p></div></body></html>".format(message=escape(message)),
+                          status)
+
+    def _login_page(self, request, realm, tab_id, error=None):
+        action = "{realm_url}/login-actions/authenticate?{query}".format(
+            realm_url=self._realm_url(request, realm),
+            query=urlencode({"session_code": secrets.token_urlsafe(16), "tab_id": tab_id}))
+
+        providers = "".join(
+            '<li><a href="/auth/realms/{realm}/broker/{alias}/login?{query}" id="zocial-{alias}" '
+            'class="zocial {provider}"> <span>{name}</span></a></li>'.format(
+                realm=realm.name, alias=escape(alias), query=escape(urlencode({"tab_id": tab_id})),
+                provider=escape(idp["providerId"]), name=escape(idp.get("displayName") or alias))
+            for alias, idp in realm.identity_providers.items())
+        social = '<div id="kc-social-providers"><ul>{providers}</ul></div>'.format(
+            providers=providers) if providers else ""
+
+        message = '<div class="alert alert-error"><span class="kc-feedback-text">{error}</span></div>'.format(
+            error=escape(error)) if error else ""
+
+        response = self._html(
+            '<!DOCTYPE html><html><head><title>Log in to {realm}</title></head><body><div id="kc-content">{message}'
+            '<div id="kc-form-wrapper"><form id="kc-form-login" class="form-horizontal" onsubmit="login.disabled = '
+            'true; return true;" action="{action}" method="post">'
+            '<input id="username" name="username" value="" type="text" autofocus autocomplete="off" />'
+            '<input id="password" name="password" type="password" autocomplete="off" />'
+            '<input name="login" id="kc-login" type="submit" value="Log In"/></form></div>{social}</div>'
+            '</body></html>'.format(realm=escape(realm.name), message=message, action=escape(action), social=social))
+        response.set_cookie("AUTH_SESSION_ID", tab_id, path="/auth/realms/{realm}/".format(realm=realm.name))
+        return response
+
+    def _new_auth_session(self, realm, **auth_session):
+        tab_id = secrets.token_urlsafe(12)
+        self._auth_sessions[tab_id] = {"realm": realm.name, **auth_session}
+        return tab_id
+
+    def _sso_session(self, request, realm):
+        session = self._sso_sessions.get(request.cookies.get("KEYCLOAK_IDENTITY"))
+        if session is None or session["realm"] != realm.name or session["username"] not in realm.users:
+            return None
+        return session
+
+    def _set_sso_cookies(self, response, realm, session_id):
+        path = "/auth/realms/{realm}/".format(realm=realm.name)
+        response.set_cookie("KEYCLOAK_IDENTITY", session_id, path=path, httponly=True)
+        response.set_cookie("KEYCLOAK_SESSION", "{realm}/{id}".format(realm=realm.name, id=session_id), path=path)
+        response.del_cookie("AUTH_SESSION_ID", path=path)
+
+    def authorize(self, realm, client, user):
+        """
+        Authorization of a user on a client, always granted; override to emulate the policies of the clients
+        """
+        return True
+
+    @staticmethod
+    def _attributes(request, client, user):
+        """
+        Attributes of the assertion, from the SAML and WS-Fed protocol mappers of the client; the script
+        mappers are not run, except the ones of the IP address of the session which is the one of the request
+        """
+        attributes = {}
+        for mapper in client.get("protocolMappers", []):
+            kind = mapper["protocolMapper"]
+            if kind.startswith("wsfed-"):
+                kind = kind[len("wsfed-"):]
+            config = mapper.get("config", {})
+            name = config.get("attribute.name")
+            if not name:
+                continue
+            if kind == "saml-role-list-mapper":
+                values = list(user.get("realmRoles") or [])
+            elif kind == "saml-user-attribute-mapper":
+                values = (user.get("attributes") or {}).get(config.get("user.attribute"), [])
+            elif kind == "saml-user-property-mapper":
+                values = [user[config["user.attribute"]]] if user.get(config.get("user.attribute")) else []
+            elif kind == "saml-javascript-mapper" and "getIpAddress()" in config.get("Script", ""):
+                values = [request.remote]
+            else:
+                continue
+            if values:
+                attributes.setdefault(name, []).extend(values)
+        return attributes
+
+    def _client_response(self, request, realm, auth_session, username):
+        """
+        Auto-post form of the assertion of the user for the client of the login
+        """
+        user = realm.users[username]
+        client = realm.clients[auth_session["client"]]
+        if not self.authorize(realm, client, user):
+            return self._error_page("not_authorized", 403)
+
+        issuer = self._realm_url(request, realm)
+        attributes = self._attributes(request, client, user)
+        self.stats["assertions"] += 1
+
+        # the logout answers to the URL the client logged in with
+        session = self._sso_sessions.get(auth_session["session_id"])
+        if session is not None:
+            session.setdefault("clients", {})[client["clientId"]] = auth_session["acs_url"]
+
+        if auth_session["protocol"] == "wsfed":
+            if client.get("attributes", {}).get("wsfed.saml_assertion_token_format") == "SAML 1.1":
+                assertion = saml11_assertion(issuer, user["username"], client["clientId"], attributes,
+                                             self.assertion_lifespan)
+                token_type = SAML11
+            else:
+                assertion = saml2_assertion(issuer, user["username"], client["clientId"], attributes,
+                                            auth_session["session_id"], self.assertion_lifespan)
+                token_type = SAML
+            return self._html(auto_post_page("HTTP Binding Response", auth_session["acs_url"], {
+                "wa": "wsignin1.0",
+                "wresult": wsfed_wresult(client["clientId"], assertion, self.assertion_lifespan, token_type),
+                "wctx": auth_session.get("relay_state")
+            }))
+
+        assertion = saml2_assertion(issuer, user["username"], client["clientId"], attributes,
+                                    auth_session["session_id"], self.assertion_lifespan)
+        response = saml_response(issuer, auth_session["acs_url"], auth_session.get("request_id"), assertion)
+        return self._html(auto_post_page("SAML HTTP Post Binding Response", auth_session["acs_url"], {
+            "SAMLResponse": base64.b64encode(response.encode('utf-8')).decode('ascii'),
+            "RelayState": auth_session.get("relay_state")
+        }))
+
+    def _complete_login(self, request, realm, auth_session, username):
+        """
+        Create the SSO session of the user and answer the client of the login
+        """
+        session_id = secrets.token_urlsafe(24)
+        self._sso_sessions[session_id] = {"realm": realm.name, "username": username, "started": time.time()}
+        auth_session["session_id"] = session_id
+        self.stats["logins"] += 1
+
+        if auth_session["protocol"] == "account":
+            response = self._account_redirect(request, realm, auth_session["state"], session_id)
+        else:
+            response = self._client_response(request, realm, auth_session, username)
+        self._set_sso_cookies(response, realm, session_id)
+        return response
+
+    @staticmethod
+    def _acs_url(client, requested=None):
+        """
+        URL the assertion is posted to: the one of the request, or the one configured for the client
+        """
+        if requested:
+            return requested
+        attributes = client.get("attributes", {})
+        for url in (attributes.get("saml_assertion_consumer_url_post"), client.get("adminUrl"),
+                    client.get("baseUrl")):
+            if url:
+                return url
+        for uri in client.get("redirectUris", []):
+            return uri.rstrip("*")
+        return None
+
+    # protocol endpoints
+
+    async def realm_info(self, request):
+        realm = self._realm(request)
+        return web.json_response({
+            "realm": realm.name,
+            "token-service": self._realm_url(request, realm) + "/protocol/openid-connect",
+            "account-service": self._realm_url(request, realm) + "/account",
+            "tokens-not-before": 0
+        })
+
+    async def saml_endpoint(self, request):
+        realm = self._realm(request)
+        if request.method == 'POST':
+            params = await request.post()
+            deflated = False
+        else:
+            params = request.query
+            deflated = True
+
+        if "SAMLRequest" not in params:
+            return self._error_page("Invalid Request")
+        try:
+            root = ElementTree.fromstring(decode_saml_message(params["SAMLRequest"], deflated))
+        except (ValueError, zlib.error, ElementTree.ParseError):
+            return self._error_page("Invalid Request")
+
+        issuer = root.find("{%s}Issuer" % SAML)
+        client = realm.client(issuer.text.strip() if issuer is not None and issuer.text else "")
+
+        if root.tag == "{%s}LogoutRequest" % SAMLP and client is not None:
+            return self._saml_logout(request, realm, client, root, params.get("RelayState"))
+        if client is None or client.get("protocol", "openid-connect") != "saml":
+            return self._error_page("Invalid Request")
+
+        auth_session = {
+            "protocol": "saml",
+            "client": client["clientId"],
+            "acs_url": self._acs_url(client, root.get("AssertionConsumerServiceURL")),
+            "request_id": root.get("ID"),
+            "relay_state": params.get("RelayState")
+        }
+        return self._start_login(request, realm, auth_session, redirect=True)
+
+    async def idp_initiated_sso(self, request):
+        realm = self._realm(request)
+        client = realm.sso_url_names.get(request.match_info["name"])
+        if client is None:
+            return self._error_page("Client not found.")
+        auth_session = {
+            "protocol": "saml",
+            "client": client["clientId"],
+            "acs_url": self._acs_url(client),
+            "relay_state": request.query.get("RelayState")
+        }
+        return self._start_login(request, realm, auth_session, redirect=True)
+
+    async def wsfed_endpoint(self, request):
+        realm = self._realm(request)
+        wa = request.query.get("wa")
+
+        client = realm.client(request.query.get("wtrealm", ""))
+        if client is None or client.get("protocol") != "wsfed" or wa not in ("wsignin1.0", "wsignout1.0"):
+            return self._error_page("Invalid Request")
+
+        if wa == "wsignout1.0":
+            session = self._end_session(request, realm)
+            reply = request.query.get("wreply") or (session or {}).get("clients", {}).get(client["clientId"]) or \
+                self._acs_url(client)
+            if not reply:
+                return self._logged_out(realm)
+            return self._logged_out(realm, self._html(auto_post_page("HTTP Binding Response", reply, {
+                "wa": "wsignout1.0",
+                "wctx": request.query.get("wctx")
+            })))
+
+        auth_session = {
+            "protocol": "wsfed",
+            "client": client["clientId"],
+            "acs_url": self._acs_url(client, request.query.get("wreply")),
+            "relay_state": request.query.get("wctx")
+        }
+        # Keycloak answers the login page of WS-Fed without redirect
+        return self._start_login(request, realm, auth_session, redirect=False)
+
+    def _start_login(self, request, realm, auth_session, redirect):
+        session = self._sso_session(request, realm)
+        if session is not None:
+            auth_session["session_id"] = request.cookies["KEYCLOAK_IDENTITY"]
+            return self._client_response(request, realm, auth_session, session["username"])
+
+        tab_id = self._new_auth_session(realm, **auth_session)
+        if not redirect:
+            return self._login_page(request, realm, tab_id)
+
+        response = self._redirect("{realm_url}/login-actions/authenticate?{query}".format(
+            realm_url=self._realm_url(request, realm),
+            query=urlencode({"client_id": auth_session.get("client", ""), "tab_id": tab_id})))
+        response.set_cookie("AUTH_SESSION_ID", tab_id, path="/auth/realms/{realm}/".format(realm=realm.name))
+        return response
+
+    async def login_page(self, request):
+        realm = self._realm(request)
+        tab_id = request.query.get("tab_id")
+        if tab_id not in self._auth_sessions:
+            return self._error_page("Your login attempt timed out. Login will start from the beginning.")
+        return self._login_page(request, realm, tab_id)
+
+    async def _check_password(self, realm, username, password):
+        user = realm.users.get(username)
+        if user is None or not user.get("enabled", True):
+            return False
+
+        key = (realm.name, username, hashlib.sha256(password.encode('utf-8')).digest())
+        if self.cache_passwords and key in self._checked_passwords:
+            return True
+
+        # PBKDF2 releases the GIL, the loop keeps serving the other flows
+        loop = asyncio.get_event_loop()
+        valid = await loop.run_in_executor(None, verify_password, user.get("credentials"), password)
+        if valid and self.cache_passwords:
+            self._checked_passwords[key] = True
+        return valid
+
+    async def authenticate(self, request):
+        realm = self._realm(request)
+        tab_id = request.query.get("tab_id")
+        auth_session = self._auth_sessions.get(tab_id)
+        if auth_session is None or auth_session["realm"] != realm.name:
+            return self._error_page("Your login attempt timed out. Login will start from the beginning.")
+
+        form = await request.post()
+        username = form.get("username", "").lower()
+        if not await self._check_password(realm, username, form.get("password", "")):
+            self.stats["failed_logins"] += 1
+            return self._login_page(request, realm, tab_id, "Invalid username or password.")
+
+        del self._auth_sessions[tab_id]
+        return self._complete_login(request, realm, auth_session, username)
+
+    async def account(self, request):
+        realm = self._realm(request)
+        session = self._sso_session(request, realm)
+        if session is None:
+            state = secrets.token_urlsafe(16)
+            response = self._redirect("{realm_url}/protocol/openid-connect/auth?{query}".format(
+                realm_url=self._realm_url(request, realm),
+                query=urlencode({"client_id": "account", "response_type": "code", "state": state,
+                                 "redirect_uri": self._realm_url(request, realm) + "/account/login-redirect"})))
+            response.set_cookie("OAuth_Token_Request_State", state,
+                                path="/auth/realms/{realm}/account".format(realm=realm.name))
+            return response
+
+        user = realm.users[session["username"]]
+        return self._html(
+            '<!DOCTYPE html><html><head><title>Keycloak Account Management</title></head><body>'
+            '<div id="kc-account"><p>Keycloak Account Management</p><form id="kc-account-form" method="post" '
+            'action="{realm_url}/account/"><input type="text" id="username" name="username" value="{username}" '
+            'disabled="disabled"/><input type="text" id="email" name="email" value="{email}"/></form>'
+            '<a href="{realm_url}/protocol/openid-connect/logout">Sign Out</a></div></body></html>'.format(
+                realm_url=escape(self._realm_url(request, realm)), username=escape(user["username"]),
+                email=escape(user.get("email", ""))))
+
+    async def openid_connect_auth(self, request):
+        realm = self._realm(request)
+        auth_session = {"protocol": "account", "state": request.query.get("state", "")}
+        session = self._sso_session(request, realm)
+        if session is not None:
+            return self._account_redirect(request, realm, auth_session["state"],
+                                          request.cookies["KEYCLOAK_IDENTITY"])
+        return self._login_page(request, realm, self._new_auth_session(realm, **auth_session))
+
+    def _account_redirect(self, request, realm, state, session_id):
+        code = secrets.token_urlsafe(24)
+        self._codes[code] = session_id
+        return self._redirect("{realm_url}/account/login-redirect?{query}".format(
+            realm_url=self._realm_url(request, realm), query=urlencode({"state": state, "code": code})))
+
+    async def account_login_redirect(self, request):
+        realm = self._realm(request)
+        response = self._redirect(self._realm_url(request, realm) + "/account")
+        # the account application exchanges its code for the session of the user
+        session_id = self._codes.pop(request.query.get("code"), None)
+        if session_id in self._sso_sessions:
+            self._set_sso_cookies(response, realm, session_id)
+        return response
+
+    def _end_session(self, request, realm, session_id=None):
+        """
+        End the SSO session of the session index of a logout request, or else of the cookie of the request
+        :return: the ended session, None if there was none
+        """
+        session_id = session_id or request.cookies.get("KEYCLOAK_IDENTITY")
+        session = self._sso_sessions.pop(session_id, None)
+        if session is not None and session["realm"] != realm.name:
+            self._sso_sessions[session_id] = session
+            return None
+        return session
+
+    def _logged_out(self, realm, response=None):
+        if response is None:
+            response = self._html("<html><head><title>Logging out</title></head><body><p>You are logged out"
+                                  "</p></body></html>")
+        path = "/auth/realms/{realm}/".format(realm=realm.name)
+        response.del_cookie("KEYCLOAK_IDENTITY", path=path)
+        response.del_cookie("KEYCLOAK_SESSION", path=path)
+        return response
+
+    def _saml_logout(self, request, realm, client, logout_request, relay_state):
+        """
+        End the session of a LogoutRequest and post the LogoutResponse to the client
+        """
+        session_index = logout_request.find("{%s}SessionIndex" % SAMLP)
+        session = self._end_session(request, realm, session_index.text if session_index is not None else None)
+
+        # the configured logout URL, unless the client logged in from another host (e.g. a local SP)
+        login_url = (session or {}).get("clients", {}).get(client["clientId"])
+        url = client.get("attributes", {}).get("saml_single_logout_service_url_post")
+        if not url or (login_url and urlsplit(url).netloc != urlsplit(login_url).netloc):
+            url = login_url or self._acs_url(client)
+
+        response = logout_response(self._realm_url(request, realm), url, logout_request.get("ID"))
+        return self._logged_out(realm, self._html(auto_post_page("SAML HTTP Post Binding Response", url, {
+            "SAMLResponse": base64.b64encode(response.encode('utf-8')).decode('ascii'),
+            "RelayState": relay_state
+        })))
+
+    async def logout(self, request):
+        realm = self._realm(request)
+        self._end_session(request, realm)
+        redirect_uri = request.query.get("redirect_uri")
+        return self._logged_out(realm, self._redirect(redirect_uri) if redirect_uri else None)
+
+    # brokering
+
+    def _local_url(self, request, url):
+        """
+        URL of an identity provider, moved to the stand-in when it serves the realm of the URL
+        """
+        parts = urlsplit(url)
+        segments = parts.path.split("/")
+        if len(segments) > 3 and segments[1:3] == ["auth", "realms"] and segments[3] in self.realms:
+            query = "?" + parts.query if parts.query else ""
+            return self._base_url(request) + parts.path + query
+        return url
+
+    async def broker_login(self, request):
+        realm = self._realm(request)
+        idp = realm.identity_providers.get(request.match_info["alias"])
+        tab_id = request.query.get("tab_id")
+        if idp is None or tab_id not in self._auth_sessions:
+            return self._error_page("Could not send authentication request to identity provider.")
+
+        sso_url = self._local_url(request, idp["config"]["singleSignOnServiceUrl"])
+        endpoint = "{realm_url}/broker/{alias}/endpoint".format(realm_url=self._realm_url(request, realm),
+                                                                 alias=idp["alias"])
+
+        if idp["providerId"] == "wsfed":
+            wtrealm = idp["config"].get("wsfedRealm") or self._realm_url(request, realm)
+            inputs = {"wa": "wsignin1.0", "wtrealm": wtrealm, "wreply": endpoint,
+                      "wctx": tab_id}
+            page = auto_post_page("HTTP Binding Request", sso_url, inputs).replace(
+                'METHOD="POST"', 'METHOD="GET"', 1)
+            return self._html(page)
+
+        request_xml = authn_request(self._realm_url(request, realm), sso_url, endpoint)
+        return self._html(auto_post_page("SAML HTTP Post Binding", sso_url, {
+            "SAMLRequest": base64.b64encode(request_xml.encode('utf-8')).decode('ascii'),
+            "RelayState": tab_id
+        }))
+
+    async def broker_endpoint(self, request):
+        realm = self._realm(request)
+        alias = request.match_info["alias"]
+        if alias not in realm.identity_providers:
+            return self._error_page("Invalid Request")
+
+        params = await request.post() if request.method == 'POST' else request.query
+        try:
+            if "SAMLResponse" in params:
+                token = parse_saml_response(params["SAMLResponse"], request.method != 'POST')
+                tab_id = params.get("RelayState")
+            elif "wresult" in params:
+                token = parse_wresult(params["wresult"])
+                tab_id = params.get("wctx")
+            else:
+                return self._error_page("Invalid Request")
+        except (ValueError, zlib.error, ExpatError):
+            return self._error_page("Invalid Request")
+
+        auth_session = self._auth_sessions.pop(tab_id, None)
+        name_id, attributes = token.name_id, token.attributes
+        if auth_session is None or name_id is None:
+            return self._error_page("Unexpected error when authenticating with identity provider")
+
+        # the brokered user is created at the first login and its mapped attributes updated at every login
+        username = name_id.lower()
+        user = realm.users.get(username)
+        if user is None:
+            user = {"username": username, "enabled": True, "attributes": {}, "realmRoles": [],
+                    "federatedIdentities": [{"identityProvider": alias, "userId": name_id, "userName": name_id}]}
+            realm.representation.setdefault("users", []).append(user)
+            realm.users[username] = user
+        for mapper in realm.mappers.get(alias, []):
+            config = mapper.get("config", {})
+            if config.get("attribute.name") in attributes and config.get("user.attribute"):
+                user.setdefault("attributes", {})[config["user.attribute"]] = attributes[config["attribute.name"]]
+
+        return self._complete_login(request, realm, auth_session, username)
+
+    # tokens and admin API
+
+    async def token(self, request):
+        realm = self._realm(request)
+        form = await request.post()
+        grant_type = form.get("grant_type")
+
+        if grant_type == "password":
+            username = form.get("username", "").lower()
+            if realm.name == MASTER_REALM:
+                valid = (username, form.get("password")) == self.admin
+            else:
+                valid = await self._check_password(realm, username, form.get("password", ""))
+            if not valid:
+                return web.json_response({"error": "invalid_grant", "error_description": "Invalid user credentials"},
+                                         status=401)
+        elif grant_type == "refresh_token":
+            refresh = self._refresh_tokens.pop(form.get("refresh_token"), None)
+            if refresh is None or refresh["expires"] < time.monotonic() or refresh["realm"] != realm.name:
+                return web.json_response({"error": "invalid_grant", "error_description": "Invalid refresh token"},
+                                         status=400)
+            username = refresh["username"]
+        else:
+            return web.json_response({"error": "unsupported_grant_type"}, status=400)
+
+        access_token = secrets.token_urlsafe(32)
+        refresh_token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        self._access_tokens[access_token] = {"realm": realm.name, "username": username,
+                                             "expires": now + self.token_lifespan}
+        self._refresh_tokens[refresh_token] = {"realm": realm.name, "username": username,
+                                               "expires": now + self.refresh_lifespan}
+        self.stats["tokens"] += 1
+
+        return web.json_response({
+            "access_token": access_token,
+            "expires_in": self.token_lifespan,
+            "refresh_expires_in": self.refresh_lifespan,
+            "refresh_token": refresh_token,
+            "token_type": "bearer",
+            "not-before-policy": 0,
+            "session_state": secrets.token_hex(16),
+            "scope": "profile email"
+        })
+
+    def _check_admin(self, request):
+        scheme, _, access_token = request.headers.get("Authorization", "").partition(" ")
+        token = self._access_tokens.get(access_token) if scheme.lower() == "bearer" else None
+        if token is None or token["expires"] < time.monotonic() or token["realm"] != MASTER_REALM:
+            raise web.HTTPUnauthorized(text=json.dumps({"error": "HTTP 401 Unauthorized"}),
+                                       content_type="application/json")
+
+    async def admin_create_realm(self, request):
+        self._check_admin(request)
+        representation = await request.json()
+        if representation["realm"] in self.realms:
+            return web.json_response({"errorMessage": "Conflict detected. See logs for details"}, status=409)
+        self.add_realm(representation)
+        return web.Response(status=201, headers={
+            "Location": "{base}/auth/admin/realms/{realm}".format(base=self._base_url(request),
+                                                                  realm=representation["realm"])})
+
+    async def admin_get_realm(self, request):
+        self._check_admin(request)
+        realm = self._realm(request)
+        return web.json_response({key: value for key, value in realm.representation.items()
+                                  if key not in ("users", "clients", "roles", "groups", "components")})
+
+    async def admin_update_realm(self, request):
+        self._check_admin(request)
+        realm = self._realm(request)
+        realm.representation.update(await request.json())
+        realm.reindex()
+        return web.Response(status=204)
+
+    async def admin_delete_realm(self, request):
+        self._check_admin(request)
+        realm = self._realm(request)
+        del self.realms[realm.name]
+        return web.Response(status=204)
+
+    async def admin_partial_import(self, request):
+        self._check_admin(request)
+        realm = self._realm(request)
+        data = await request.json()
+        policy = data.get("ifResourceExists", "FAIL")
+        rep = realm.representation
+
+        counts = {"added": 0, "overwritten": 0, "skipped": 0}
+        results = []
+
+        def merge(section, resources, key):
+            existing = {resource[key]: i for i, resource in enumerate(rep.setdefault(section, []))}
+            for resource in resources:
+                if resource[key] in existing:
+                    if policy == "FAIL":
+                        raise web.HTTPConflict(text=json.dumps({"errorMessage": "{name} exists".format(
+                            name=resource[key])}), content_type="application/json")
+                    if policy == "SKIP":
+                        counts["skipped"] += 1
+                        action = "SKIPPED"
+                    else:
+                        rep[section][existing[resource[key]]] = resource
+                        counts["overwritten"] += 1
+                        action = "OVERWRITTEN"
+                else:
+                    existing[resource[key]] = len(rep[section])
+                    rep[section].append(resource)
+                    counts["added"] += 1
+                    action = "ADDED"
+                results.append({"action": action, "resourceType": section.upper().rstrip("S"),
+                                "resourceName": resource[key]})
+
+        merge("users", data.get("users", []), "username")
+        merge("clients", data.get("clients", []), "clientId")
+        merge("groups", data.get("groups", []), "name")
+        merge("identityProviders", data.get("identityProviders", []), "alias")
+        for role in data.get("roles", {}).get("realm", []):
+            merge_roles = rep.setdefault("roles", {}).setdefault("realm", [])
+            if all(existing["name"] != role["name"] for existing in merge_roles):
+                merge_roles.append(role)
+                counts["added"] += 1
+
+        realm.reindex()
+        return web.json_response({**counts, "results": results})
+
+    async def export_realm(self, request):
+        self._check_admin(request)
+        return web.json_response(self._realm(request).representation)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    realms = []
+    for path in args.realms:
+        try:
+            with open(path) as json_data:
+                realms.append(json.load(json_data))
+        except IOError as e:
+            logger.debug(e)
+            raise IOError("Realm file {path} not found".format(path=path))
+
+    host, _, port = args.listen.rpartition(":")
+    admin_username, _, admin_password = args.admin.partition(":")
+
+    stand_in = IdpStandIn(host or "127.0.0.1", int(port), realms, admin_username, admin_password)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(stand_in.start())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(stand_in.stop())
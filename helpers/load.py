@@ -0,0 +1,483 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+import sys
+import json
+import time
+import logging
+import asyncio
+import argparse
+import threading
+import urllib3
+
+import aiohttp
+
+import helpers.metrics as metrics
+import helpers.requests as req
+import helpers.async_requests as async_req
+from helpers.logging import FlowState, configure_request_logging, start_flow
+from helpers.results import ResultsWriter, set_results_writer
+from helpers.transport import Transport, TransportStats
+from helpers.flows import FailureLog, sp_initiated_login, async_sp_initiated_login
+from helpers.signatures import SignatureVerifier
+from helpers.scheduler import ArrivalScheduler, FLOW_CORRECTED, FLOW_UNCORRECTED
+from helpers.coordinator import Coordinator, THREADS, ASYNC, RATE
+from helpers.distributed import Controller, read_token
+
+logging.basicConfig(
+    format='%(asctime)s %(name)s %(levelname)s %(message)s',
+    datefmt='%m/%d/%Y %I:%M:%S %p'
+)
+logger = logging.getLogger('acceptance-tool.helpers.load')
+logger.setLevel(logging.INFO)
+
+version = "1.0"
+prog_name = sys.argv[0]
+usage = """{pn} [options]
+Replay the SP-initiated SSO flow of the acceptance tests with concurrent virtual users
+""".format(
+    pn=prog_name
+)
+parser = argparse.ArgumentParser(prog="{pn} {v}".format(pn=prog_name, v=version), usage=usage)
+
+parser.add_argument('--config-file', dest="config", help='Path to the config file: Ex : tests_config/dev.json',
+                    required=True)
+parser.add_argument('--standard', dest="standard", choices=["SAML", "WSFED"], default="SAML",
+                    help='Oasis standard of the flow')
+parser.add_argument('--sp', dest="sp", type=int, default=0, help='Index of the service provider in the config file')
+parser.add_argument('--users', dest="users", type=int, default=10, help='Number of concurrent virtual users')
+parser.add_argument('--ramp-up', dest="ramp_up", type=float, default=0, help='Seconds to start all the users')
+parser.add_argument('--duration', dest="duration", type=float, default=60,
+                    help='Seconds during which the users replay the flow, once the ramp-up is done')
+parser.add_argument('--async', dest="use_asyncio", action="store_true",
+                    help='Run the virtual users as asyncio tasks of a single thread instead of one thread per user')
+parser.add_argument('--log-sample', dest="log_sample", type=int, default=0,
+                    help='Log the requests of 1 flow in N, 0 to disable the logging of the requests')
+parser.add_argument('--log-max-body', dest="log_max_body", type=int, default=1024,
+                    help='Maximum number of characters of the logged request bodies')
+parser.add_argument('--rate', dest="rate", type=float,
+                    help='Start the flows at this rate per second instead of looping virtual users')
+parser.add_argument('--arrivals', dest="arrivals", choices=["poisson", "constant"], default="poisson",
+                    help='Inter-arrival times of the flows started with --rate')
+parser.add_argument('--max-in-flight', dest="max_in_flight", type=int, default=100,
+                    help='Maximum number of flows run at the same time with --rate, the other ones start late')
+parser.add_argument('--seed', dest="seed", type=int, help='Seed of the poisson arrivals')
+parser.add_argument('--processes', dest="processes", type=int, default=1,
+                    help='Number of worker processes sharing the users or the rate, 0 for one per core')
+parser.add_argument('--agents', dest="agents", nargs="+",
+                    help='host:port of load agents (helpers.distributed) among which the run is split')
+parser.add_argument('--agent-processes', dest="agent_processes", type=int,
+                    help='Number of worker processes of every agent, by default one per core')
+parser.add_argument('--agent-token-file', dest="agent_token_file",
+                    help='File of the token shared with the agents (helpers.distributed --token-file)')
+parser.add_argument('--credentials', dest="credentials",
+                    help='Optional JSON file of a list of {"username", "password"} shared by the flows, '
+                         'by default the user of the test realm')
+parser.add_argument('--output', dest="output", help='Optional path of the JSON report')
+parser.add_argument('--verify-signatures', dest="verify_signatures", action="store_true",
+                    help='Verify the signature of every token with the keys of the test realm')
+parser.add_argument('--verify-processes', dest="verify_processes", type=int,
+                    help='Number of processes verifying the signatures, by default one per core')
+parser.add_argument('--results', dest="results",
+                    help='Optional path of the file to which every request of the run is appended; with '
+                         'several processes every worker appends to <path>.<worker>; with agents every worker '
+                         'appends to results.<agent>.<worker> in the --results-dir of its agent')
+
+
+class VirtualUser(threading.Thread):
+    """
+    Virtual user replaying the SSO flow with its own session until the end of the run
+    """
+
+    def __init__(self, runner, index, start_at):
+        super().__init__(name="virtual-user-{i}".format(i=index), daemon=True)
+        self.runner = runner
+        self.index = index
+        self.start_at = start_at
+        self.completed = 0
+        self.failed = 0
+
+    def run(self):
+        runner = self.runner
+
+        delay = self.start_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        s = runner.transport.session()
+        header = req.get_header()
+        username, password = runner.credentials_of(self.index)
+
+        metrics.set_flow(runner.flow)
+
+        while time.monotonic() < runner.deadline:
+            start_flow()
+            started = time.perf_counter()
+            try:
+                sp_initiated_login(runner.flow_logger, s, header, runner.standard, runner.sp, runner.idp,
+                                   username, password, runner.verifier)
+            except Exception as e:
+                self.failed += 1
+                runner.failures.log(self.name, e)
+            else:
+                self.completed += 1
+                metrics.record("flow", time.perf_counter() - started)
+            finally:
+                # every flow starts without the SSO session of the previous one
+                s.cookies.clear()
+
+
+class LoadRunner():
+    """
+    Run the SP-initiated SSO flow with N concurrent virtual users and report flows per second
+    and the latency percentiles of every hop
+    """
+
+    def __init__(self, settings, standard="SAML", sp_index=0, users=10, ramp_up=0, duration=60, flow_logger=None,
+                 credentials=None):
+        """
+        :param settings: settings of the IDP and SP, as loaded from the config file
+        :param standard: connection protocol, SAML or WSFED
+        :param sp_index: index of the service provider in settings["sps_saml"] or settings["sps_wsfed"]
+        :param users: number of concurrent virtual users
+        :param ramp_up: seconds over which the virtual users are started
+        :param duration: seconds during which the flow is replayed once the ramp-up is done
+        :param flow_logger: logger given to the helpers, disabled by default
+        :param credentials: list of {"username", "password"} shared round-robin by the virtual users,
+        by default the user of the test realm
+        """
+        client = "sps_saml" if standard == "SAML" else "sps_wsfed"
+
+        self.standard = standard
+        self.sp = settings[client][sp_index]
+        self.flow = "{protocol}.{sp}".format(protocol=standard.lower(), sp=self.sp["name"])
+        self.idp = settings["idp"]
+        self.username = settings["idp"]["test_realm"]["username"]
+        self.password = settings["idp"]["test_realm"]["password"]
+        self.users = users
+        self.ramp_up = ramp_up
+        self.duration = duration
+        self.credentials = credentials or [{"username": self.username, "password": self.password}]
+        self.deadline = None
+        self.failures = FailureLog(logger)
+        self.virtual_users = []
+        self._connect(settings)
+
+        if flow_logger is None:
+            flow_logger = logging.getLogger('acceptance-tool.helpers.load.flow')
+            flow_logger.setLevel(logging.WARNING)
+        self.flow_logger = flow_logger
+
+    def _connect(self, settings):
+        """
+        Build the transport shared by the virtual users, and the optional check of the signatures of the tokens
+        """
+        self.transport = Transport.from_settings(settings, pool_maxsize=self.users)
+        # requests and connections of the virtual users, reported at the end of the run
+        self.connection_stats = self.transport.stats
+        # optional check of the signatures of the tokens, see helpers.signatures
+        self.verifier = SignatureVerifier.from_settings(settings, self.transport.session())
+
+    def credentials_of(self, index):
+        """
+        :return: username and password of the virtual user of the index
+        """
+        credentials = self.credentials[index % len(self.credentials)]
+        return credentials["username"], credentials["password"]
+
+    def progress(self):
+        """
+        :return: number of flows completed and failed so far
+        """
+        virtual_users = list(self.virtual_users)
+        return sum(user.completed for user in virtual_users), sum(user.failed for user in virtual_users)
+
+    def run(self):
+        """
+        Start the virtual users, wait for the end of the run and build the report
+        :return: report of the run
+        """
+        metrics.get_recorder().reset()
+
+        start = time.monotonic()
+        self.deadline = start + self.ramp_up + self.duration
+
+        step = self.ramp_up / self.users if self.users else 0
+        virtual_users = [VirtualUser(self, i, start + i * step) for i in range(self.users)]
+        self.virtual_users = virtual_users
+
+        for user in virtual_users:
+            user.start()
+
+        for user in virtual_users:
+            user.join()
+
+        elapsed = time.monotonic() - start
+
+        self.transport.close()
+        self.close_verifier()
+
+        return self.report(elapsed)
+
+    def close_verifier(self):
+        if self.verifier is not None:
+            self.verifier.close()
+
+    def report(self, elapsed):
+        completed, failed = self.progress()
+
+        hops = metrics.summarize(metrics.get_recorder().snapshot()).get(self.flow, {})
+
+        report = {
+            "standard": self.standard,
+            "sp": self.sp["name"],
+            "users": self.users,
+            "ramp_up": self.ramp_up,
+            "duration": self.duration,
+            "elapsed": elapsed,
+            "flows": completed,
+            "errors": failed,
+            "flows_per_second": completed / elapsed if elapsed else 0,
+            "connections": self.connection_stats.to_json(),
+            "hops": hops
+        }
+
+        return report
+
+
+class AsyncVirtualUser():
+    """
+    Async twin of VirtualUser, run as an asyncio task
+    """
+
+    def __init__(self, runner, index, start_at):
+        self.name = "virtual-user-{i}".format(i=index)
+        self.runner = runner
+        self.index = index
+        self.start_at = start_at
+        self.completed = 0
+        self.failed = 0
+
+    async def run(self, connector):
+        runner = self.runner
+
+        delay = self.start_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        header = req.get_header()
+        username, password = runner.credentials_of(self.index)
+
+        # the tasks of the virtual users share a thread, every one has its own flow state
+        state = FlowState(runner.flow)
+
+        # the connections are shared by all the users, the cookies are not
+        async with async_req.new_session(connector=connector, stats=runner.connection_stats) as s:
+            while time.monotonic() < runner.deadline:
+                start_flow(state)
+                started = time.perf_counter()
+                try:
+                    await async_sp_initiated_login(runner.flow_logger, s, header, runner.standard, runner.sp,
+                                                   runner.idp, username, password, runner.verifier, state)
+                except Exception as e:
+                    self.failed += 1
+                    runner.failures.log(self.name, e)
+                else:
+                    self.completed += 1
+                    metrics.record("flow", time.perf_counter() - started, state)
+                finally:
+                    s.cookie_jar.clear()
+
+
+class AsyncLoadRunner(LoadRunner):
+    """
+    LoadRunner whose virtual users are asyncio tasks of a single thread, so that one process
+    can hold thousands of SSO flows in flight
+    """
+
+    def _connect(self, settings):
+        # the virtual users do not use a transport, but the connections of the aiohttp connector; a transport is
+        # only opened to fetch the certificates of the realm
+        self.transport = None
+        self.connection_stats = TransportStats()
+        transport = Transport.from_settings(settings, pool_maxsize=1)
+        try:
+            self.verifier = SignatureVerifier.from_settings(settings, transport.session())
+        finally:
+            transport.close()
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.run_async())
+        finally:
+            loop.close()
+
+    async def run_async(self):
+        metrics.get_recorder().reset()
+
+        start = time.monotonic()
+        self.deadline = start + self.ramp_up + self.duration
+
+        step = self.ramp_up / self.users if self.users else 0
+        virtual_users = [AsyncVirtualUser(self, i, start + i * step) for i in range(self.users)]
+        self.virtual_users = virtual_users
+
+        connector = aiohttp.TCPConnector(limit=0, ssl=False)
+        try:
+            await asyncio.gather(*[user.run(connector) for user in virtual_users])
+        finally:
+            await connector.close()
+
+        elapsed = time.monotonic() - start
+
+        self.close_verifier()
+
+        return self.report(elapsed)
+
+
+def format_report(report):
+    """
+    Render the report of a run as a text table
+    """
+    if "rate" in report:
+        load = "{rate:.2f} flows/s {arrivals} arrivals".format(rate=report["rate"], arrivals=report["arrivals"])
+    else:
+        load = "{users} users".format(users=report["users"])
+
+    lines = [
+        "{standard} flow on {sp}: {load}, {flows} flows, {errors} errors in {elapsed:.1f}s, "
+        "{fps:.2f} flows/s".format(
+            standard=report["standard"],
+            sp=report["sp"],
+            load=load,
+            flows=report["flows"],
+            errors=report["errors"],
+            elapsed=report["elapsed"],
+            fps=report["flows_per_second"]
+        ),
+        "{hop:<24}{count:>10}".format(hop="hop", count="count") +
+        "".join("{p:>10}".format(p="p{p}".format(p=p)) for p in metrics.PERCENTILES) + "{m:>10}".format(m="max")
+    ]
+    for hop, stats in report["hops"].items():
+        lines.append(
+            "{hop:<24}{count:>10}".format(hop=hop, count=stats["count"]) +
+            "".join("{v:>10.1f}".format(v=stats["p{p}".format(p=p)] * 1000) for p in metrics.PERCENTILES) +
+            "{v:>10.1f}".format(v=stats["max"] * 1000)
+        )
+    lines.append("latencies in ms")
+    if FLOW_CORRECTED in report["hops"]:
+        lines.append("{corrected} measured from the intended start of the flows, {uncorrected} from their actual "
+                     "start; {late} flows were dispatched late".format(corrected=FLOW_CORRECTED,
+                                                                       uncorrected=FLOW_UNCORRECTED,
+                                                                       late=report["late_dispatches"]))
+    for host, stats in report["connections"].items():
+        lines.append("{host}: {r} requests, {n} new connections, {u} reused connections".format(
+            host=host,
+            r=stats["requests"],
+            n=stats["new_connections"],
+            u=stats["reused_connections"]
+        ))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.config) as json_data:
+            settings = json.load(json_data)
+    except IOError as e:
+        logger.debug(e)
+        raise IOError("Config file {path} not found".format(path=args.config))
+
+    # read by SignatureVerifier.from_settings in every runner, and thus in every worker process
+    if args.verify_signatures:
+        settings["signatures"] = {"processes": args.verify_processes}
+
+    # the SPs and IDPs of the test environments use self signed certificates
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    flow_logger = logging.getLogger('acceptance-tool.helpers.load.flow')
+    if args.log_sample > 0:
+        configure_request_logging(sample_rate=args.log_sample, max_body_length=args.log_max_body)
+        flow_logger.setLevel(logging.DEBUG)
+    else:
+        flow_logger.setLevel(logging.WARNING)
+
+    credentials = None
+    if args.credentials:
+        with open(args.credentials) as json_data:
+            credentials = json.load(json_data)
+
+    multiprocess = args.processes != 1 or args.agents
+    if multiprocess:
+        if args.rate:
+            kind = RATE
+            options = {"rate": args.rate, "arrivals": args.arrivals, "max_in_flight": args.max_in_flight,
+                       "seed": args.seed}
+        else:
+            kind = ASYNC if args.use_asyncio else THREADS
+            options = {"users": args.users, "ramp_up": args.ramp_up}
+        options.update({"standard": args.standard, "sp_index": args.sp, "duration": args.duration})
+
+        if args.agents:
+            if not args.agent_token_file:
+                parser.error("--agents requires --agent-token-file")
+
+            runner = Controller(settings, args.agents, read_token(args.agent_token_file), kind, options, credentials,
+                                args.agent_processes, log_level=flow_logger.level, results=bool(args.results))
+
+            logger.info("starting {a} agents".format(a=len(args.agents)))
+        else:
+            runner = Coordinator(settings, kind, options, credentials, args.processes or None,
+                                 log_level=flow_logger.level, results=args.results)
+
+            logger.info("starting {p} worker processes".format(p=runner.processes))
+    elif args.rate:
+        runner = ArrivalScheduler(settings, args.standard, args.sp, args.rate, args.duration, args.arrivals,
+                                  args.max_in_flight, args.seed, flow_logger, credentials)
+
+        logger.info("starting {rate} flows/s".format(rate=args.rate))
+    else:
+        runner_class = AsyncLoadRunner if args.use_asyncio else LoadRunner
+
+        runner = runner_class(settings, args.standard, args.sp, args.users, args.ramp_up, args.duration, flow_logger,
+                              credentials)
+
+        logger.info("starting {users} virtual users".format(users=args.users))
+
+    # the workers of a multi-process run write their own results files
+    if args.results and not multiprocess:
+        writer = ResultsWriter(args.results)
+        set_results_writer(writer)
+        try:
+            report = runner.run()
+        finally:
+            set_results_writer(None)
+            writer.close()
+        logger.info("{rows} requests written to {path}".format(rows=writer.rows, path=args.results))
+    else:
+        report = runner.run()
+        if args.results and args.agents:
+            logger.info("requests written to results.<agent>.<worker> in the --results-dir of the agents")
+        elif args.results:
+            logger.info("requests written to {path}.<worker>".format(path=args.results))
+
+    logger.info("\n" + format_report(report))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, sort_keys=True, indent=4, separators=(',', ': '))
@@ -14,11 +14,94 @@
 # DEALINGS IN THE SOFTWARE.
 #
 import json
+import logging
+import itertools
+import threading
 
+# Requests of 1 flow in _sample_rate are logged, with bodies cut after _max_body_length characters
+_sample_rate = 1
+_max_body_length = None
 
-def prepared_request_to_json(req):
+_flows = itertools.count()
+_local = threading.local()
+
+
+class FlowState():
+    """
+    State of the flow run by a virtual user: its id, whether its requests are logged, and the name its hops are
+    recorded under (see helpers.metrics). A thread keeps its state in a thread local; the asyncio virtual users,
+    which share a thread, own their state and give it to the async helpers.
+    """
+
+    def __init__(self, name=""):
+        """
+        :param name: name of the flow, e.g. saml.sp_saml1
+        """
+        self.name = name
+        self.flow_id = 0
+        self.sampled = True
+
+
+def flow_state(state=None):
+    """
+    :param state: optional FlowState, e.g. of an asyncio virtual user
+    :return: the state given, by default the state of the current thread
+    """
+    if state is not None:
+        return state
+    state = getattr(_local, 'state', None)
+    if state is None:
+        state = _local.state = FlowState()
+    return state
+
+
+def configure_request_logging(sample_rate=1, max_body_length=None):
+    """
+    Helper dedicated to configure the logging of the requests, e.g. during load runs
+    :param sample_rate: log the requests of 1 flow in sample_rate
+    :param max_body_length: maximum number of characters of the logged bodies, None to log them entirely
+    :return:
+    """
+    global _sample_rate, _max_body_length
+    _sample_rate = max(1, sample_rate)
+    _max_body_length = max_body_length
+
+
+def start_flow(state=None):
+    """
+    Helper dedicated to mark the start of a flow: its requests are logged if the flow is sampled.
+    The decision and the id of the flow hold for the current thread, or for the state given, until the next call.
+    :param state: optional FlowState, by default the state of the current thread
+    :return: id of the flow
+    """
+    state = flow_state(state)
+    flow_id = next(_flows)
+    state.flow_id = flow_id
+    state.sampled = flow_id % _sample_rate == 0
+    return flow_id
+
+
+def current_flow_id(state=None):
+    """
+    :param state: optional FlowState, by default the state of the current thread
+    :return: id of the flow started last by the current thread, or with the state given
+    """
+    return flow_state(state).flow_id
+
+
+def _truncate(body, max_length):
+    if max_length is None or body is None or len(body) <= max_length:
+        return body
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    return "{start}... ({n} more)".format(start=body[:max_length], n=len(body) - max_length)
+
+
+def prepared_request_to_json(req, max_body_length=None):
     """
     Helper dedicated to translate python request Request to a json format
+    :param req: request, prepared or not
+    :param max_body_length: maximum number of characters of the body, None for the whole body
     """
     json_request = dict()
 
@@ -35,20 +118,37 @@ def prepared_request_to_json(req):
             json_request['cookies'][key] = req.cookies[key]
 
     if hasattr(req, 'body'):
-        json_request['body'] = req.body
+        json_request['body'] = _truncate(req.body, max_body_length)
 
     return json_request
 
 
-def log_request(logger, req):
+class _LazyRequest():
     """
-    Helper dedicated to log a request
+    Request serialized only when the log record is formatted, i.e. when a handler emits it
     """
-    logger.debug(
-        json.dumps(
-            prepared_request_to_json(req),
+
+    def __init__(self, req, max_body_length):
+        self.req = req
+        self.max_body_length = max_body_length
+
+    def __str__(self):
+        return json.dumps(
+            prepared_request_to_json(self.req, self.max_body_length),
             sort_keys=True,
             indent=4,
-            separators=(',', ': ')
+            separators=(',', ': '),
+            default=str
         )
-    )
+
+
+def log_request(logger, req, state=None):
+    """
+    Helper dedicated to log a request.
+    Nothing is serialized when DEBUG is disabled or when the current flow is not sampled.
+    :param state: optional FlowState of the flow, by default the state of the current thread
+    """
+    if not logger.isEnabledFor(logging.DEBUG) or not flow_state(state).sampled:
+        return
+
+    logger.debug("%s", _LazyRequest(req, _max_body_length))
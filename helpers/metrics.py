@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Latency of the hops of the SSO flows, recorded in HDR-style histograms: the values are counted in
+# log-linear buckets, so that the memory of a histogram is bounded whatever the number of values and
+# the error on a percentile is bounded by the precision of the buckets.
+# Every thread records in its own histograms, which are merged when a snapshot is taken.
+
+import threading
+
+from helpers.logging import flow_state
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class Histogram():
+    """
+    Histogram of latencies counted in microseconds, with 2^precision_bits buckets per power of two
+    """
+
+    def __init__(self, precision_bits=7, highest_value=3600 * 10 ** 6):
+        """
+        :param precision_bits: the relative error of a recorded value is at most 1/2^precision_bits
+        :param highest_value: highest value in microseconds, higher values are counted as this one
+        """
+        self.precision_bits = precision_bits
+        self.highest_value = highest_value
+        self._sub_buckets = 1 << precision_bits
+        self._half = self._sub_buckets >> 1
+        self.counts = [0] * (self._index(highest_value) + 1)
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self._sub_buckets:
+            return value
+        shift = value.bit_length() - self.precision_bits
+        return shift * self._half + (value >> shift)
+
+    def _value(self, index):
+        """
+        Middle of the values counted in the bucket of the index
+        """
+        if index < self._sub_buckets:
+            return index
+        shift = index // self._half - 1
+        lowest = (index - shift * self._half) << shift
+        return lowest + ((1 << shift) >> 1)
+
+    def record(self, seconds):
+        """
+        Record a latency
+        :param seconds: latency in seconds
+        """
+        value = min(max(int(seconds * 1e6), 0), self.highest_value)
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Add the values of another histogram with the same precision
+        """
+        if other.precision_bits != self.precision_bits or other.highest_value != self.highest_value:
+            raise ValueError("Only histograms with the same precision can be merged")
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def copy(self):
+        return Histogram(self.precision_bits, self.highest_value).merge(self)
+
+    def percentile(self, p):
+        """
+        :param p: percentile, between 0 and 100
+        :return: the percentile in seconds, None for an empty histogram
+        """
+        if not self.total:
+            return None
+        rank = max(1, int(round(p / 100.0 * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(max(self._value(index), self.min), self.max) / 1e6
+        return self.max / 1e6
+
+    def summary(self):
+        """
+        :return: count, min, max and percentiles in seconds
+        """
+        summary = {
+            "count": self.total,
+            "min": self.min / 1e6 if self.min is not None else None,
+            "max": self.max / 1e6 if self.max is not None else None,
+        }
+        for p in PERCENTILES:
+            summary["p{p}".format(p=p)] = self.percentile(p)
+        return summary
+
+    def to_json(self):
+        """
+        Sparse representation of the histogram, e.g. to send it to another process
+        """
+        return {
+            "precision_bits": self.precision_bits,
+            "highest_value": self.highest_value,
+            "min": self.min,
+            "max": self.max,
+            "counts": {str(index): count for index, count in enumerate(self.counts) if count}
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        histogram = cls(data["precision_bits"], data["highest_value"])
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+            histogram.total += count
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class LatencyRecorder():
+    """
+    Histograms keyed by (flow, hop). Every thread records without lock in its own histograms,
+    they are merged by snapshot()
+    """
+
+    def __init__(self, precision_bits=7):
+        self.precision_bits = precision_bits
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = []
+
+    def _own_histograms(self):
+        histograms = getattr(self._local, 'histograms', None)
+        if histograms is None:
+            histograms = {}
+            self._local.histograms = histograms
+            with self._lock:
+                self._histograms.append(histograms)
+        return histograms
+
+    def record(self, flow, hop, seconds):
+        histograms = self._own_histograms()
+        histogram = histograms.get((flow, hop))
+        if histogram is None:
+            histogram = histograms[(flow, hop)] = Histogram(self.precision_bits)
+        histogram.record(seconds)
+
+    def snapshot(self):
+        """
+        Merge the histograms of all the threads
+        :return: dict of (flow, hop) to Histogram
+        """
+        merged = {}
+        with self._lock:
+            all_histograms = list(self._histograms)
+        for histograms in all_histograms:
+            for key, histogram in list(histograms.items()):
+                if key in merged:
+                    merged[key].merge(histogram)
+                else:
+                    merged[key] = histogram.copy()
+        return merged
+
+    def reset(self):
+        """
+        Forget the values recorded so far, by all the threads
+        """
+        with self._lock:
+            for histograms in self._histograms:
+                histograms.clear()
+
+
+_recorder = LatencyRecorder()
+
+
+def get_recorder():
+    """
+    :return: the recorder used by the helpers
+    """
+    return _recorder
+
+
+def set_flow(flow, state=None):
+    """
+    Name of the flow the hops recorded by the current thread belong to, e.g. saml.sp_saml1
+    :param state: optional helpers.logging.FlowState, by default the state of the current thread
+    """
+    flow_state(state).name = flow
+
+
+def current_flow(state=None):
+    """
+    :param state: optional helpers.logging.FlowState, by default the state of the current thread
+    :return: name of the flow of the current thread, or of the state given
+    """
+    return flow_state(state).name
+
+
+def record(hop, seconds, state=None):
+    """
+    Record the latency of a hop of the current flow
+    :param hop: name of the hop, e.g. idp.credentials_post
+    :param seconds: latency in seconds
+    :param state: optional helpers.logging.FlowState, by default the state of the current thread
+    """
+    _recorder.record(flow_state(state).name, hop, seconds)
+
+
+def summarize(histograms):
+    """
+    :param histograms: dict of (flow, hop) to Histogram, as returned by snapshot()
+    :return: dict of flow to dict of hop to the summary of its histogram
+    """
+    summaries = {}
+    for (flow, hop), histogram in sorted(histograms.items()):
+        summaries.setdefault(flow, {})[hop] = histogram.summary()
+    return summaries
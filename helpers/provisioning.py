@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Bulk creation of synthetic users in the test realm for the load runs. The users are sent in batches
+# to the partial import of the admin API, a few batches at a time through pooled connections, and
+# their credentials are written to the JSON file read by helpers.load --credentials.
+
+import sys
+import json
+import time
+import secrets
+import logging
+import argparse
+import threading
+import urllib3
+
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers.admin import KeycloakAdminClient
+from helpers.tokens import AdminTokenProvider
+from helpers.transport import Transport
+
+logging.basicConfig(
+    format='%(asctime)s %(name)s %(levelname)s %(message)s',
+    datefmt='%m/%d/%Y %I:%M:%S %p'
+)
+logger = logging.getLogger('acceptance-tool.helpers.provisioning')
+logger.setLevel(logging.INFO)
+
+# Attributes and realm roles checked by the policies of the clients of the test realm:
+# memberOf must contain CN=Guests (with role_test1) or CN=Domain Admins, some clients require role_test2
+PROFILES = {
+    "guests": {
+        "attributes": {"memberOf": ["CN=Guests,CN=Builtin,DC=CLOUDTRUST,DC=local"]},
+        "realmRoles": ["role_test1", "uma_authorization", "offline_access"]
+    },
+    "admins": {
+        "attributes": {"memberOf": ["CN=Domain Admins,CN=Users,DC=CLOUDTRUST,DC=local"]},
+        "realmRoles": ["role_test2", "uma_authorization", "offline_access"]
+    },
+    # accepted by all the clients
+    "all": {
+        "attributes": {"memberOf": ["CN=Guests,CN=Builtin,DC=CLOUDTRUST,DC=local;"
+                                    "CN=Domain Admins,CN=Users,DC=CLOUDTRUST,DC=local"]},
+        "realmRoles": ["role_test1", "role_test2", "uma_authorization", "offline_access"]
+    }
+}
+
+version = "1.0"
+prog_name = sys.argv[0]
+usage = """{pn} [options]
+Create synthetic users in the test realm and write their credentials for the load runs
+""".format(
+    pn=prog_name
+)
+parser = argparse.ArgumentParser(prog="{pn} {v}".format(pn=prog_name, v=version), usage=usage)
+
+parser.add_argument('--config-file', dest="config", help='Path to the config file: Ex : tests_config/dev.json',
+                    required=True)
+parser.add_argument('--users', dest="users", type=int, default=1000, help='Number of users to create')
+parser.add_argument('--prefix', dest="prefix", default="load_user", help='Prefix of the usernames')
+parser.add_argument('--start', dest="start", type=int, default=0, help='Index of the first user')
+parser.add_argument('--profile', dest="profile", choices=sorted(PROFILES), default="all",
+                    help='Attributes and roles of the users')
+parser.add_argument('--password', dest="password",
+                    help='Password of all the users, by default a random password per user')
+parser.add_argument('--batch-size', dest="batch_size", type=int, default=500,
+                    help='Number of users per partial import')
+parser.add_argument('--concurrency', dest="concurrency", type=int, default=4,
+                    help='Maximum number of partial imports sent at the same time')
+parser.add_argument('--if-exists', dest="if_exists", choices=["OVERWRITE", "SKIP", "FAIL"], default="OVERWRITE",
+                    help='What Keycloak does with the users that already exist, SKIP keeps their old password')
+parser.add_argument('--credentials-file', dest="credentials_file", default="load_users.json",
+                    help='Path of the JSON file of the credentials of the users')
+
+
+def user_representation(username, password, profile):
+    """
+    :return: representation of an enabled user with a password, in the format of the realm exports
+    """
+    return {
+        "username": username,
+        "enabled": True,
+        "emailVerified": True,
+        "firstName": "load",
+        "lastName": username,
+        "email": "{username}@load.test".format(username=username),
+        "attributes": profile["attributes"],
+        "credentials": [{"type": "password", "value": password, "temporary": False}],
+        "requiredActions": [],
+        "realmRoles": profile["realmRoles"],
+        "clientRoles": {"account": ["view-profile", "manage-account"]},
+        "groups": []
+    }
+
+
+def generate_credentials(count, prefix="load_user", start=0, password=None):
+    """
+    :return: list of {"username", "password"}
+    """
+    return [
+        {
+            "username": "{prefix}_{i:07d}".format(prefix=prefix, i=i),
+            "password": password or secrets.token_urlsafe(12)
+        }
+        for i in range(start, start + count)
+    ]
+
+
+class UserProvisioner():
+    """
+    Create users in the test realm with batched partial imports sent through the pooled admin client
+    """
+
+    def __init__(self, settings, profile="all", batch_size=500, concurrency=4, if_exists="OVERWRITE"):
+        """
+        :param settings: settings of the IDP, as loaded from the config file
+        :param profile: name of the attributes and roles of the users, see PROFILES
+        :param batch_size: number of users per partial import
+        :param concurrency: maximum number of partial imports sent at the same time
+        :param if_exists: OVERWRITE, SKIP or FAIL, for the users that already exist
+        """
+        self.idp = settings["idp"]
+        self.profile = PROFILES[profile]
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.if_exists = if_exists
+        self.transport = Transport.from_settings(settings, pool_maxsize=concurrency)
+        self.admin = KeycloakAdminClient(self.idp, self.transport, AdminTokenProvider(self.transport),
+                                         max_parallel=concurrency)
+
+        self._lock = threading.Lock()
+        self.counts = {"added": 0, "overwritten": 0, "skipped": 0, "failed": 0}
+
+    def _import_batch(self, credentials):
+        data = {
+            "ifResourceExists": self.if_exists,
+            "users": [user_representation(c["username"], c["password"], self.profile) for c in credentials]
+        }
+
+        # the admin client renews the token on 401 and waits when Keycloak answers 429 or 503
+        response = self.admin.partial_import(self.idp["test_realm"]["name"], data)
+
+        with self._lock:
+            if response.status_code == HTTPStatus.OK:
+                result = response.json()
+                for key in ("added", "overwritten", "skipped"):
+                    self.counts[key] += result.get(key, 0)
+            else:
+                self.counts["failed"] += len(credentials)
+                logger.error("partial import of {n} users failed with {status}: {text}".format(
+                    n=len(credentials), status=response.status_code, text=response.text[:200]))
+
+    def provision(self, credentials):
+        """
+        Create the users of the credentials
+        :param credentials: list of {"username", "password"}, e.g. from generate_credentials
+        :return: counts of the users added, overwritten, skipped and failed, the elapsed time and the users/s
+        """
+        batches = [credentials[i:i + self.batch_size] for i in range(0, len(credentials), self.batch_size)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for done, _ in enumerate(executor.map(self._import_batch, batches), 1):
+                elapsed = time.perf_counter() - start
+                logger.info("{done}/{total} batches, {rate:.1f} users/s".format(
+                    done=done, total=len(batches), rate=min(done * self.batch_size, len(credentials)) / elapsed))
+        elapsed = time.perf_counter() - start
+
+        self.transport.close()
+
+        created = self.counts["added"] + self.counts["overwritten"]
+        return {
+            **self.counts,
+            "elapsed": elapsed,
+            "users_per_second": created / elapsed if elapsed else 0
+        }
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.config) as json_data:
+            settings = json.load(json_data)
+    except IOError as e:
+        logger.debug(e)
+        raise IOError("Config file {path} not found".format(path=args.config))
+
+    # the IDPs of the test environments use self signed certificates
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    credentials = generate_credentials(args.users, args.prefix, args.start, args.password)
+
+    provisioner = UserProvisioner(settings, args.profile, args.batch_size, args.concurrency, args.if_exists)
+
+    logger.info("creating {n} users in {realm}".format(n=len(credentials), realm=settings["idp"]["test_realm"]["name"]))
+
+    result = provisioner.provision(credentials)
+
+    logger.info("{added} added, {overwritten} overwritten, {skipped} skipped, {failed} failed in {elapsed:.1f}s, "
+                "{ups:.1f} users/s".format(ups=result["users_per_second"], **result))
+
+    # the users that failed, or that were skipped with their old password, are not usable by the load runs
+    if result["failed"] or result["skipped"]:
+        logger.warning("the credentials file contains users that could not be created or updated")
+
+    with open(args.credentials_file, "w") as f:
+        json.dump(credentials, f, indent=4, separators=(',', ': '))
+
+    logger.info("credentials written to {path}".format(path=args.credentials_file))
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Import of the realms of the tests that only sends what changed since the last import.
+# The sha256 of every section of the canonical realm JSON is stored in an attribute of the realm:
+# - nothing changed: the realm is not imported again;
+# - only users, clients, roles, groups or identity providers changed: the changed sections are sent
+#   to the partial import, which overwrites the existing resources;
+# - anything else changed (settings, flows, components...): the realm is deleted and imported again.
+
+import json
+import time
+import hashlib
+
+from http import HTTPStatus
+from requests import Request
+
+import helpers.requests as req
+from helpers.logging import log_request
+
+HASH_ATTRIBUTE_PREFIX = "acceptanceTool.importHash."
+
+# sections of the realm representation accepted by the partial import
+PARTIAL_IMPORT_SECTIONS = ("users", "clients", "roles", "groups", "identityProviders")
+
+# section of all the other fields of the realm
+REALM_SECTION = "realm"
+
+CREATED = "created"
+UNCHANGED = "unchanged"
+UPDATED = "updated"
+RECREATED = "recreated"
+
+
+def canonical_json(value):
+    """
+    JSON with sorted keys and without whitespace, so that equal values have equal hashes
+    """
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def section_hashes(realm_representation):
+    """
+    :param realm_representation: realm representation, as a dict
+    :return: dict of section to the sha256 of its canonical JSON
+    """
+    realm = dict(realm_representation)
+    attributes = {key: value for key, value in realm.get("attributes", {}).items()
+                  if not key.startswith(HASH_ATTRIBUTE_PREFIX)}
+    if attributes:
+        realm["attributes"] = attributes
+    else:
+        realm.pop("attributes", None)
+
+    hashes = {}
+    for section in PARTIAL_IMPORT_SECTIONS:
+        value = realm.pop(section, None)
+        hashes[section] = hashlib.sha256(canonical_json(value).encode('utf-8')).hexdigest()
+    hashes[REALM_SECTION] = hashlib.sha256(canonical_json(realm).encode('utf-8')).hexdigest()
+    return hashes
+
+
+def hash_attributes(hashes):
+    return {HASH_ATTRIBUTE_PREFIX + section: digest for section, digest in hashes.items()}
+
+
+def import_realm_if_changed(logger, admin, realm_representation):
+    """
+    Helper dedicated to import a realm only if it changed since its last import
+    :param logger:
+    :param admin: KeycloakAdminClient of the identity provider
+    :param realm_representation: representation of the realm, as a JSON string
+    :return: what was done (created, unchanged, updated or recreated) and the response of the last request
+    """
+    realm = json.loads(realm_representation)
+    realm_id = realm["realm"]
+    hashes = section_hashes(realm)
+
+    def create():
+        return admin.create_realm({**realm, "attributes": {**realm.get("attributes", {}), **hash_attributes(hashes)}})
+
+    response = admin.request('GET', "admin/realms/{realm}".format(realm=realm_id), "admin.realm_get")
+
+    if response.status_code == HTTPStatus.NOT_FOUND:
+        logger.info("realm {realm} does not exist, importing it".format(realm=realm_id))
+        return CREATED, create()
+
+    response.raise_for_status()
+
+    attributes = response.json().get("attributes") or {}
+    changed = [section for section, digest in hashes.items()
+               if attributes.get(HASH_ATTRIBUTE_PREFIX + section) != digest]
+
+    if not changed:
+        logger.info("realm {realm} unchanged, not imported".format(realm=realm_id))
+        return UNCHANGED, response
+
+    if REALM_SECTION in changed:
+        logger.info("settings of realm {realm} changed, importing it again".format(realm=realm_id))
+        response = admin.delete_realm(realm_id)
+        response.raise_for_status()
+        return RECREATED, create()
+
+    logger.info("{sections} of realm {realm} changed, importing them".format(sections=", ".join(changed),
+                                                                           realm=realm_id))
+    data = {"ifResourceExists": "OVERWRITE"}
+    for section in changed:
+        if realm.get(section) is not None:
+            data[section] = realm[section]
+
+    response = admin.partial_import(realm_id, data)
+    response.raise_for_status()
+
+    # the hashes are stored once the import succeeded
+    response = admin.update_realm(realm_id, {"realm": realm_id,
+                                             "attributes": {**attributes, **hash_attributes(hashes)}})
+    return UPDATED, response
+
+
+def wait_for_realm(logger, s, idp_scheme, idp_port, idp_ip, realm_id, timeout=60, interval=0.5):
+    """
+    Helper dedicated to wait until the public endpoint of a realm answers, e.g. after its import
+    :param logger:
+    :param s: session s
+    :param idp_scheme: identity provider http scheme
+    :param idp_port: identity provider port
+    :param idp_ip: identity provider ip
+    :param realm_id: id of the realm
+    :param timeout: seconds after which TimeoutError is raised
+    :param interval: seconds between two attempts
+    :return: seconds waited
+    """
+    req_realm_info = Request(
+        method='GET',
+        url="{scheme}://{ip}:{port}/auth/realms/{realm}".format(
+            scheme=idp_scheme,
+            ip=idp_ip,
+            port=idp_port,
+            realm=realm_id
+        )
+    )
+
+    prepared_request = req_realm_info.prepare()
+
+    start = time.monotonic()
+    while True:
+        log_request(logger, req_realm_info)
+
+        try:
+            response = req.send(s, prepared_request, "idp.realm_info")
+            logger.debug(response.status_code)
+            if response.status_code == HTTPStatus.OK:
+                return time.monotonic() - start
+        except OSError as e:
+            logger.debug(e)
+
+        if time.monotonic() - start > timeout:
+            raise TimeoutError("realm {realm} not ready after {t}s".format(realm=realm_id, t=timeout))
+        time.sleep(interval)
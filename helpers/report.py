@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Report of a run from the files written by helpers.results: throughput over time, error rates and
+# latency percentiles per SP, per hop and per protocol. All the statistics are computed with NumPy
+# operations over whole columns, without a Python loop over the requests.
+
+import os
+import sys
+import html
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from helpers.metrics import PERCENTILES
+from helpers.results import load_results
+
+logging.basicConfig(
+    format='%(asctime)s %(name)s %(levelname)s %(message)s',
+    datefmt='%m/%d/%Y %I:%M:%S %p'
+)
+logger = logging.getLogger('acceptance-tool.helpers.report')
+logger.setLevel(logging.INFO)
+
+version = "1.0"
+prog_name = sys.argv[0]
+usage = """{pn} [options]
+Build the HTML and JSON report of a run from its results files
+""".format(
+    pn=prog_name
+)
+parser = argparse.ArgumentParser(prog="{pn} {v}".format(pn=prog_name, v=version), usage=usage)
+
+parser.add_argument('--results', dest="results", nargs="+", required=True,
+                    help='Paths of the results files of the run, e.g. the files of its workers')
+parser.add_argument('--config-file', dest="config", help='Path to the config file of the tested environment: '
+                                                         'Ex : tests_config/dev.json', required=True)
+parser.add_argument('--interval', dest="interval", type=float, default=1,
+                    help='Seconds per point of the throughput over time')
+parser.add_argument('--output-dir', dest="output_dir",
+                    help='Directory of the reports, created if needed, by default the directory of the config file')
+
+
+def is_error(status):
+    """
+    :param status: array of HTTP status codes, 0 when no response was received
+    :return: boolean array, True for the requests without response or answered with 4xx/5xx
+    """
+    return (status == 0) | (status >= 400)
+
+
+def grouped_stats(keys, names, durations, errors):
+    """
+    Count, errors and latency percentiles of the requests of every group
+    :param keys: array of the group code of every request
+    :param names: names of the group codes
+    :param durations: array of the duration of every request, in seconds
+    :param errors: boolean array of the failed requests
+    :return: dict of group name to its statistics, latencies in seconds
+    """
+    n = len(names)
+    counts = np.bincount(keys, minlength=n)
+    error_counts = np.bincount(keys, weights=errors, minlength=n)
+    sums = np.bincount(keys, weights=durations, minlength=n)
+
+    # sorted by group then by duration, the requests of a group are contiguous and ordered
+    order = np.lexsort((durations, keys))
+    sorted_durations = durations[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    last = np.maximum(counts - 1, 0)
+
+    percentiles = {}
+    for p in PERCENTILES:
+        # nearest rank
+        rank = np.clip(np.ceil(p / 100.0 * counts).astype(np.int64) - 1, 0, last)
+        percentiles[p] = sorted_durations[np.minimum(starts + rank, len(sorted_durations) - 1)] \
+            if len(sorted_durations) else np.zeros(n)
+
+    stats = {}
+    for code, name in enumerate(names):
+        count = int(counts[code])
+        if not count:
+            continue
+        stats[name] = {
+            "count": count,
+            "errors": int(error_counts[code]),
+            "error_rate": float(error_counts[code] / count),
+            "mean": float(sums[code] / count),
+            "min": float(sorted_durations[starts[code]]),
+            "max": float(sorted_durations[starts[code] + last[code]]),
+        }
+        for p in PERCENTILES:
+            stats[name]["p{p}".format(p=p)] = float(percentiles[p][code])
+    return stats
+
+
+def throughput(timestamps, flow_ids, errors, interval):
+    """
+    Requests, errors and flows ended per interval of the run
+    :return: dict of the start of the intervals (seconds from the start of the run) and of the counts per second
+    """
+    start = timestamps.min()
+    bins = ((timestamps - start) // interval).astype(np.int64)
+    n = int(bins.max()) + 1
+
+    # a flow ends with its last request
+    order = np.lexsort((timestamps, flow_ids))
+    sorted_ids = flow_ids[order]
+    is_last = np.append(sorted_ids[1:] != sorted_ids[:-1], True)
+    flow_bins = bins[order][is_last]
+
+    return {
+        "time": (np.arange(n) * interval).tolist(),
+        "requests_per_second": (np.bincount(bins, minlength=n) / interval).tolist(),
+        "errors_per_second": (np.bincount(bins, weights=errors, minlength=n) / interval).tolist(),
+        "flows_per_second": (np.bincount(flow_bins, minlength=n) / interval).tolist()
+    }
+
+
+def build_report(results, interval=1):
+    """
+    :param results: columns of a run, as returned by helpers.results.load_results
+    :param interval: seconds per point of the throughput over time
+    :return: report of the run
+    """
+    timestamps = results["timestamp"]
+    durations = results["duration"]
+    errors = is_error(results["status"])
+
+    report = {
+        "requests": int(len(timestamps)),
+        "flows": int(len(np.unique(results["flow_id"]))),
+        "errors": int(errors.sum()),
+    }
+    if not len(timestamps):
+        return report
+
+    # the flows are named protocol.sp, e.g. saml.sp_saml1
+    protocols = sorted({flow.partition(".")[0] for flow in results["flows"]})
+    sps = sorted({flow.partition(".")[2] for flow in results["flows"]})
+    flow_protocol = np.array([protocols.index(flow.partition(".")[0]) for flow in results["flows"]], dtype=np.int64)
+    flow_sp = np.array([sps.index(flow.partition(".")[2]) for flow in results["flows"]], dtype=np.int64)
+
+    flows = results["flow"].astype(np.int64)
+
+    report.update({
+        "start": float(timestamps.min()),
+        "end": float((timestamps + durations).max()),
+        "interval": interval,
+        "throughput": throughput(timestamps, results["flow_id"], errors, interval),
+        "by_protocol": grouped_stats(flow_protocol[flows], protocols, durations, errors),
+        "by_sp": grouped_stats(flow_sp[flows], sps, durations, errors),
+        "by_hop": grouped_stats(results["hop"].astype(np.int64), results["hops"], durations, errors)
+    })
+    report["duration"] = report["end"] - report["start"]
+    return report
+
+
+def _svg_chart(series, width=800, height=200):
+    """
+    Line chart of the throughput over time, as inline SVG
+    """
+    times = series["time"]
+    lines = []
+    top = max([max(series[name]) for name in ("requests_per_second", "flows_per_second", "errors_per_second")] + [1])
+    right = max(times[-1], 1)
+    for name, color in (("requests_per_second", "#1f77b4"), ("flows_per_second", "#2ca02c"),
+                        ("errors_per_second", "#d62728")):
+        points = " ".join("{x:.1f},{y:.1f}".format(x=t / right * width, y=height - v / top * height)
+                          for t, v in zip(times, series[name]))
+        lines.append('<polyline fill="none" stroke="{c}" points="{p}"/>'.format(c=color, p=points))
+    return ('<svg width="{w}" height="{h}" viewBox="0 0 {w} {h}">{lines}</svg>'
+            '<p>max {top:.1f}/s: <span style="color:#1f77b4">requests</span>, <span style="color:#2ca02c">flows'
+            '</span>, <span style="color:#d62728">errors</span></p>').format(w=width, h=height, lines="".join(lines),
+                                                                             top=top)
+
+
+def _html_table(title, stats):
+    columns = ["count", "errors", "error rate", "mean"] + ["p{p}".format(p=p) for p in PERCENTILES] + ["max"]
+    rows = []
+    for name, s in stats.items():
+        cells = [str(s["count"]), str(s["errors"]), "{r:.2%}".format(r=s["error_rate"])]
+        cells += ["{v:.1f}".format(v=s[key] * 1000) for key in ["mean"] + ["p{p}".format(p=p) for p in PERCENTILES] +
+                  ["max"]]
+        rows.append("<tr><td>{name}</td>{cells}</tr>".format(
+            name=html.escape(name), cells="".join("<td>{c}</td>".format(c=c) for c in cells)))
+    return "<h2>{title}</h2><table><tr><th></th>{head}</tr>{rows}</table>".format(
+        title=html.escape(title),
+        head="".join("<th>{c}</th>".format(c=c) for c in columns),
+        rows="".join(rows)
+    )
+
+
+def render_html(report):
+    """
+    Static HTML page of a report, latencies in ms
+    """
+    environment = report.get("environment", {})
+    body = ["<h1>Run of {start} on {idp}</h1>".format(
+        start=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(report.get("start", 0))),
+        idp=html.escape(str(environment.get("idp", "")))
+    ), "<p>config {config}, {requests} requests, {flows} flows, {errors} errors in {duration:.1f}s</p>".format(
+        config=html.escape(str(environment.get("config", ""))),
+        requests=report["requests"],
+        flows=report["flows"],
+        errors=report["errors"],
+        duration=report.get("duration", 0)
+    )]
+    if "throughput" in report:
+        body.append("<h2>Throughput</h2>" + _svg_chart(report["throughput"]))
+        body.append(_html_table("Per protocol (ms)", report["by_protocol"]))
+        body.append(_html_table("Per SP (ms)", report["by_sp"]))
+        body.append(_html_table("Per hop (ms)", report["by_hop"]))
+    return ("<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Run report</title><style>"
+            "body{font-family:sans-serif} table{border-collapse:collapse} td,th{border:1px solid #ccc;"
+            "padding:2px 8px;text-align:right}</style></head><body>" + "\n".join(body) + "</body></html>")
+
+
+def write_report(report, directory, name):
+    """
+    Write the JSON and HTML reports
+    :return: paths of the JSON and HTML reports
+    """
+    json_path = os.path.join(directory, name + ".json")
+    html_path = os.path.join(directory, name + ".html")
+    with open(json_path, "w") as f:
+        json.dump(report, f, sort_keys=True, indent=4, separators=(',', ': '))
+    with open(html_path, "w") as f:
+        f.write(render_html(report))
+    return json_path, html_path
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.config) as json_data:
+            settings = json.load(json_data)
+    except IOError as e:
+        logger.debug(e)
+        raise IOError("Config file {path} not found".format(path=args.config))
+
+    started = time.perf_counter()
+    results = load_results(*args.results)
+    report = build_report(results, args.interval)
+    logger.info("{rows} requests summarized in {s:.2f}s".format(rows=report["requests"],
+                                                                 s=time.perf_counter() - started))
+
+    report["environment"] = {"config": args.config, "idp": settings["idp"]["ip"], "results": args.results}
+
+    # the reports are archived next to the config of the tested environment
+    name = "{config}.report.{start}".format(
+        config=os.path.splitext(os.path.basename(args.config))[0],
+        start=time.strftime("%Y%m%d-%H%M%S", time.localtime(report.get("start", time.time())))
+    )
+    directory = args.output_dir or os.path.dirname(os.path.abspath(args.config))
+    os.makedirs(directory, exist_ok=True)
+
+    for path in write_report(report, directory, name):
+        logger.info("report written to {path}".format(path=path))
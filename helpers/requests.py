@@ -13,14 +13,46 @@
 #
 
 import json
+import time
 
+import helpers.metrics as metrics
+import helpers.results as results
 from helpers.logging import log_request
+from helpers.forms import extract_form, extract_social_providers
+from helpers.saml import parse_redirect_url
 
-from bs4 import BeautifulSoup
 from requests import Request
+from requests.exceptions import TooManyRedirects
 from http import HTTPStatus
 
 
+def send(s, prepared_request, hop, allow_redirects=True):
+    """
+    Helper dedicated to send a prepared request, to record the latency of the hop and to stream
+    the request to the results writer, if any
+    :param s: session s
+    :param prepared_request: prepared request
+    :param hop: name of the hop, e.g. idp.credentials_post
+    :param allow_redirects: follow the redirects or not
+    :return: response
+    """
+    timestamp = time.time()
+    start = time.perf_counter()
+
+    try:
+        response = s.send(prepared_request, verify=False, allow_redirects=allow_redirects)
+    except Exception:
+        results.record_request(hop, timestamp, time.perf_counter() - start, 0, 0)
+        raise
+
+    duration = time.perf_counter() - start
+
+    metrics.record(hop, duration)
+    results.record_request(hop, timestamp, duration, response.status_code, len(response.content))
+
+    return response
+
+
 def access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path):
     """
     Helper dedicated to access the service provider in order to obtain the
@@ -56,7 +88,7 @@ def access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path):
 
     log_request(logger, req_get_sp_page)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "wsfed.sp_access", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -66,7 +98,9 @@ def access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path):
 def access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path, idp_ip, idp_port):
     """
     Helper dedicated to access the service provider in order to obtain the
-    endpoint of the IDP, where the connection protocol is SAML
+    endpoint of the IDP, where the connection protocol is SAML. The SP sends its SAMLRequest either in an auto-post
+    form (HTTP-POST binding) or in the query string of a redirect to the IDP (HTTP-Redirect binding); the request
+    to the IDP is recorded as the saml.idp_redirect hop, or saml.idp_redirect_get with the HTTP-Redirect binding
     :param logger:
     :param s: session s
     :param header: header used for the request
@@ -101,44 +135,61 @@ def access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path, idp_ip
 
     log_request(logger, req_get_sp_page)
 
-    response = s.send(prepared_request, verify=False)
+    response = send(s, prepared_request, "saml.sp_access", allow_redirects=False)
+
+    # the redirects of the SP itself are followed, up to the one that carries the SAMLRequest to the IDP
+    redirects = 0
+    while response.is_redirect and parse_redirect_url(response.headers['Location']) is None:
+        redirects += 1
+        if redirects > s.max_redirects:
+            raise TooManyRedirects("Exceeded {max} redirects".format(max=s.max_redirects), response=response)
+        prepared_request = next(s.resolve_redirects(response, response.request, verify=False, yield_requests=True))
+        response = send(s, prepared_request, "saml.sp_access", allow_redirects=False)
 
     logger.debug(response.status_code)
 
     # store the session cookie
     session_cookie = response.cookies
 
-    # Response returns a form that requests a post with RelayState and SAMLRequest as input
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    form = soup.body.form
-    url_form = form.get('action')
-    method_form = form.get('method')
-    inputs = form.find_all('input')
-
-    # Do a SAML request to the identity provider
-    saml_request = {}
-    for input in inputs:
-        saml_request[input.get('name')] = input.get('value')
-
     header_redirect_idp = {
         **header,
         'Host': "{ip}:{port}".format(ip=idp_ip, port=idp_port),
         'Referer': "{ip}:{port}".format(ip=sp_ip, port=sp_port)
     }
 
-    req_idp_saml_request = Request(
-        method=method_form,
-        url="{url}".format(url=url_form),
-        data=saml_request,
-        headers=header_redirect_idp
-    )
+    if response.is_redirect:
+        # HTTP-Redirect binding: the SAMLRequest, and its signature if any, are in the query string
+        req_idp_saml_request = Request(
+            method='GET',
+            url=response.headers['Location'],
+            headers=header_redirect_idp
+        )
+        hop = "saml.idp_redirect_get"
+    else:
+        # Response returns a form that requests a post with RelayState and SAMLRequest as input
+        form = extract_form(response.content)
+        url_form = form.get('action')
+        method_form = form.get('method')
+        inputs = form.find_all('input')
+
+        # Do a SAML request to the identity provider
+        saml_request = {}
+        for input in inputs:
+            saml_request[input.get('name')] = input.get('value')
+
+        req_idp_saml_request = Request(
+            method=method_form,
+            url="{url}".format(url=url_form),
+            data=saml_request,
+            headers=header_redirect_idp
+        )
+        hop = "saml.idp_redirect"
 
     prepared_request = req_idp_saml_request.prepare()
 
     log_request(logger, req_idp_saml_request)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, hop, allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -184,7 +235,7 @@ def access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_schem
 
     log_request(logger, req_sp_with_token)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "sp.acs_post", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -212,7 +263,7 @@ def access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_schem
 
     log_request(logger, req_get_sp_page_final)
 
-    response = s.send(prepared_request, verify=False)
+    response = send(s, prepared_request, "sp.final_get")
 
     logger.debug(response.status_code)
 
@@ -241,7 +292,7 @@ def redirect_to_idp(logger, s, redirect_url, header, cookie):
 
     log_request(logger, req_get_keycloak)
 
-    response = s.send(prepared_request, verify=False)
+    response = send(s, prepared_request, "idp.redirect_get")
 
     logger.debug(response.status_code)
 
@@ -281,7 +332,7 @@ def send_credentials_to_idp(logger, s, header, idp_ip, idp_port, redirect_url, u
 
     log_request(logger, req_login_idp)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "idp.credentials_post", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -319,7 +370,7 @@ def login_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path, idp_use
 
     log_request(logger, req_get_idp_page)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "idp.account_access", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -337,15 +388,13 @@ def login_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path, idp_use
 
     log_request(logger, req_idp_redirect)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "idp.login_page", allow_redirects=False)
 
     logger.debug(response.status_code)
 
     keycloak_cookie = response.cookies
 
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    form = soup.body.form
+    form = extract_form(response.content)
 
     url_form = form.get('action')
     method_form = form.get('method')
@@ -372,7 +421,7 @@ def login_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path, idp_use
 
     log_request(logger, req_login_idp)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "idp.credentials_post", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -391,7 +440,7 @@ def login_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path, idp_use
 
     log_request(logger, req_idp_redirect)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "idp.login_redirect", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -410,7 +459,7 @@ def login_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path, idp_use
 
     log_request(logger, req_idp_redirect)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "idp.account_page", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -435,7 +484,7 @@ def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path
 
     log_request(logger, req_get_idp_page)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "broker.account_access", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -453,27 +502,23 @@ def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path
 
     log_request(logger, req_idp_redirect)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "broker.login_page", allow_redirects=False)
 
     logger.debug(response.status_code)
 
     keycloak_cookie = response.cookies
 
     # In the login page we can choose to login with the external IDP
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    div = soup.find("div", {"id": "kc-social-providers"})
+    providers = extract_social_providers(response.content)
 
-    assert div is not None
+    assert providers is not None
 
     # we can have several idp external; choose the one needed for the test
-    all_li = div.find_all('li')
-    for li in all_li:
-        if li.span.text == idp_broker:
-            external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + li.a[
-                'href']
+    external_idp_path = providers.get(idp_broker)
 
-    assert external_idp_url is not None
+    assert external_idp_path is not None
+
+    external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + external_idp_path
 
     # Select to login with the external IDP
     req_choose_external_idp = Request(
@@ -487,13 +532,12 @@ def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path
 
     log_request(logger, req_choose_external_idp)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "broker.provider_choice", allow_redirects=False)
 
     logger.debug(response.status_code)
 
     # get the HTTP binding response with the url to the external IDP
-    soup = BeautifulSoup(response.content, 'html.parser')
-    form = soup.body.form
+    form = extract_form(response.content)
 
     url_form = form.get('action')
     inputs = form.find_all('input')
@@ -531,7 +575,7 @@ def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path
 
     log_request(logger, req_redirect_external_idp)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "external.authn_request", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -543,9 +587,7 @@ def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path
     else:
         keycloak_cookie_ext = response.cookies
 
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    form = soup.body.form
+    form = extract_form(response.content)
 
     url_form = form.get('action')
     method_form = form.get('method')
@@ -569,8 +611,7 @@ def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path
     credentials_cookie = response.cookies
 
     # get the HTTP binding response with the url to the broker IDP
-    soup = BeautifulSoup(response.content, 'html.parser')
-    form = soup.body.form
+    form = extract_form(response.content)
 
     url_form = form.get('action')
     inputs = form.find_all('input')
@@ -592,7 +633,7 @@ def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path
 
     log_request(logger, req_token_from_external_idp)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "broker.token_post", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -611,7 +652,7 @@ def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path
 
     log_request(logger, req_idp_redirect)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "broker.login_redirect", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -634,7 +675,7 @@ def login_external_idp(logger, s, header, idp_ip, idp_port, idp_scheme, idp_path
 
         log_request(logger, req_idp_redirect)
 
-        response = s.send(prepared_request, verify=False, allow_redirects=False)
+        response = send(s, prepared_request, "broker.account_page", allow_redirects=False)
 
         logger.debug(response.status_code)
 
@@ -653,9 +694,7 @@ def broker_fill_in_form(logger, s, response, header, cookie, new_cookie, idp_bro
     :param idp_broker:
     :return:
     """
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    form = soup.find("form", {"id": idp_form_id})
+    form = extract_form(response.content, form_id=idp_form_id)
     url_form = form.get('action')
     method_form = form.get('method')
     inputs = form.find_all('input')
@@ -686,7 +725,7 @@ def broker_fill_in_form(logger, s, response, header, cookie, new_cookie, idp_bro
 
     log_request(logger, req_send_user_data)
 
-    response = s.send(prepared_request, verify=False, allow_redirects=False)
+    response = send(s, prepared_request, "broker.profile_post", allow_redirects=False)
 
     logger.debug(response.status_code)
 
@@ -696,17 +735,17 @@ def broker_fill_in_form(logger, s, response, header, cookie, new_cookie, idp_bro
     return response
 
 
-def get_access_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id):
+def request_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id):
     """
-    Helper dedicated to obtain the access token for Keycloak
+    Helper dedicated to send a request to the token endpoint of Keycloak
     :param logger:
     :param s: session s
-    :param data: payload of the request
+    :param data: payload of the request, e.g. a password or a refresh_token grant
     :param idp_scheme: identity provider http scheme
     :param idp_port: identity provider port
     :param idp_ip: identity provider ip
     :param realm_id: id of the realm
-    :return:
+    :return: response, whose JSON holds the tokens and their lifetimes
     """
     req_get_access_token = Request(
         method='POST',
@@ -723,15 +762,60 @@ def get_access_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id):
 
     log_request(logger, req_get_access_token)
 
-    response = s.send(prepared_request, verify=False)
+    response = send(s, prepared_request, "admin.token")
 
     logger.debug(response.status_code)
 
+    return response
+
+
+def get_access_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id):
+    """
+    Helper dedicated to obtain the access token for Keycloak
+    :param logger:
+    :param s: session s
+    :param data: payload of the request
+    :param idp_scheme: identity provider http scheme
+    :param idp_port: identity provider port
+    :param idp_ip: identity provider ip
+    :param realm_id: id of the realm
+    :return:
+    """
+    response = request_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id)
+
     access_token = json.loads(response.text)['access_token']
 
     return access_token
 
 
+def get_admin_header(idp_scheme, idp_ip, idp_port, access_token):
+    """
+    Helper dedicated to build the header of the requests to the admin API of Keycloak
+    :param access_token: access token of an admin, see helpers.tokens.AdminTokenProvider.admin_token
+    """
+    header = {
+        'Accept': "application/json,text/plain, */*",
+        'Accept-Encoding': "gzip, deflate",
+        'Accept-Language': "en-US,en;q=0.5",
+        'User-Agent': "Mozilla/5.0 (X11; Fedora; Linux x86_64; rv:59.0) Gecko/20100101 Firefox/59.0",
+        'Connection': "keep-alive",
+        'Content-Type': "application/json",
+        'Referer': "{scheme}://{ip}:{port}/auth/admin/master/console/".format(
+            scheme=idp_scheme,
+            ip=idp_ip,
+            port=idp_port
+        ),
+        'Host': "{ip}:{port}".format(
+            ip=idp_ip,
+            port=idp_port
+        ),
+        "DNT": "1",
+        'Authorization': 'Bearer ' + access_token
+    }
+
+    return header
+
+
 def get_header():
 
     header = {
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Results of every request sent by the helpers, streamed to an append-only file during long runs.
+# The rows are buffered in typed arrays, one per column, and written as a chunk of columns every
+# chunk_rows rows or flush_interval seconds. A chunk is:
+#
+#     magic | header length | data length | crc32 | JSON header | column data
+#
+# The JSON header gives the number of rows, the type and size of every column and the names of the hops
+# and flows coded in the hop and flow columns. A chunk cut by a crash fails its length or crc check and
+# is ignored when the file is read, the chunks before it stay readable; the file is truncated after its last
+# complete chunk before a later run appends to it.
+
+import os
+import sys
+import json
+import time
+import zlib
+import array
+import struct
+import logging
+import threading
+
+import helpers.metrics as metrics
+from helpers.logging import current_flow_id
+
+logger = logging.getLogger('acceptance-tool.helpers.results')
+
+MAGIC = b"ATRC"
+_PREFIX = struct.Struct("<4sIII")
+
+# name, array typecode, numpy dtype
+COLUMNS = (
+    ("timestamp", "d", "<f8"),
+    ("duration", "d", "<f8"),
+    ("status", "H", "<u2"),
+    ("bytes", "I", "<u4"),
+    ("flow_id", "Q", "<u8"),
+    ("hop", "H", "<u2"),
+    ("flow", "H", "<u2"),
+)
+
+_writer = None
+
+
+class ResultsWriter():
+    """
+    Append-only columnar file of the requests of a run. Safe to share between threads.
+    """
+
+    def __init__(self, path, chunk_rows=65536, flush_interval=10):
+        """
+        :param path: path of the results file, appended to if it exists, after its last complete chunk
+        :param chunk_rows: number of rows buffered before a chunk is written
+        :param flush_interval: maximum number of seconds the rows stay buffered
+        """
+        for name, typecode, dtype in COLUMNS:
+            if array.array(typecode).itemsize != int(dtype[2:]):
+                raise ValueError("Column {name} has no {size} bytes array type".format(name=name, size=dtype[2:]))
+
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.rows = 0
+        self.chunks = 0
+
+        self._lock = threading.Lock()
+        self._file = self._open(path)
+        self._reset()
+
+    @staticmethod
+    def _open(path):
+        if not os.path.exists(path):
+            return open(path, "wb")
+
+        f = open(path, "r+b")
+        if f.read(len(MAGIC)) not in (b"", MAGIC):
+            f.close()
+            raise ValueError("{path} is not a results file".format(path=path))
+        f.seek(0)
+
+        # the chunks appended after a chunk cut by a crash would never be read
+        chunks = sum(1 for _ in _chunks(f, path))
+        end = f.tell()
+        size = f.seek(0, os.SEEK_END)
+        if end < size:
+            # only a chunk cut after complete ones is surely the end of a crashed run
+            if not chunks:
+                f.close()
+                raise ValueError("{path} has no complete chunk".format(path=path))
+            logger.warning("{path}: {size} bytes after the last complete chunk truncated".format(path=path,
+                                                                                             size=size - end))
+            f.truncate(end)
+            f.seek(end)
+        return f
+
+    def _reset(self):
+        self._columns = [array.array(typecode) for _, typecode, _ in COLUMNS]
+        self._codes = ({}, {})
+        self._flushed_at = time.monotonic()
+
+    def _code(self, table, name):
+        code = table.get(name)
+        if code is None:
+            code = table[name] = len(table)
+        return code
+
+    def record(self, hop, timestamp, duration, status, size, flow_id=0, flow=""):
+        """
+        Append the row of a request
+        :param hop: name of the hop, e.g. idp.credentials_post
+        :param timestamp: epoch seconds at which the request was sent
+        :param duration: seconds until the response was read
+        :param status: HTTP status code, 0 when no response was received
+        :param size: number of bytes of the response body
+        :param flow_id: id of the flow the request belongs to
+        :param flow: name of the flow, e.g. saml.sp_saml1
+        """
+        with self._lock:
+            hops, flows = self._codes
+            row = (timestamp, duration, status, size, flow_id, self._code(hops, hop), self._code(flows, flow))
+            for column, value in zip(self._columns, row):
+                column.append(value)
+
+            if (len(self._columns[0]) >= self.chunk_rows or
+                    time.monotonic() - self._flushed_at >= self.flush_interval):
+                self._write_chunk()
+
+    def _write_chunk(self):
+        rows = len(self._columns[0])
+        if not rows:
+            self._flushed_at = time.monotonic()
+            return
+
+        hops, flows = self._codes
+        data = []
+        for column in self._columns:
+            if sys.byteorder == "big":
+                column.byteswap()
+            data.append(column.tobytes())
+
+        header = json.dumps({
+            "rows": rows,
+            "columns": [[name, dtype, len(column)] for (name, _, dtype), column in zip(COLUMNS, data)],
+            "hops": sorted(hops, key=hops.get),
+            "flows": sorted(flows, key=flows.get)
+        }).encode('utf-8')
+        data = b"".join(data)
+
+        # the chunk is written in a single call so that a crash cuts at most the last one
+        self._file.write(_PREFIX.pack(MAGIC, len(header), len(data), zlib.crc32(header + data)) + header + data)
+        self._file.flush()
+
+        self.rows += rows
+        self.chunks += 1
+        self._reset()
+
+    def flush(self):
+        """
+        Write the buffered rows
+        """
+        with self._lock:
+            self._write_chunk()
+
+    def close(self):
+        with self._lock:
+            self._write_chunk()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def set_results_writer(writer):
+    """
+    Helper dedicated to stream the requests sent by the helpers to a ResultsWriter, None to stop
+    """
+    global _writer
+    _writer = writer
+
+
+def record_request(hop, timestamp, duration, status, size, state=None):
+    """
+    Helper dedicated to record a request of the current flow, when a ResultsWriter is set
+    :param hop: name of the hop, e.g. idp.credentials_post
+    :param timestamp: epoch seconds at which the request was sent
+    :param duration: seconds until the response was read
+    :param status: HTTP status code, 0 when no response was received
+    :param size: number of bytes of the response body
+    :param state: optional helpers.logging.FlowState of the flow, by default the state of the current thread
+    """
+    writer = _writer
+    if writer is None:
+        return
+    writer.record(hop, timestamp, duration, status, size, current_flow_id(state), metrics.current_flow(state))
+
+
+def _chunks(f, path):
+    # reads the complete chunks of f and leaves f at the end of the last one
+    while True:
+        start = f.tell()
+        prefix = f.read(_PREFIX.size)
+        if not prefix:
+            return
+        if len(prefix) < _PREFIX.size:
+            logger.warning("{path}: incomplete chunk ignored".format(path=path))
+            break
+        magic, header_length, data_length, crc = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            logger.warning("{path}: corrupted chunk, the rest of the file is ignored".format(path=path))
+            break
+        header = f.read(header_length)
+        data = f.read(data_length)
+        if len(header) < header_length or len(data) < data_length or zlib.crc32(header + data) != crc:
+            logger.warning("{path}: incomplete chunk ignored".format(path=path))
+            break
+        yield header, data
+    f.seek(start)
+
+
+def read_chunks(path):
+    """
+    Read the complete chunks of a results file; a chunk cut by a crash and what follows it are ignored
+    :param path: path of the results file
+    :return: generator of (header, data) of the chunks
+    """
+    with open(path, "rb") as f:
+        for header, data in _chunks(f, path):
+            yield json.loads(header.decode('utf-8')), data
+
+
+def load_results(*paths):
+    """
+    Load one or several results files, e.g. the files of the workers of a run, into NumPy arrays
+    :param paths: paths of the results files
+    :return: dict of column name to array; the hop and flow columns are codes into the lists
+    "hops" and "flows" of the same dict
+    """
+    import numpy as np
+
+    columns = {name: [] for name, _, _ in COLUMNS}
+    hops = {}
+    flows = {}
+
+    # every process numbers its flows from 0, the flow ids of a file are shifted after the ids of the previous ones
+    flow_offset = 0
+    for path in paths:
+        file_flows = 0
+        for header, data in read_chunks(path):
+            offset = 0
+            chunk = {}
+            for name, dtype, length in header["columns"]:
+                chunk[name] = np.frombuffer(data, dtype=dtype, count=length // np.dtype(dtype).itemsize,
+                                            offset=offset)
+                offset += length
+
+            # the codes of a chunk are remapped to the codes of the whole file
+            for name, table, names in (("hop", hops, header["hops"]), ("flow", flows, header["flows"])):
+                remap = np.array([table.setdefault(n, len(table)) for n in names], dtype="<u2")
+                chunk[name] = remap[chunk[name]] if len(remap) else chunk[name]
+
+            if len(chunk["flow_id"]):
+                file_flows = max(file_flows, int(chunk["flow_id"].max()) + 1)
+                chunk["flow_id"] = chunk["flow_id"] + np.uint64(flow_offset)
+
+            for name in columns:
+                columns[name].append(chunk[name])
+        flow_offset += file_flows
+
+    results = {
+        name: np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+        for (name, _, dtype), arrays in zip(COLUMNS, columns.values())
+    }
+    results["hops"] = sorted(hops, key=hops.get)
+    results["flows"] = sorted(flows, key=flows.get)
+    return results
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Parsing of the tokens sent by the IDP to the SPs: the SAML responses, and the WS-Fed wresult, a WS-Trust
+# RequestSecurityTokenResponse carrying a SAML 2.0 or SAML 1.1 assertion (e.g. sp_wsfed2). The XML is read once by
+# expat, without building a tree, into a SamlToken whose fields and attributes are looked up in O(1), e.g. by the
+# claim tests:
+#
+#     token = parse_saml_response(form_inputs['SAMLResponse'])
+#     assert token.success and "userIP" in token.attributes
+#
+#     token = parse_wresult(form_inputs['wresult'])
+#     assert token.version == "1.1" and token.valid_at()
+#
+# The messages of the HTTP-Redirect binding travel in the query string of a redirect, DEFLATE compressed and base64
+# encoded, and optionally signed by the SigAlg and Signature parameters: see redirect_url and parse_redirect_url.
+
+import zlib
+import base64
+
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, quote_plus, unquote_plus
+from xml.parsers import expat
+
+SAMLP = "urn:oasis:names:tc:SAML:2.0:protocol"
+SAML = "urn:oasis:names:tc:SAML:2.0:assertion"
+SAML11 = "urn:oasis:names:tc:SAML:1.0:assertion"
+WST = "http://schemas.xmlsoap.org/ws/2005/02/trust"
+WST13 = "http://docs.oasis-open.org/ws-sx/ws-trust/200512"
+WSU = "http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd"
+WSA = "http://www.w3.org/2005/08/addressing"
+DSIG = "http://www.w3.org/2000/09/xmldsig#"
+
+STATUS_SUCCESS = "urn:oasis:names:tc:SAML:2.0:status:Success"
+
+# expat reports the names of the elements as "<namespace> <local name>"
+_SEPARATOR = " "
+
+
+def _name(namespace, local_name):
+    return namespace + _SEPARATOR + local_name
+
+
+def parse_instant(value):
+    """
+    :param value: xs:dateTime of SAML, e.g. 2018-06-01T12:00:00Z or 2018-06-01T12:00:00.123Z
+    :return: aware datetime in UTC, None if value is None
+    """
+    if value is None:
+        return None
+    value = value.strip().rstrip("Z")
+    if "." in value:
+        value, fraction = value.split(".", 1)
+        microseconds = int((fraction + "000000")[:6])
+    else:
+        microseconds = 0
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S").replace(microsecond=microseconds, tzinfo=timezone.utc)
+
+
+class SamlToken():
+    """
+    Index of a SAML response, a WS-Fed token or a bare assertion, filled in one pass over its XML
+    """
+
+    def __init__(self):
+        # local name of the root element, e.g. Response, LogoutResponse or RequestSecurityTokenResponse
+        self.message = None
+        # SAML version of the assertion, 2.0 or 1.1
+        self.version = None
+        # protocol response, None for a bare assertion
+        self.response_id = None
+        self.in_response_to = None
+        self.destination = None
+        self.status = None
+        # WS-Trust response of WS-Fed, None for SAML
+        self.token_type = None
+        self.created = None
+        self.expires = None
+        self.applies_to = None
+        # assertion
+        self.issuer = None
+        self.assertion_id = None
+        self.issue_instant = None
+        self.name_id = None
+        self.name_id_format = None
+        self.session_index = None
+        self.not_before = None
+        self.not_on_or_after = None
+        self.audiences = []
+        # attribute name to its list of values
+        self.attributes = {}
+        # number of ds:Signature elements, of the response or of the assertion
+        self.signatures = 0
+
+    @property
+    def success(self):
+        """
+        True for a response with the Success status, or for a bare assertion
+        """
+        return self.status is None or self.status == STATUS_SUCCESS
+
+    def attribute(self, name, default=None):
+        """
+        :return: first value of the attribute, default if the token has no such attribute
+        """
+        values = self.attributes.get(name)
+        return values[0] if values else default
+
+    def valid_at(self, when=None, skew=0):
+        """
+        :param when: aware datetime, by default now
+        :param skew: seconds of tolerated clock skew
+        :return: True if when is within the conditions of the assertion, and the lifetime of the WS-Fed token
+        """
+        when = when or datetime.now(timezone.utc)
+        timestamp = when.timestamp()
+        for start, end in ((self.not_before, self.not_on_or_after), (self.created, self.expires)):
+            start = parse_instant(start)
+            end = parse_instant(end)
+            if start is not None and timestamp + skew < start.timestamp():
+                return False
+            if end is not None and timestamp - skew >= end.timestamp():
+                return False
+        return True
+
+    def __repr__(self):
+        return "SamlToken(name_id={n!r}, issuer={i!r}, attributes={a!r})".format(
+            n=self.name_id, i=self.issuer, a=sorted(self.attributes))
+
+
+class _TokenParser():
+    """
+    expat handlers filling a SamlToken; the text is only collected for the elements with an end handler
+    """
+
+    def __init__(self, token):
+        self.token = token
+        self.text = None
+        self.attribute = None
+
+        self.starts = {
+            _name(SAMLP, "Response"): self.start_response,
+            _name(SAMLP, "StatusCode"): self.start_status_code,
+            _name(SAML, "Assertion"): self.start_assertion,
+            _name(SAML, "NameID"): self.start_name_id,
+            _name(SAML, "Conditions"): self.start_conditions,
+            _name(SAML, "AuthnStatement"): self.start_authn_statement,
+            _name(SAML, "Attribute"): self.start_attribute,
+            _name(SAML11, "Assertion"): self.start_saml11_assertion,
+            _name(SAML11, "NameIdentifier"): self.start_name_id,
+            _name(SAML11, "Conditions"): self.start_conditions,
+            _name(SAML11, "Attribute"): self.start_saml11_attribute,
+            _name(DSIG, "Signature"): self.start_signature,
+        }
+        self.ends = {
+            _name(SAML, "Issuer"): self.end_issuer,
+            _name(SAML, "NameID"): self.end_name_id,
+            _name(SAML, "Audience"): self.end_audience,
+            _name(SAML, "Attribute"): self.end_attribute,
+            _name(SAML, "AttributeValue"): self.end_attribute_value,
+            _name(SAML11, "NameIdentifier"): self.end_name_id,
+            _name(SAML11, "Audience"): self.end_audience,
+            _name(SAML11, "Attribute"): self.end_attribute,
+            _name(SAML11, "AttributeValue"): self.end_attribute_value,
+            _name(WSU, "Created"): self.end_created,
+            _name(WSU, "Expires"): self.end_expires,
+            _name(WSA, "Address"): self.end_address,
+        }
+        for namespace in (WST, WST13):
+            self.ends[_name(namespace, "TokenType")] = self.end_token_type
+
+    def parse(self, data):
+        parser = expat.ParserCreate(namespace_separator=_SEPARATOR)
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        parser.Parse(data, True)
+        return self.token
+
+    def start(self, name, attributes):
+        if self.token.message is None:
+            self.token.message = name.rpartition(_SEPARATOR)[2]
+        handler = self.starts.get(name)
+        if handler is not None:
+            handler(attributes)
+        if name in self.ends:
+            self.text = []
+
+    def end(self, name):
+        handler = self.ends.get(name)
+        if handler is not None:
+            handler("".join(self.text).strip() if self.text is not None else "")
+            self.text = None
+
+    def characters(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+    # protocol response
+
+    def start_response(self, attributes):
+        token = self.token
+        token.response_id = attributes.get("ID")
+        token.in_response_to = attributes.get("InResponseTo")
+        token.destination = attributes.get("Destination")
+
+    def start_status_code(self, attributes):
+        # the top-level status code, not the second-level ones it contains
+        if self.token.status is None:
+            self.token.status = attributes.get("Value")
+
+    def start_signature(self, attributes):
+        self.token.signatures += 1
+
+    # WS-Trust response of WS-Fed
+
+    def end_token_type(self, text):
+        self.token.token_type = text
+
+    def end_created(self, text):
+        # the lifetime of the response, not the timestamp of a WS-Security header
+        if self.token.created is None:
+            self.token.created = text
+
+    def end_expires(self, text):
+        if self.token.expires is None:
+            self.token.expires = text
+
+    def end_address(self, text):
+        # the address of the EndpointReference of AppliesTo
+        if self.token.applies_to is None:
+            self.token.applies_to = text
+
+    # assertion
+
+    def start_assertion(self, attributes):
+        token = self.token
+        token.version = attributes.get("Version", "2.0")
+        token.assertion_id = attributes.get("ID")
+        token.issue_instant = attributes.get("IssueInstant")
+
+    def end_issuer(self, text):
+        # the issuer of the assertion wins over the one of the response
+        if self.token.issuer is None or self.token.assertion_id is not None:
+            self.token.issuer = text
+
+    def start_name_id(self, attributes):
+        if self.token.name_id is None:
+            self.token.name_id_format = attributes.get("Format")
+
+    def end_name_id(self, text):
+        # the subject of the assertion, not the NameID of a SubjectConfirmation for instance
+        if self.token.name_id is None:
+            self.token.name_id = text
+
+    def start_conditions(self, attributes):
+        self.token.not_before = attributes.get("NotBefore")
+        self.token.not_on_or_after = attributes.get("NotOnOrAfter")
+
+    def end_audience(self, text):
+        self.token.audiences.append(text)
+
+    def start_authn_statement(self, attributes):
+        self.token.session_index = attributes.get("SessionIndex")
+
+    def start_attribute(self, attributes):
+        self.attribute = self.token.attributes.setdefault(attributes.get("Name"), [])
+
+    def end_attribute(self, text):
+        self.attribute = None
+
+    def end_attribute_value(self, text):
+        if self.attribute is not None:
+            self.attribute.append(text)
+
+    # SAML 1.1 assertion, whose issuer is an attribute and whose attributes are named by AttributeName
+
+    def start_saml11_assertion(self, attributes):
+        token = self.token
+        token.version = "{major}.{minor}".format(major=attributes.get("MajorVersion", "1"),
+                                                 minor=attributes.get("MinorVersion", "1"))
+        token.assertion_id = attributes.get("AssertionID")
+        token.issue_instant = attributes.get("IssueInstant")
+        token.issuer = attributes.get("Issuer")
+
+    def start_saml11_attribute(self, attributes):
+        self.attribute = self.token.attributes.setdefault(attributes.get("AttributeName"), [])
+
+
+def parse_xml(data):
+    """
+    :param data: XML of a SAML response or of an assertion, as bytes or str
+    :return: SamlToken
+    :raise expat.ExpatError: if data is not well-formed XML
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return _TokenParser(SamlToken()).parse(data)
+
+
+def decode_saml_message(value, deflated=False):
+    """
+    :param value: base64 SAMLRequest or SAMLResponse, DEFLATE compressed with the HTTP-Redirect binding
+    :return: XML of the message, as bytes
+    """
+    data = base64.b64decode(value)
+    if deflated:
+        data = zlib.decompress(data, -15)
+    return data
+
+
+def parse_saml_response(value, deflated=False):
+    """
+    :param value: SAMLResponse input of the form posted to the SP, base64 encoded
+    :param deflated: the response comes from the HTTP-Redirect binding
+    :return: SamlToken
+    """
+    return parse_xml(decode_saml_message(value, deflated))
+
+
+def parse_wresult(value):
+    """
+    :param value: wresult input of the form posted to the WS-Fed SP, i.e. a RequestSecurityTokenResponse
+    :return: SamlToken of the response and of the assertion it carries
+    """
+    return parse_xml(value)
+
+
+class RedirectMessage():
+    """
+    SAML message of the HTTP-Redirect binding, as read from the query string of a redirect
+    """
+
+    def __init__(self, param, value, relay_state=None, sig_alg=None, signature=None, signed_data=None):
+        """
+        :param param: SAMLRequest or SAMLResponse
+        :param value: DEFLATE compressed and base64 encoded message
+        :param relay_state: RelayState parameter
+        :param sig_alg: URI of the signature algorithm, None if the message is not signed
+        :param signature: signature, as bytes
+        :param signed_data: octets covered by the signature, the parameters as URL-encoded by the sender
+        """
+        self.param = param
+        self.value = value
+        self.relay_state = relay_state
+        self.sig_alg = sig_alg
+        self.signature = signature
+        self.signed_data = signed_data
+
+    @property
+    def xml(self):
+        return decode_saml_message(self.value, deflated=True)
+
+    def parse(self):
+        """
+        :return: SamlToken of the message
+        """
+        return parse_xml(self.xml)
+
+
+def deflate_saml_message(xml):
+    """
+    :param xml: SAML message, as str or bytes
+    :return: the message raw DEFLATE compressed and base64 encoded, as in the HTTP-Redirect binding
+    """
+    if isinstance(xml, str):
+        xml = xml.encode('utf-8')
+    compressor = zlib.compressobj(zlib.Z_BEST_COMPRESSION, zlib.DEFLATED, -15)
+    return base64.b64encode(compressor.compress(xml) + compressor.flush()).decode('ascii')
+
+
+def redirect_url(endpoint, xml, param="SAMLRequest", relay_state=None, sig_alg=None, sign=None):
+    """
+    :param endpoint: URL of the SAML endpoint the message is sent to
+    :param xml: SAML message
+    :param param: SAMLRequest or SAMLResponse
+    :param relay_state: optional RelayState
+    :param sig_alg: URI of the signature algorithm, required with sign
+    :param sign: optional function returning the signature of the bytes it is given, e.g. helpers.signatures.signer
+    :return: URL of the redirect carrying the message
+    """
+    query = "{param}={value}".format(param=param, value=quote_plus(deflate_saml_message(xml)))
+    if relay_state is not None:
+        query += "&RelayState=" + quote_plus(relay_state)
+    if sign is not None:
+        query += "&SigAlg=" + quote_plus(sig_alg)
+        query += "&Signature=" + quote_plus(base64.b64encode(sign(query.encode('ascii'))).decode('ascii'))
+    return endpoint + ("&" if "?" in endpoint else "?") + query
+
+
+def parse_redirect_url(url):
+    """
+    :param url: URL of a redirect, e.g. the Location of the response of a SP
+    :return: RedirectMessage, None if the URL carries no SAML message
+    """
+    encoded = {}
+    for field in urlsplit(url).query.split("&"):
+        name, _, value = field.partition("=")
+        encoded[unquote_plus(name)] = field
+
+    for param in ("SAMLRequest", "SAMLResponse"):
+        if param in encoded:
+            break
+    else:
+        return None
+
+    values = {name: unquote_plus(field.partition("=")[2]) for name, field in encoded.items()}
+    signature = values.get("Signature")
+    return RedirectMessage(
+        param,
+        values[param],
+        relay_state=values.get("RelayState"),
+        sig_alg=values.get("SigAlg"),
+        signature=base64.b64decode(signature) if signature else None,
+        # the signature covers the parameters in this order, as they were encoded by the sender
+        signed_data="&".join(encoded[name] for name in (param, "RelayState", "SigAlg") if name in encoded)
+        .encode('ascii')
+    )
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Open-model load: the SSO flows are started at a fixed arrival rate, whatever the time the previous
+# flows take. Every flow has an intended start on a timeline computed in advance; when the IDP or the SPs
+# slow down, the flows start late and the time they waited is part of their corrected latency, which is
+# measured from the intended start. The uncorrected latency is measured from the actual start, as a
+# closed loop of virtual users would see it.
+
+import time
+import random
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import helpers.metrics as metrics
+import helpers.requests as req
+from helpers.flows import FailureLog, sp_initiated_login
+from helpers.logging import start_flow
+from helpers.signatures import SignatureVerifier
+from helpers.transport import Transport
+
+logger = logging.getLogger('acceptance-tool.helpers.scheduler')
+
+# Hops under which the latency of the whole flow is recorded
+FLOW_UNCORRECTED = "flow"
+FLOW_CORRECTED = "flow.corrected"
+
+
+def intended_starts(rate, duration, arrivals="poisson", seed=None):
+    """
+    Offsets, in seconds from the start of the run, at which the flows are intended to start
+    :param rate: flows per second
+    :param duration: seconds of the run
+    :param arrivals: poisson for exponential inter-arrival times, constant for a fixed interval
+    :param seed: seed of the random inter-arrival times
+    :return: generator of offsets
+    """
+    if rate <= 0:
+        raise ValueError("The arrival rate must be positive")
+
+    generator = random.Random(seed)
+    offset = 0.0
+    while True:
+        if arrivals == "poisson":
+            offset += generator.expovariate(rate)
+        elif arrivals == "constant":
+            offset += 1.0 / rate
+        else:
+            raise ValueError("Unknown arrivals {arrivals}".format(arrivals=arrivals))
+        if offset >= duration:
+            return
+        yield offset
+
+
+class ArrivalScheduler():
+    """
+    Start the SP-initiated SSO flow at a fixed arrival rate and record the latency of every flow
+    from its intended start (corrected) and from its actual start (uncorrected)
+    """
+
+    def __init__(self, settings, standard="SAML", sp_index=0, rate=10, duration=60, arrivals="poisson",
+                 max_in_flight=100, seed=None, flow_logger=None, credentials=None):
+        """
+        :param settings: settings of the IDP and SP, as loaded from the config file
+        :param standard: connection protocol, SAML or WSFED
+        :param sp_index: index of the service provider in settings["sps_saml"] or settings["sps_wsfed"]
+        :param rate: flows started per second
+        :param duration: seconds during which flows are started
+        :param arrivals: poisson or constant inter-arrival times
+        :param max_in_flight: maximum number of flows run at the same time; the other ones wait and start late
+        :param seed: seed of the poisson arrivals
+        :param flow_logger: logger given to the helpers, disabled by default
+        :param credentials: list of {"username", "password"} used round-robin by the flows,
+        by default the user of the test realm
+        """
+        client = "sps_saml" if standard == "SAML" else "sps_wsfed"
+
+        self.standard = standard
+        self.sp = settings[client][sp_index]
+        self.flow = "{protocol}.{sp}".format(protocol=standard.lower(), sp=self.sp["name"])
+        self.idp = settings["idp"]
+        self.username = settings["idp"]["test_realm"]["username"]
+        self.password = settings["idp"]["test_realm"]["password"]
+        self.credentials = credentials or [{"username": self.username, "password": self.password}]
+        self.rate = rate
+        self.duration = duration
+        self.arrivals = arrivals
+        self.max_in_flight = max_in_flight
+        self.seed = seed
+        self.transport = Transport.from_settings(settings, pool_maxsize=max_in_flight)
+        self.verifier = SignatureVerifier.from_settings(settings, self.transport.session())
+
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.late = 0
+        self.failures = FailureLog(logger)
+
+        if flow_logger is None:
+            flow_logger = logging.getLogger('acceptance-tool.helpers.scheduler.flow')
+            flow_logger.setLevel(logging.WARNING)
+        self.flow_logger = flow_logger
+
+    def progress(self):
+        """
+        :return: number of flows completed and failed so far
+        """
+        return self.completed, self.failed
+
+    def _run_flow(self, index, intended_start):
+        started = time.perf_counter()
+        credentials = self.credentials[index % len(self.credentials)]
+
+        metrics.set_flow(self.flow)
+        start_flow()
+
+        s = self.transport.session()
+        try:
+            sp_initiated_login(self.flow_logger, s, req.get_header(), self.standard, self.sp, self.idp,
+                               credentials["username"], credentials["password"], self.verifier)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            self.failures.log("flow {index}".format(index=index), e)
+            return
+
+        ended = time.perf_counter()
+
+        metrics.record(FLOW_UNCORRECTED, ended - started)
+        metrics.record(FLOW_CORRECTED, ended - intended_start)
+
+        with self._lock:
+            self.completed += 1
+
+    def run(self):
+        """
+        Issue the flows on their intended-start timeline, wait for the last one and build the report
+        :return: report of the run
+        """
+        metrics.get_recorder().reset()
+
+        issued = 0
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            start = time.perf_counter()
+
+            for offset in intended_starts(self.rate, self.duration, self.arrivals, self.seed):
+                intended_start = start + offset
+                delay = intended_start - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -0.001:
+                    # the dispatcher itself is late, the flow still counts from its intended start
+                    self.late += 1
+                executor.submit(self._run_flow, issued, intended_start)
+                issued += 1
+
+        elapsed = time.perf_counter() - start
+
+        self.transport.close()
+        if self.verifier is not None:
+            self.verifier.close()
+
+        return self.report(issued, elapsed)
+
+    def report(self, issued, elapsed):
+        hops = metrics.summarize(metrics.get_recorder().snapshot()).get(self.flow, {})
+
+        return {
+            "standard": self.standard,
+            "sp": self.sp["name"],
+            "rate": self.rate,
+            "arrivals": self.arrivals,
+            "max_in_flight": self.max_in_flight,
+            "duration": self.duration,
+            "elapsed": elapsed,
+            "issued": issued,
+            "late_dispatches": self.late,
+            "flows": self.completed,
+            "errors": self.failed,
+            "flows_per_second": self.completed / elapsed if elapsed else 0,
+            "latency": {
+                "corrected": hops.get(FLOW_CORRECTED),
+                "uncorrected": hops.get(FLOW_UNCORRECTED)
+            },
+            "connections": self.transport.stats.to_json(),
+            "hops": hops
+        }
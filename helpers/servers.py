@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Common parts of the local stand-ins of the IDP and of the SPs (helpers/idp_stand_in.py, helpers/sp_farm.py)
+
+import asyncio
+import threading
+
+from collections import OrderedDict
+
+# maximum number of pending logins and of sessions kept by a stand-in, the oldest are dropped
+MAX_SESSIONS = 100000
+
+
+class BoundedDict(OrderedDict):
+    """
+    Dict that drops its oldest entries beyond maxsize, so that long benchmarks keep bounded memory
+    """
+
+    def __init__(self, maxsize=MAX_SESSIONS):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class BackgroundServer():
+    """
+    Server with async start() and stop() methods, which can also run in the event loop of a daemon thread,
+    e.g. to serve a synchronous harness
+    """
+
+    _loop = None
+    _thread = None
+
+    async def start(self):
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+    def start_in_thread(self):
+        """
+        :return: the server, once it listens
+        """
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        errors = []
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.start())
+            except Exception as e:
+                errors.append(e)
+                return
+            finally:
+                started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            self._thread.join()
+            self._thread = None
+            raise errors[0]
+        return self
+
+    def stop_thread(self):
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
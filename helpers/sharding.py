@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Isolation of the workers of a parallel run (pytest -n, with pytest-xdist). Every worker imports its own
+# copy of the test realms, named with the id of the worker as suffix, so that the SSO sessions and the
+# test users of two workers never meet:
+# - the ids (UUIDs) of the clients, roles, users... are primary keys of the whole Keycloak database, they are
+#   replaced by ids derived from the suffix, the same at every run so that the import hashes do not change;
+# - the realm names in the URLs of the realm copies (broker endpoints, redirect URIs, client ids of the
+#   brokers...) are renamed, so the broker copy of a worker talks to the external realm copy of the same worker;
+# - the settings of the worker point to the realm copies;
+# - the SPs of the config file only trust the original realms: they check the issuer and the signing key of the
+#   assertions, and Keycloak checks the Destination of their AuthnRequests, so a worker cannot send them to its copies.
+#   Every worker runs instead its own SP farm (see helpers.sp_farm), whose SPs have the names, hence the clients, of
+#   the SPs of the config file and log in with the copy of the test realm; the clients of the copy point to the farm.
+#   The tests of a parallel run check the flows of Keycloak with these virtual SPs, not the SPs of the config file.
+
+import os
+import re
+import copy
+import json
+import uuid
+
+from helpers.sp_farm import SpFarm, local_sp
+
+# environment variable set by pytest-xdist in its workers, e.g. gw0
+WORKER_VARIABLE = "PYTEST_XDIST_WORKER"
+
+# port of the first SP of the farm of the worker gw0, the farm of gw<n> starts at FARM_PORT + n * <number of SPs>,
+# so that the clients of the realm copies, hence their import hashes, are the same at every run
+FARM_PORT = 9100
+
+UUID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def worker_suffix(worker_id=None):
+    """
+    :param worker_id: id of the pytest-xdist worker, by default the one of the current process
+    :return: suffix of the realms of the worker, empty for a run without workers
+    """
+    if worker_id is None:
+        worker_id = os.environ.get(WORKER_VARIABLE)
+    if not worker_id or worker_id == "master":
+        return ""
+    return "_" + worker_id
+
+
+def _segment_pattern(names):
+    # the longest names first, e.g. automatic_keycloak_testing_external before automatic_keycloak_testing,
+    # and only whole path segments
+    alternatives = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    return re.compile(r"(?<=/)(" + alternatives + r")(?=[/?#]|$)")
+
+
+def rename_realm(realm_representation, renames, ids=None, suffix=None):
+    """
+    Copy of a realm representation whose realm names are renamed in all its URLs and paths
+    :param realm_representation: realm representation, as a dict
+    :param renames: dict of realm name to its new name, e.g. the broker and the external realm
+    :param ids: dict of realm id to its new id, e.g. for the containerId of the realm roles
+    :param suffix: if given, every UUID is replaced by a UUID derived from it and from the old UUID
+    :return: renamed copy
+    """
+    pattern = _segment_pattern(renames)
+    ids = ids or {}
+
+    def rename(value):
+        if isinstance(value, str):
+            if value in ids:
+                return ids[value]
+            if suffix and UUID_PATTERN.fullmatch(value):
+                return str(uuid.uuid5(uuid.NAMESPACE_OID, suffix + value))
+            return pattern.sub(lambda match: renames[match.group(1)], value)
+        if isinstance(value, dict):
+            return {rename(key): rename(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [rename(item) for item in value]
+        return value
+
+    realm = rename(realm_representation)
+    realm["realm"] = renames.get(realm_representation["realm"], realm_representation["realm"])
+    return realm
+
+
+def worker_farm(settings, suffix, host="127.0.0.1", port=FARM_PORT):
+    """
+    SP farm of a worker: one virtual SP per SP of the settings, with the same name, that logs in with the copy of
+    the test realm of the worker
+    :param settings: settings of the IDP and SP, as loaded from the config file
+    :param suffix: suffix of the worker, see worker_suffix
+    :param host: address of the SPs
+    :param port: port of the first SP of the worker gw0, see FARM_PORT; 0 for free ports
+    :return: SpFarm, to start before calling worker_settings
+    """
+    sps = settings.get("sps_saml", []) + settings.get("sps_wsfed", [])
+    index = re.search(r"\d+$", suffix)
+    if port and index:
+        port += int(index.group()) * len(sps)
+
+    idp = copy.deepcopy(settings["idp"])
+    idp["test_realm"]["name"] += suffix
+    return SpFarm([local_sp(sp, sp["name"], host, port + i if port else 0) for i, sp in enumerate(sps)], idp, host)
+
+
+def _point_clients(realm_representation, farm):
+    # the URLs and the signature of the clients of the SPs are the ones of the virtual SPs, the roles, mappers and
+    # policies of the clients are kept
+    sps = {sp.client_id: sp for sp in farm.sps}
+    for client in realm_representation.get("clients", []):
+        sp = sps.get(client["clientId"])
+        if sp is None:
+            continue
+        representation = sp.client_representation()
+        for key in ("baseUrl", "adminUrl", "redirectUris", "frontchannelLogout"):
+            client[key] = representation[key]
+        client["rootUrl"] = representation["baseUrl"] + "/"
+        attributes = {key: value for key, value in client.get("attributes", {}).items()
+                      if not key.startswith("saml_assertion_consumer_url")}
+        attributes.update(representation["attributes"])
+        client["attributes"] = attributes
+
+
+def worker_settings(settings, suffix, directory, farm):
+    """
+    Settings of a worker: its test realms are renamed with the suffix and their copies are written to the directory,
+    its SPs are the ones of its farm
+    :param settings: settings of the IDP and SP, as loaded from the config file
+    :param suffix: suffix of the worker, see worker_suffix; the settings are returned unchanged if it is empty
+    :param directory: directory of the JSON files of the realm copies
+    :param farm: started SP farm of the worker, see worker_farm
+    :return: settings of the worker, with a "sharding" section of the renamed realms
+    """
+    if not suffix:
+        return settings
+
+    settings = copy.deepcopy(settings)
+    idps = [idp for idp in ("idp", "idp_external") if idp in settings]
+
+    realms = {}
+    for idp in idps:
+        with open(settings[idp]["test_realm"]["json_file"]) as f:
+            realms[idp] = json.load(f)
+
+    renames = {realm["realm"]: realm["realm"] + suffix for realm in realms.values()}
+    ids = {realm["id"]: realm["id"] + suffix for realm in realms.values() if "id" in realm}
+
+    for idp in idps:
+        test_realm = settings[idp]["test_realm"]
+        json_file = os.path.join(directory, "{name}{suffix}.json".format(
+            name=os.path.splitext(os.path.basename(test_realm["json_file"]))[0], suffix=suffix))
+        realm = rename_realm(realms[idp], renames, ids, suffix)
+        _point_clients(realm, farm)
+        with open(json_file, "w") as f:
+            json.dump(realm, f)
+
+        test_realm["name"] = renames.get(test_realm["name"], test_realm["name"] + suffix)
+        test_realm["json_file"] = json_file
+
+    settings.update(copy.deepcopy(farm.settings()))
+    settings["sharding"] = {"suffix": suffix, "realms": renames}
+    return settings
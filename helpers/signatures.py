@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Verification of the XML signatures of the SAML responses and WS-Fed tokens sent by the IDP to the SPs.
+# The signing certificates of the realm are fetched once from its SAML descriptor; the signatures are checked
+# against their public keys only, never against the certificate carried by the signature itself, and every
+# assertion of a token has to be covered by one of them.
+# The checks run in a pool of processes, which parse the keys once when they start, so that verifying every
+# token of a load run does not hold the threads or the event loop of the virtual users.
+
+import copy
+import hmac
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509 import load_der_x509_certificate
+from lxml import etree
+from requests import Request
+
+from helpers.logging import log_request
+from helpers.saml import SAML, SAML11
+
+logger = logging.getLogger('acceptance-tool.helpers.signatures')
+
+DSIG = "http://www.w3.org/2000/09/xmldsig#"
+MD = "urn:oasis:names:tc:SAML:2.0:metadata"
+EXC_C14N = "http://www.w3.org/2001/10/xml-exc-c14n#"
+C14N = "http://www.w3.org/TR/2001/REC-xml-c14n-20010315"
+ENVELOPED = "http://www.w3.org/2000/09/xmldsig#enveloped-signature"
+
+_NAMESPACES = {"ds": DSIG, "md": MD, "ec": EXC_C14N}
+
+_CANONICALIZATIONS = {
+    C14N: {"exclusive": False, "with_comments": False},
+    C14N + "#WithComments": {"exclusive": False, "with_comments": True},
+    EXC_C14N: {"exclusive": True, "with_comments": False},
+    EXC_C14N + "WithComments": {"exclusive": True, "with_comments": True},
+}
+
+_DIGESTS = {
+    "http://www.w3.org/2000/09/xmldsig#sha1": "sha1",
+    "http://www.w3.org/2001/04/xmlenc#sha256": "sha256",
+    "http://www.w3.org/2001/04/xmlenc#sha512": "sha512",
+}
+
+RSA_SHA256 = "http://www.w3.org/2001/04/xmldsig-more#rsa-sha256"
+
+_SIGNATURE_HASHES = {
+    "http://www.w3.org/2000/09/xmldsig#rsa-sha1": hashes.SHA1,
+    RSA_SHA256: hashes.SHA256,
+    "http://www.w3.org/2001/04/xmldsig-more#rsa-sha512": hashes.SHA512,
+}
+
+# the SAML 2.0 elements are referenced by their ID attribute, the SAML 1.1 assertions by their AssertionID
+_REFERENCED = etree.XPath("//*[@ID=$id or @AssertionID=$id]")
+
+_parser = etree.XMLParser(resolve_entities=False, no_network=True)
+
+# signing certificates of the realms, by URL of their descriptor
+_certificates = {}
+_certificates_lock = threading.Lock()
+
+
+class SignatureError(Exception):
+    """
+    Raised when a token is not signed, or not signed by the keys of the realm
+    """
+    pass
+
+
+def descriptor_url(idp, realm):
+    """
+    :param idp: identity provider settings, i.e. settings["idp"]
+    :param realm: name of the realm
+    :return: URL of the SAML descriptor of the realm
+    """
+    return "{scheme}://{ip}:{port}/auth/realms/{realm}/protocol/saml/descriptor".format(
+        scheme=idp["http_scheme"],
+        ip=idp["ip"],
+        port=idp["port"],
+        realm=realm
+    )
+
+
+def realm_certificates(s, idp, realm):
+    """
+    Fetch the signing certificates of the realm, once per run
+    :param s: session s
+    :param idp: identity provider settings, i.e. settings["idp"]
+    :param realm: name of the realm
+    :return: tuple of the DER certificates
+    """
+    url = descriptor_url(idp, realm)
+    with _certificates_lock:
+        if url in _certificates:
+            return _certificates[url]
+
+        req_get_descriptor = Request(
+            method='GET',
+            url=url
+        )
+        prepared_request = req_get_descriptor.prepare()
+
+        log_request(logger, req_get_descriptor)
+
+        response = s.send(prepared_request, verify=False)
+        response.raise_for_status()
+
+        root = etree.fromstring(response.content, _parser)
+        certificates = tuple(
+            base64.b64decode("".join(certificate.text.split()))
+            for certificate in root.xpath("//md:KeyDescriptor[not(@use) or @use='signing']//ds:X509Certificate",
+                                          namespaces=_NAMESPACES)
+        )
+        if not certificates:
+            raise SignatureError("No signing certificate in {url}".format(url=url))
+
+        _certificates[url] = certificates
+        return certificates
+
+
+def public_keys(certificates):
+    """
+    :param certificates: DER certificates
+    :return: list of their public keys
+    """
+    return [load_der_x509_certificate(certificate, default_backend()).public_key() for certificate in certificates]
+
+
+def token_xml(token):
+    """
+    :param token: inputs of the form posted by the IDP to the SP, with a SAMLResponse or a wresult
+    :return: XML of the token, as bytes
+    """
+    if token.get('SAMLResponse'):
+        return base64.b64decode(token['SAMLResponse'])
+    if token.get('wresult'):
+        return token['wresult'].encode('utf-8')
+    raise SignatureError("No SAMLResponse nor wresult in the token")
+
+
+def _canonicalize(element, method):
+    algorithm = method.get("Algorithm")
+    if algorithm not in _CANONICALIZATIONS:
+        raise SignatureError("Unsupported canonicalization {a}".format(a=algorithm))
+    prefixes = method.find("ec:InclusiveNamespaces", _NAMESPACES)
+    return etree.tostring(element, method="c14n",
+                          inclusive_ns_prefixes=prefixes.get("PrefixList").split() if prefixes is not None else None,
+                          **_CANONICALIZATIONS[algorithm])
+
+
+def _remove_signature(element, signature):
+    # the enveloped-signature transform removes the element, not the text that follows it
+    if signature.tail:
+        previous = signature.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + signature.tail
+        else:
+            element.text = (element.text or "") + signature.tail
+    element.remove(signature)
+
+
+def _check_reference(root, signature, reference):
+    uri = reference.get("URI", "")
+    if not uri.startswith("#"):
+        raise SignatureError("Unsupported reference {uri}".format(uri=uri))
+    elements = _REFERENCED(root, id=uri[1:])
+    # the signature has to be enveloped in the element it signs, so that it cannot sign another element
+    # than the one read by the SP
+    if len(elements) != 1 or elements[0] is not signature.getparent():
+        raise SignatureError("Reference {uri} is not the parent of its signature".format(uri=uri))
+
+    element = copy.deepcopy(elements[0])
+    canonicalization = None
+    for transform in reference.iterfind("ds:Transforms/ds:Transform", _NAMESPACES):
+        if transform.get("Algorithm") == ENVELOPED:
+            _remove_signature(element, element[elements[0].index(signature)])
+        else:
+            canonicalization = transform
+    data = _canonicalize(element, canonicalization) if canonicalization is not None else \
+        etree.tostring(element, method="c14n")
+
+    algorithm = reference.find("ds:DigestMethod", _NAMESPACES).get("Algorithm")
+    if algorithm not in _DIGESTS:
+        raise SignatureError("Unsupported digest {a}".format(a=algorithm))
+    digest = hashlib.new(_DIGESTS[algorithm], data).digest()
+    if not hmac.compare_digest(digest, base64.b64decode(reference.findtext("ds:DigestValue", "", _NAMESPACES))):
+        raise SignatureError("Digest mismatch of {uri}".format(uri=uri))
+
+
+def verify_xml(xml, keys):
+    """
+    Check every signature of a SAML response or WS-Fed token, and that every assertion is signed, by itself or
+    by an element that contains it
+    :param xml: XML of the token, as bytes
+    :param keys: public keys of the realm
+    :return: number of signatures checked
+    :raise SignatureError: if the token is not signed, if a signature does not match the keys or if an assertion
+    is not signed
+    """
+    try:
+        root = etree.fromstring(xml, _parser)
+    except etree.XMLSyntaxError as e:
+        raise SignatureError("Token is not well-formed: {e}".format(e=e))
+
+    signatures = root.findall(".//ds:Signature", _NAMESPACES)
+    if root.tag == "{%s}Signature" % DSIG:
+        signatures.append(root)
+    if not signatures:
+        raise SignatureError("Token is not signed")
+
+    signed = set()
+    for signature in signatures:
+        signed_info = signature.find("ds:SignedInfo", _NAMESPACES)
+        if signed_info is None:
+            raise SignatureError("Signature without SignedInfo")
+
+        references = signed_info.findall("ds:Reference", _NAMESPACES)
+        if not references:
+            raise SignatureError("Signature without Reference")
+        for reference in references:
+            _check_reference(root, signature, reference)
+
+        algorithm = signed_info.find("ds:SignatureMethod", _NAMESPACES).get("Algorithm")
+        if algorithm not in _SIGNATURE_HASHES:
+            raise SignatureError("Unsupported signature method {a}".format(a=algorithm))
+
+        data = _canonicalize(signed_info, signed_info.find("ds:CanonicalizationMethod", _NAMESPACES))
+        value = base64.b64decode(signature.findtext("ds:SignatureValue", "", _NAMESPACES))
+
+        _verify_value(keys, algorithm, value, data)
+        signed.add(signature.getparent())
+
+    for assertion in root.iter("{%s}Assertion" % SAML, "{%s}Assertion" % SAML11):
+        if assertion not in signed and not any(parent in signed for parent in assertion.iterancestors()):
+            raise SignatureError("Assertion {id} is not signed".format(
+                id=assertion.get("ID", assertion.get("AssertionID"))))
+
+    return len(signatures)
+
+
+def _verify_value(keys, algorithm, value, data):
+    for key in keys:
+        try:
+            key.verify(value, data, padding.PKCS1v15(), _SIGNATURE_HASHES[algorithm]())
+            return
+        except InvalidSignature:
+            continue
+    raise SignatureError("Signature does not match the keys of the realm")
+
+
+def verify_redirect(message, keys):
+    """
+    Check the signature of a message of the HTTP-Redirect binding, which is carried by its query string
+    :param message: helpers.saml.RedirectMessage
+    :param keys: public keys of the signer
+    :raise SignatureError: if the message is not signed, or if its signature does not match the keys
+    """
+    if message.signature is None:
+        raise SignatureError("{param} is not signed".format(param=message.param))
+    if message.sig_alg not in _SIGNATURE_HASHES:
+        raise SignatureError("Unsupported signature method {a}".format(a=message.sig_alg))
+    _verify_value(keys, message.sig_alg, message.signature, message.signed_data)
+
+
+def signer(private_key, sig_alg=RSA_SHA256):
+    """
+    :param private_key: RSA private key, e.g. of the certificate of a SP
+    :param sig_alg: URI of the signature algorithm
+    :return: function signing the bytes it is given, e.g. for helpers.saml.redirect_url
+    """
+    algorithm = _SIGNATURE_HASHES[sig_alg]
+    return lambda data: private_key.sign(data, padding.PKCS1v15(), algorithm())
+
+
+# public keys of a process of the pool, parsed once when it starts
+_worker_keys = None
+
+
+def _init_worker(certificates):
+    global _worker_keys
+    _worker_keys = public_keys(certificates)
+
+
+def _verify_in_worker(xml):
+    return verify_xml(xml, _worker_keys)
+
+
+class SignatureVerifier():
+    """
+    Verifier of the tokens of a realm, whose checks run in a pool of processes
+    """
+
+    def __init__(self, certificates, processes=None):
+        """
+        :param certificates: DER signing certificates of the realm
+        :param processes: number of processes of the pool, by default one per core; 0 checks the tokens
+        in the calling thread
+        """
+        self.certificates = tuple(certificates)
+        self.keys = public_keys(self.certificates)
+        self._pool = None
+        if processes != 0:
+            self._pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                             initargs=(self.certificates,))
+
+    @classmethod
+    def from_settings(cls, settings, s):
+        """
+        Build the verifier of the "signatures" section of the settings, e.g. "signatures": {"processes": 4}
+        :param settings: settings of the IDP and SP
+        :param s: session s, used to fetch the certificates of the test realm
+        :return: SignatureVerifier, None if the settings do not ask to verify the signatures
+        """
+        config = settings.get("signatures")
+        if config is None:
+            return None
+        idp = settings["idp"]
+        certificates = realm_certificates(s, idp, config.get("realm", idp["test_realm"]["name"]))
+        processes = config.get("processes")
+        # the worker processes of helpers.coordinator are daemons, which cannot start a pool; they already
+        # share the cores, so they check their tokens themselves
+        if multiprocessing.current_process().daemon:
+            processes = 0
+        return cls(certificates, processes)
+
+    def verify(self, token):
+        """
+        :param token: inputs of the form posted by the IDP to the SP
+        :return: number of signatures checked
+        :raise SignatureError: if the token is not properly signed
+        """
+        xml = token_xml(token)
+        if self._pool is None:
+            return verify_xml(xml, self.keys)
+        return self._pool.submit(_verify_in_worker, xml).result()
+
+    async def verify_async(self, token):
+        """
+        Async twin of verify, which does not block the event loop
+        """
+        xml = token_xml(token)
+        if self._pool is None:
+            return verify_xml(xml, self.keys)
+        return await asyncio.get_event_loop().run_in_executor(self._pool, _verify_in_worker, xml)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Farm of virtual SAML and WS-Fed SPs served by one asyncio process, in place of the SPs of the config files
+# (dev-saml1..4, dev-wsfed1..4), e.g. to run the tests and the load runner with hundreds of SPs. Every virtual SP
+# has its own port, or shares a port with other SPs and is chosen by the Host header. It answers like the SPs
+# of the tests:
+#
+#     GET  /{path}                SAML: 200 auto-post form of the AuthnRequest to the IDP, or 302 to the IDP with
+#                                 the AuthnRequest in the query string if the SP has "saml_binding": "redirect";
+#                                 WS-Fed: 302 wsignin1.0 to the IDP; once logged in, the logged_in_message and the
+#                                 attributes of the user
+#     POST /callback              assertion consumer service: SAMLResponse or wresult, 302 to /{path}; the
+#                                 LogoutResponse and wsignout1.0 of the logouts, 302 to /loggedOut
+#     GET  /{logout_path}         SAML: 200 auto-post form of the LogoutRequest; WS-Fed: 302 to /{logout_path}/idp
+#     GET  /{logout_path}/idp     WS-Fed: 302 wsignout1.0 to the IDP
+#     GET  /loggedOut             logged_out_message
+#
+# The assertions are not checked against a signing key.
+
+import sys
+import copy
+import json
+import zlib
+import base64
+import asyncio
+import logging
+import secrets
+import argparse
+
+from html import escape
+from urllib.parse import urlencode
+from xml.parsers.expat import ExpatError
+
+from aiohttp import web
+
+from helpers.idp_stand_in import authn_request, logout_request, auto_post_page
+from helpers.saml import parse_saml_response, parse_wresult, redirect_url
+from helpers.servers import BoundedDict, BackgroundServer
+
+logging.basicConfig(
+    format='%(asctime)s %(name)s %(levelname)s %(message)s',
+    datefmt='%m/%d/%Y %I:%M:%S %p'
+)
+logger = logging.getLogger('acceptance-tool.helpers.sp_farm')
+logger.setLevel(logging.INFO)
+
+version = "1.0"
+prog_name = sys.argv[0]
+usage = """{pn} [options]
+Farm of virtual SAML and WS-Fed SPs, in place of the SPs of a config file
+""".format(
+    pn=prog_name
+)
+parser = argparse.ArgumentParser(prog="{pn} {v}".format(pn=prog_name, v=version), usage=usage)
+
+parser.add_argument('--config-file', dest="config_file", required=True,
+                    help='Config file whose IDP the SPs log in with and whose SPs are served by the farm')
+parser.add_argument('--listen', dest="listen", default="127.0.0.1",
+                    help='Address the farm listens on')
+parser.add_argument('--port', dest="port", type=int, default=9000,
+                    help='Port of the first SP, the next SPs get the next ports')
+parser.add_argument('--virtual-hosts', dest="virtual_hosts", action="store_true",
+                    help='Serve all the SPs on --port, chosen by the Host header <name>.localhost')
+parser.add_argument('--saml', dest="saml", type=int, default=0,
+                    help='Number of SAML SPs added to the ones of the config file')
+parser.add_argument('--wsfed', dest="wsfed", type=int, default=0,
+                    help='Number of WS-Fed SPs added to the ones of the config file')
+parser.add_argument('--output', dest="output",
+                    help='Path of the config file of the farm, i.e. the config file with the SPs of the farm')
+parser.add_argument('--clients', dest="clients",
+                    help='Path of the partial import of the clients of the added SPs, to import in the test realm')
+parser.add_argument('--saml-binding', dest="saml_binding", choices=["post", "redirect"],
+                    help='Binding of the AuthnRequests of all the SAML SPs, by default the one of every SP')
+
+SESSION_COOKIE = "SP_SESSION"
+
+ACS_PATH = "callback"
+LOGGED_OUT_PATH = "loggedOut"
+
+
+class VirtualSp():
+    """
+    One SP of the farm, with its sessions
+    """
+
+    def __init__(self, sp, idp):
+        """
+        :param sp: settings of the SP, i.e. an entry of settings["sps_saml"] or settings["sps_wsfed"]; its name is
+        the client id of the SP in the test realm, unless it has a client_id, and its saml_binding, post by default,
+        is the binding of its AuthnRequests
+        :param idp: settings of the IDP, i.e. settings["idp"]
+        """
+        self.sp = sp
+        self.client_id = sp.get("client_id", sp["name"])
+        self.protocol = sp["protocol"]
+        self.realm_url = "{scheme}://{ip}:{port}/auth/realms/{realm}".format(
+            scheme=idp["http_scheme"], ip=idp["ip"], port=idp["port"], realm=idp["test_realm"]["name"])
+
+        # session id to the subject of its assertion
+        self.sessions = BoundedDict()
+        # relay state to the path to go back to once logged in
+        self.pending = BoundedDict()
+        self.stats = {"logins": 0, "logouts": 0, "rejected": 0}
+
+    def base_url(self, request=None):
+        if request is not None:
+            return "{scheme}://{host}".format(scheme=request.scheme, host=request.host)
+        return "{scheme}://{ip}:{port}".format(scheme=self.sp["http_scheme"], ip=self.sp["ip"], port=self.sp["port"])
+
+    def client_representation(self):
+        """
+        :return: client of the SP to import in the test realm, e.g. with a partial import
+        """
+        base_url = self.base_url()
+        prefix = "" if self.protocol == "saml" else "wsfed-"
+        mappers = [
+            {"name": "role list", "protocol": self.protocol, "protocolMapper": prefix + "saml-role-list-mapper",
+             "config": {"single": "false", "attribute.nameformat": "Basic", "attribute.name": "Role"}},
+            {"name": "memberOf", "protocol": self.protocol, "protocolMapper": prefix + "saml-user-attribute-mapper",
+             "config": {"user.attribute": "memberOf", "attribute.name": "memberOf"}}
+        ]
+        return {
+            "clientId": self.client_id,
+            "enabled": True,
+            "protocol": self.protocol,
+            "baseUrl": base_url,
+            "adminUrl": "{base}/{acs}".format(base=base_url, acs=ACS_PATH),
+            "redirectUris": [base_url + "/*"],
+            "frontchannelLogout": True,
+            "attributes": {
+                "saml.force.post.binding": "true",
+                "saml.client.signature": "false",
+                "saml_single_logout_service_url_post": "{base}/{acs}".format(base=base_url, acs=ACS_PATH)
+            },
+            "protocolMappers": mappers
+        }
+
+    @staticmethod
+    def _html(body, status=200):
+        return web.Response(status=status, text=body, content_type="text/html", charset="utf-8")
+
+    @staticmethod
+    def _redirect(location):
+        return web.Response(status=302, headers={"Location": location})
+
+    def _session(self, request):
+        return self.sessions.get(request.cookies.get(SESSION_COOKIE))
+
+    async def handle(self, request):
+        path = request.path.strip("/")
+        logout_path = self.sp.get("logout_path", "singleLogout").strip("/")
+
+        if path == ACS_PATH:
+            return await self.assertion_consumer(request)
+        if path == logout_path:
+            return self.logout(request)
+        if path == logout_path + "/idp" and self.protocol == "wsfed":
+            return self.wsfed_signout(request)
+        if path == LOGGED_OUT_PATH:
+            return self._html("<html><head><title>{name}</title></head><body><p>{message}</p></body></html>".format(
+                name=escape(self.sp["name"]), message=escape(self.sp["logged_out_message"])))
+        if request.method == 'GET':
+            return self.protected_page(request, path)
+        return self._html("Not found", 404)
+
+    def protected_page(self, request, path):
+        session = self._session(request)
+        if session is not None:
+            attributes = "".join("<tr><td>{name}</td><td>{values}</td></tr>".format(
+                name=escape(name), values=escape(", ".join(values)))
+                for name, values in sorted(session["attributes"].items()))
+            return self._html(
+                "<html><head><title>{name}</title></head><body><p>{message} {user}</p>"
+                "<table id=\"attributes\">{attributes}</table><a href=\"/{logout}\">Logout</a></body></html>".format(
+                    name=escape(self.sp["name"]), message=escape(self.sp["logged_in_message"]),
+                    user=escape(session["name_id"]), attributes=attributes,
+                    logout=escape(self.sp.get("logout_path", "singleLogout"))))
+
+        relay_state = secrets.token_urlsafe(16)
+        self.pending[relay_state] = path or self.sp["path"]
+        acs_url = "{base}/{acs}".format(base=self.base_url(request), acs=ACS_PATH)
+
+        if self.protocol == "wsfed":
+            response = self._redirect("{realm_url}/protocol/wsfed?{query}".format(
+                realm_url=self.realm_url,
+                query=urlencode({"wa": "wsignin1.0", "wtrealm": self.client_id, "wreply": acs_url,
+                                 "wctx": relay_state})))
+        elif self.sp.get("saml_binding") == "redirect":
+            saml_request = authn_request(self.client_id, self.realm_url + "/protocol/saml", acs_url)
+            response = self._redirect(redirect_url(self.realm_url + "/protocol/saml", saml_request,
+                                                   relay_state=relay_state))
+        else:
+            saml_request = authn_request(self.client_id, self.realm_url + "/protocol/saml", acs_url)
+            response = self._html(auto_post_page("SAML HTTP Post Binding", self.realm_url + "/protocol/saml", {
+                "SAMLRequest": base64.b64encode(saml_request.encode('utf-8')).decode('ascii'),
+                "RelayState": relay_state
+            }))
+        response.set_cookie(SESSION_COOKIE, relay_state, path="/", httponly=True)
+        return response
+
+    async def assertion_consumer(self, request):
+        params = await request.post() if request.method == 'POST' else request.query
+        logged_out = "{base}/{path}".format(base=self.base_url(request), path=LOGGED_OUT_PATH)
+
+        try:
+            if "SAMLResponse" in params:
+                token = parse_saml_response(params["SAMLResponse"], request.method != 'POST')
+                relay_state = params.get("RelayState")
+            elif params.get("wa") in ("wsignout1.0", "wsignoutcleanup1.0"):
+                self.sessions.pop(request.cookies.get(SESSION_COOKIE), None)
+                return self._redirect(logged_out)
+            elif "wresult" in params:
+                token = parse_wresult(params["wresult"])
+                relay_state = params.get("wctx")
+            else:
+                return self._html("Invalid request", 400)
+        except (ValueError, zlib.error, ExpatError):
+            return self._html("Invalid request", 400)
+
+        if token.message == "LogoutResponse":
+            self.stats["logouts"] += 1
+            return self._redirect(logged_out)
+
+        if token.name_id is None or not token.success:
+            self.stats["rejected"] += 1
+            return self._html("Login refused", 403)
+
+        session_id = secrets.token_urlsafe(24)
+        self.sessions[session_id] = {
+            "name_id": token.name_id,
+            "attributes": token.attributes,
+            "session_index": token.session_index
+        }
+        self.stats["logins"] += 1
+
+        # unsolicited responses (IDP-initiated SSO) go to the path of the SP
+        path = self.pending.pop(relay_state, None) or self.sp["path"]
+        response = self._redirect("{base}/{path}".format(base=self.base_url(request), path=path))
+        response.set_cookie(SESSION_COOKIE, session_id, path="/", httponly=True)
+        return response
+
+    def logout(self, request):
+        if self.protocol == "wsfed":
+            return self._redirect("{base}/{path}/idp".format(base=self.base_url(request),
+                                                             path=self.sp.get("logout_path", "singleLogout")))
+
+        session = self.sessions.pop(request.cookies.get(SESSION_COOKIE), None)
+        if session is None:
+            response = self._redirect("{base}/{path}".format(base=self.base_url(request), path=LOGGED_OUT_PATH))
+        else:
+            saml_request = logout_request(self.client_id, self.realm_url + "/protocol/saml", session["name_id"],
+                                          session["session_index"] or "")
+            response = self._html(auto_post_page("SAML HTTP Post Binding", self.realm_url + "/protocol/saml", {
+                "SAMLRequest": base64.b64encode(saml_request.encode('utf-8')).decode('ascii'),
+                "RelayState": secrets.token_urlsafe(16)
+            }))
+        response.del_cookie(SESSION_COOKIE, path="/")
+        return response
+
+    def wsfed_signout(self, request):
+        self.sessions.pop(request.cookies.get(SESSION_COOKIE), None)
+        self.stats["logouts"] += 1
+        response = self._redirect("{realm_url}/protocol/wsfed?{query}".format(
+            realm_url=self.realm_url,
+            query=urlencode({"wa": "wsignout1.0", "wtrealm": self.client_id,
+                             "wreply": "{base}/{acs}".format(base=self.base_url(request), acs=ACS_PATH)})))
+        response.del_cookie(SESSION_COOKIE, path="/")
+        return response
+
+
+def local_sp(template, name, ip="127.0.0.1", port=0, virtual_hosts=False):
+    """
+    Settings of a SP of a farm
+    :param template: settings of a SP of the config file, for its protocol, paths and messages
+    :param name: name, i.e. client id, of the SP
+    :param ip: address of the SP, unless virtual_hosts
+    :param port: port of the SP, 0 for a free port
+    :param virtual_hosts: the SP is named <name>.localhost, which has to resolve to the farm
+    """
+    sp = copy.deepcopy(template)
+    sp.pop("_comment", None)
+    sp.update({
+        "name": name,
+        "http_scheme": "http",
+        "ip": "{name}.localhost".format(name=name.replace("_", "-")) if virtual_hosts else ip,
+        "port": str(port)
+    })
+    return sp
+
+
+def farm_sps(template, count, ip="127.0.0.1", port=0, virtual_hosts=False, prefix="farm"):
+    """
+    Settings of SPs added to a farm, named <prefix>_<protocol><i>
+    :param template: settings of a SP of the config file, for its protocol, paths and messages
+    :param count: number of SPs
+    :param port: port of the first SP, the next ones get the next ports unless virtual_hosts; 0 for free ports
+    :return: list of SP settings
+    """
+    sps = []
+    for i in range(count):
+        sp = local_sp(template, "{prefix}_{protocol}{i}".format(prefix=prefix, protocol=template["protocol"], i=i + 1),
+                      ip, port + i if port and not virtual_hosts else port, virtual_hosts)
+        sp.pop("sso_url_name", None)
+        sps.append(sp)
+    return sps
+
+
+class SpFarm(BackgroundServer):
+    """
+    asyncio server of virtual SPs, see the comment of the module
+    """
+
+    def __init__(self, sps, idp, host="127.0.0.1"):
+        """
+        :param sps: settings of the SPs, entries of settings["sps_saml"] and settings["sps_wsfed"]; the SPs with
+        the same port share a listener and are chosen by the host of their ip; port 0 for a free port
+        :param idp: settings of the IDP, i.e. settings["idp"]
+        :param host: address to listen on
+        """
+        self.host = host
+        self.sps = [VirtualSp(sp, idp) for sp in sps]
+        self._runners = []
+
+    @staticmethod
+    def _dispatcher(sps):
+        by_host = {sp.sp["ip"].lower(): sp for sp in sps}
+
+        async def dispatch(request):
+            if len(sps) == 1:
+                return await sps[0].handle(request)
+            sp = by_host.get(request.host.rsplit(":", 1)[0].lower())
+            if sp is None:
+                return web.Response(status=404, text="Unknown SP {host}".format(host=request.host))
+            return await sp.handle(request)
+
+        return dispatch
+
+    async def start(self):
+        """
+        Listen on the ports of the SPs; the ports 0 are updated in the settings of their SP
+        """
+        listeners = {}
+        for sp in self.sps:
+            port = int(sp.sp["port"])
+            listeners.setdefault(port if port else id(sp), []).append(sp)
+
+        for sps in listeners.values():
+            app = web.Application()
+            app.router.add_route('*', "/{tail:.*}", self._dispatcher(sps))
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, self.host, int(sps[0].sp["port"])).start()
+            self._runners.append(runner)
+            for sp in sps:
+                sp.sp["port"] = str(runner.addresses[0][1])
+
+        logger.info("SP farm listening on {host} with {n} SPs on {p} ports".format(
+            host=self.host, n=len(self.sps), p=len(self._runners)))
+
+    async def stop(self):
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners = []
+
+    def settings(self):
+        """
+        :return: sps_saml and sps_wsfed sections of the config file of the farm
+        """
+        return {
+            "sps_saml": [sp.sp for sp in self.sps if sp.protocol == "saml"],
+            "sps_wsfed": [sp.sp for sp in self.sps if sp.protocol == "wsfed"]
+        }
+
+    @property
+    def stats(self):
+        stats = {"logins": 0, "logouts": 0, "rejected": 0}
+        for sp in self.sps:
+            for key, value in sp.stats.items():
+                stats[key] += value
+        return stats
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.config_file) as json_data:
+            settings = json.load(json_data)
+    except IOError as e:
+        logger.debug(e)
+        raise IOError("Config file {path} not found".format(path=args.config_file))
+
+    # the SPs of the config file keep their names, i.e. their clients of the test realm
+    sps = []
+    port = args.port
+    for sp in settings.get("sps_saml", []) + settings.get("sps_wsfed", []):
+        sps.append(local_sp(sp, sp["name"], args.listen, port, args.virtual_hosts))
+        port += 0 if args.virtual_hosts else 1
+
+    added = []
+    for count, section in ((args.saml, "sps_saml"), (args.wsfed, "sps_wsfed")):
+        if count:
+            added += farm_sps(settings[section][0], count, args.listen, port, args.virtual_hosts)
+            port += 0 if args.virtual_hosts else count
+
+    if args.saml_binding:
+        for sp in sps + added:
+            sp["saml_binding"] = args.saml_binding
+
+    farm = SpFarm(sps + added, settings["idp"], args.listen)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(farm.start())
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({**settings, **farm.settings()}, f, indent=2)
+    if args.clients:
+        clients = [sp.client_representation() for sp in farm.sps if sp.sp in added]
+        with open(args.clients, "w") as f:
+            json.dump({"ifResourceExists": "OVERWRITE", "clients": clients}, f, indent=2)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(farm.stop())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Cache of the admin tokens of Keycloak. A password grant makes Keycloak hash the password of the admin
+# (PBKDF2, thousands of iterations), so the access token is kept per (IDP, realm, client) and renewed
+# with its refresh token shortly before it expires; the password is only sent again when the refresh
+# token expired or was refused.
+
+import math
+import time
+import asyncio
+import logging
+import threading
+
+from http import HTTPStatus
+
+import helpers.requests as req
+from helpers.transport import Transport
+
+logger = logging.getLogger('acceptance-tool.helpers.tokens')
+
+
+class CachedToken():
+    """
+    Access token and refresh token of a token response, with their expiry on the monotonic clock
+    """
+
+    def __init__(self, token_response, received_at):
+        """
+        :param token_response: JSON of the response of the token endpoint
+        :param received_at: time.monotonic() when the request was sent
+        """
+        self.access_token = token_response["access_token"]
+        self.refresh_token = token_response.get("refresh_token")
+        self.expires_at = received_at + token_response.get("expires_in", 60)
+        # 0 for the tokens whose refresh token does not expire, e.g. offline tokens
+        refresh_expires_in = token_response.get("refresh_expires_in", 0)
+        self.refresh_expires_at = received_at + refresh_expires_in if refresh_expires_in else math.inf
+
+    def valid(self, margin):
+        return time.monotonic() < self.expires_at - margin
+
+    def refreshable(self, margin):
+        return self.refresh_token is not None and time.monotonic() < self.refresh_expires_at - margin
+
+
+class AdminTokenProvider():
+    """
+    Access tokens of the admins of the IDPs, cached per (IDP, realm, client_id) and refreshed ahead of
+    their expiry; the provider can be shared by threads and by asyncio tasks
+    """
+
+    def __init__(self, transport=None, refresh_margin=15):
+        """
+        :param transport: pooled transport used for the token requests, by default a transport of the provider
+        :param refresh_margin: seconds before the expiry of a token from which it is renewed
+        """
+        self.transport = transport or Transport()
+        self.refresh_margin = refresh_margin
+
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._tokens = {}
+        self.stats = {"cached": 0, "refresh_grants": 0, "password_grants": 0}
+
+    @staticmethod
+    def key(idp_scheme, idp_ip, idp_port, realm_id, client_id):
+        host = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port)
+        return host, realm_id, client_id
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _cached(self, key):
+        token = self._tokens.get(key)
+        if token is not None and token.valid(self.refresh_margin):
+            self._count("cached")
+            return token.access_token
+        return None
+
+    def get_token(self, idp_scheme, idp_ip, idp_port, realm_id, client_id, username, password):
+        """
+        Access token of an admin, from the cache, renewed with the refresh token or obtained with a password grant
+        :param idp_scheme: identity provider http scheme
+        :param idp_ip: identity provider ip
+        :param idp_port: identity provider port
+        :param realm_id: realm of the admin, usually master
+        :param client_id: client of the grant, usually admin-cli
+        :param username: username of the admin
+        :param password: password of the admin
+        :return: access token
+        """
+        key = self.key(idp_scheme, idp_ip, idp_port, realm_id, client_id)
+
+        access_token = self._cached(key)
+        if access_token is not None:
+            return access_token
+
+        # a single grant per key, the other threads wait for its token
+        with self._key_lock(key):
+            access_token = self._cached(key)
+            if access_token is not None:
+                return access_token
+
+            s = self.transport.session()
+            token = self._tokens.get(key)
+
+            if token is not None and token.refreshable(self.refresh_margin):
+                data = {
+                    "client_id": client_id,
+                    "grant_type": "refresh_token",
+                    "refresh_token": token.refresh_token
+                }
+                sent_at = time.monotonic()
+                response = req.request_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id)
+                if response.status_code == HTTPStatus.OK:
+                    self._count("refresh_grants")
+                    self._tokens[key] = CachedToken(response.json(), sent_at)
+                    return self._tokens[key].access_token
+                # e.g. the session of the admin was logged out
+                logger.info("refresh of the token of {user} refused with {status}, new password grant".format(
+                    user=username, status=response.status_code))
+
+            data = {
+                "client_id": client_id,
+                "username": username,
+                "password": password,
+                "grant_type": "password"
+            }
+            sent_at = time.monotonic()
+            response = req.request_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id)
+            response.raise_for_status()
+            self._count("password_grants")
+            self._tokens[key] = CachedToken(response.json(), sent_at)
+            return self._tokens[key].access_token
+
+    async def get_token_async(self, idp_scheme, idp_ip, idp_port, realm_id, client_id, username, password):
+        """
+        Same as get_token for asyncio tasks: the grants, if any, are sent from the default executor so that
+        the tasks and the threads share the same cache and never send two grants for the same key
+        """
+        key = self.key(idp_scheme, idp_ip, idp_port, realm_id, client_id)
+
+        access_token = self._cached(key)
+        if access_token is not None:
+            return access_token
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.get_token, idp_scheme, idp_ip, idp_port, realm_id,
+                                          client_id, username, password)
+
+    def admin_token(self, idp_settings):
+        """
+        Access token of the admin of the master realm of an IDP
+        :param idp_settings: settings of the IDP, e.g. settings["idp"] or settings["idp_external"]
+        :return: access token
+        """
+        master_realm = idp_settings["master_realm"]
+        return self.get_token(idp_settings["http_scheme"], idp_settings["ip"], idp_settings["port"],
+                              master_realm["name"], master_realm["client_id"], master_realm["username"],
+                              master_realm["password"])
+
+    async def admin_token_async(self, idp_settings):
+        master_realm = idp_settings["master_realm"]
+        return await self.get_token_async(idp_settings["http_scheme"], idp_settings["ip"], idp_settings["port"],
+                                          master_realm["name"], master_realm["client_id"],
+                                          master_realm["username"], master_realm["password"])
+
+    def invalidate(self, idp_scheme, idp_ip, idp_port, realm_id, client_id):
+        """
+        Forget the access token of a key, e.g. after a 401 of the admin API; its refresh token is still used
+        """
+        key = self.key(idp_scheme, idp_ip, idp_port, realm_id, client_id)
+        with self._key_lock(key):
+            token = self._tokens.get(key)
+            if token is not None:
+                token.expires_at = -math.inf
+
+    def invalidate_admin(self, idp_settings):
+        master_realm = idp_settings["master_realm"]
+        self.invalidate(idp_settings["http_scheme"], idp_settings["ip"], idp_settings["port"],
+                        master_realm["name"], master_realm["client_id"])
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """
+    :return: provider shared by the whole process
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = AdminTokenProvider()
+        return _provider
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+# Shared HTTP transport: every session created by a Transport has its own cookies but sends
+# its requests through the same per-host connection pools, so that the TCP and TLS handshakes
+# with the IDPs and the SPs are done once and not for every test or every flow.
+
+import threading
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from helpers.cassette import Cassette, RecordingAdapter, ReplayAdapter, RECORD, REPLAY
+
+
+class TransportStats():
+    """
+    Number of requests and of new connections per host; the other requests reused a pooled connection
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hosts = {}
+
+    def _count(self, host, index):
+        with self._lock:
+            counters = self.hosts.setdefault(host, [0, 0])
+            counters[index] += 1
+
+    def count_request(self, host):
+        self._count(host, 0)
+
+    def count_connection(self, host):
+        self._count(host, 1)
+
+    @property
+    def requests(self):
+        return sum(counters[0] for counters in self.hosts.values())
+
+    @property
+    def new_connections(self):
+        return sum(counters[1] for counters in self.hosts.values())
+
+    @property
+    def reused_connections(self):
+        return max(0, self.requests - self.new_connections)
+
+    def to_json(self):
+        return {
+            host: {
+                "requests": requests,
+                "new_connections": connections,
+                "reused_connections": max(0, requests - connections)
+            }
+            for host, (requests, connections) in self.hosts.items()
+        }
+
+    def __str__(self):
+        return "{r} requests, {n} new connections, {u} reused connections".format(
+            r=self.requests,
+            n=self.new_connections,
+            u=self.reused_connections
+        )
+
+
+def _counting_pool(pool_class, stats):
+    """
+    Subclass of a urllib3 connection pool that counts its requests and the connections it opens
+    """
+    class CountingConnection(pool_class.ConnectionCls):
+        def connect(self):
+            stats.count_connection(self.host)
+            return super().connect()
+
+    class CountingPool(pool_class):
+        ConnectionCls = CountingConnection
+
+        def urlopen(self, method, url, *args, **kwargs):
+            stats.count_request(self.host)
+            return super().urlopen(method, url, *args, **kwargs)
+
+    return CountingPool
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    Transport adapter whose connection pools count the reuse of their connections
+    """
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.stats),
+            'https': _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+
+class Transport():
+    """
+    Per-host connection pools shared by all the sessions it creates
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, cassette=None):
+        """
+        :param pool_connections: number of hosts whose pool is kept
+        :param pool_maxsize: maximum number of connections kept per host
+        :param pool_block: wait for a free connection instead of opening one more when a pool is exhausted
+        :param cassette: optional Cassette the exchanges are recorded to, or replayed from, see helpers.cassette
+        """
+        self.stats = TransportStats()
+        self.cassette = cassette
+
+        if cassette is not None and cassette.mode == REPLAY:
+            self.adapter = ReplayAdapter(cassette, self.stats)
+            return
+
+        self.adapter = PooledAdapter(
+            self.stats,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+        if cassette is not None:
+            self.adapter = RecordingAdapter(self.adapter, cassette)
+
+    @classmethod
+    def from_settings(cls, settings, pool_maxsize=None):
+        """
+        Size the pools from the "transport" section of the settings; by default one pool per IDP and SP
+        :param settings: settings of the IDP and SP
+        :param pool_maxsize: overrides the maximum number of connections per host, e.g. the number of virtual users
+        :return: Transport
+        """
+        hosts = {sp["ip"] for sp in settings.get("sps_saml", []) + settings.get("sps_wsfed", [])}
+        for idp in ("idp", "idp_external"):
+            if idp in settings:
+                hosts.add(settings[idp]["ip"])
+
+        config = settings.get("transport", {})
+
+        # e.g. "cassette": {"path": "run.cassette", "mode": "replay"}
+        cassette = None
+        if settings.get("cassette"):
+            cassette = Cassette(settings["cassette"]["path"], settings["cassette"].get("mode", REPLAY))
+
+        return cls(
+            pool_connections=config.get("pool_connections", max(len(hosts), 1)),
+            pool_maxsize=pool_maxsize or config.get("pool_maxsize", 10),
+            pool_block=config.get("pool_block", False),
+            cassette=cassette
+        )
+
+    def session(self):
+        """
+        New session, with its own cookies, that sends its requests through the shared pools
+        :return: Session
+        """
+        s = Session()
+        s.mount('http://', self.adapter)
+        s.mount('https://', self.adapter)
+        return s
+
+    def close(self):
+        self.adapter.close()
+        if self.cassette is not None and self.cassette.mode == RECORD:
+            self.cassette.save()
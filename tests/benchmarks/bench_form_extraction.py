@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+import sys
+import base64
+import timeit
+import argparse
+
+from helpers.forms import extract_form
+
+version = "1.0"
+prog_name = sys.argv[0]
+usage = """{pn} [options]
+Micro-benchmark of the extraction of the forms of the SSO flows: helpers.forms against BeautifulSoup and lxml
+""".format(
+    pn=prog_name
+)
+parser = argparse.ArgumentParser(prog="{pn} {v}".format(pn=prog_name, v=version), usage=usage)
+
+parser.add_argument('--number', dest="number", type=int, default=2000, help='Number of extractions per page')
+
+# Keycloak login page, with the stylesheets and scripts of the theme
+LOGIN_PAGE = ("""<!DOCTYPE html><html xmlns="http://www.w3.org/1999/xhtml" class="login-pf"><head>
+<meta charset="utf-8"><meta http-equiv="Content-Type" content="text/html; charset=UTF-8" />
+<title>Log in to automatic_keycloak_testing</title>
+""" + "".join('<link href="/auth/resources/3.4.3.final/login/keycloak/css/theme{i}.css" rel="stylesheet" />\n'.format(i=i)
+              for i in range(20)) + """<script>function f() { return 1 < 2; }</script>
+</head><body class=""><div id="kc-logo"><a href="http://www.keycloak.org"><div id="kc-logo-wrapper"></div></a></div>
+<div id="kc-container" class="container"><div id="kc-content" class="row"><div id="kc-form" class="col-sm-12">
+<div id="kc-form-wrapper"><form id="kc-form-login" class="form-horizontal" onsubmit="login.disabled = true; return true;"
+action="https://dev-idp.cloudtrust.io:443/auth/realms/automatic_keycloak_testing/login-actions/authenticate?code=Zx1Q&amp;execution=2f1e&amp;client_id=sp_saml1"
+method="post"><div class="form-group"><label for="username" class="control-label">Username or email</label>
+<input tabindex="1" id="username" class="form-control" name="username" value="" type="text" autofocus autocomplete="off" />
+</div><div class="form-group"><label for="password" class="control-label">Password</label>
+<input tabindex="2" id="password" class="form-control" name="password" type="password" autocomplete="off" /></div>
+<div id="kc-form-buttons"><input tabindex="4" class="btn btn-primary" name="login" id="kc-login" type="submit" value="Log in"/>
+</div></form></div></div>
+<div id="kc-social-providers"><ul><li><a href="/auth/realms/automatic_keycloak_testing/broker/cloudtrust/login?code=Zx1Q"
+id="zocial-cloudtrust" class="zocial cloudtrust"> <span>cloudtrust</span></a></li></ul></div>
+</div></div></body></html>""").encode('utf-8')
+
+# Auto-post page carrying a signed SAML response of a realistic size
+SAML_RESPONSE = base64.b64encode(b'<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol">' +
+                                 b'<saml:Attribute Name="userIP"/>' * 250 + b'</samlp:Response>').decode('ascii')
+POST_PAGE = ("""<HTML><HEAD><TITLE>SAML HTTP Post Binding</TITLE></HEAD><BODY Onload="document.forms[0].submit()">
+<FORM METHOD="POST" ACTION="https://dev-saml1.cloudtrust.io:443/saml/acs">
+<INPUT TYPE="HIDDEN" NAME="SAMLResponse" VALUE="{response}"/>
+<INPUT TYPE="HIDDEN" NAME="RelayState" VALUE="/tokenInformation"/>
+<NOSCRIPT><P>JavaScript is disabled. We strongly recommend to enable it. Click the button below to continue.</P>
+<INPUT TYPE="SUBMIT" VALUE="CONTINUE" /></NOSCRIPT></FORM></BODY></HTML>""").format(response=SAML_RESPONSE).encode('utf-8')
+
+
+def with_forms(page, form_id):
+    form = extract_form(page, form_id=form_id)
+    return form.get('action'), form.get('method'), form.fields
+
+
+def with_beautifulsoup(features):
+    from bs4 import BeautifulSoup
+
+    def extract(page, form_id):
+        soup = BeautifulSoup(page, features)
+        form = soup.find("form", {"id": form_id}) if form_id else soup.body.form
+        return form.get('action'), form.get('method'), {i.get('name'): i.get('value') for i in form.find_all('input')}
+    return extract
+
+
+def with_lxml():
+    import lxml.html
+
+    def extract(page, form_id):
+        document = lxml.html.fromstring(page)
+        form = document.get_element_by_id(form_id) if form_id else document.forms[0]
+        return form.get('action'), form.get('method'), {i.get('name'): i.get('value') for i in form.iter('input')}
+    return extract
+
+
+if __name__ == "__main__":
+
+    args = parser.parse_args()
+
+    extractors = [("helpers.forms", with_forms)]
+    for name, factory in [("bs4 html.parser", lambda: with_beautifulsoup('html.parser')),
+                          ("bs4 lxml", lambda: with_beautifulsoup('lxml')),
+                          ("lxml.html", with_lxml)]:
+        try:
+            extractor = factory()
+            extractor(POST_PAGE, None)
+        except Exception as e:
+            print("{name:<20}not available: {e}".format(name=name, e=e))
+            continue
+        extractors.append((name, extractor))
+
+    for page_name, page, form_id in [("login page", LOGIN_PAGE, "kc-form-login"), ("auto-post page", POST_PAGE, None)]:
+        print("{page} ({size} bytes)".format(page=page_name, size=len(page)))
+
+        expected = with_forms(page, form_id)
+        for name, extractor in extractors:
+            assert extractor(page, form_id) == expected, name
+            seconds = timeit.timeit(lambda: extractor(page, form_id), number=args.number)
+            print("    {name:<20}{us:>10.1f} us/extraction".format(name=name, us=seconds / args.number * 1e6))
@@ -15,11 +15,20 @@ import pytest
 import json
 import logging
 
+from concurrent.futures import ThreadPoolExecutor
+
 import helpers.requests as req
 from helpers.logging import log_request
-
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from helpers.forms import extract_form, extract_social_providers
+from helpers.transport import Transport
+from helpers.realm import import_realm_if_changed, wait_for_realm
+from helpers.tokens import AdminTokenProvider
+from helpers.admin import KeycloakAdminClient
+from helpers.sharding import worker_suffix, worker_farm, worker_settings
+from helpers.signatures import SignatureVerifier
+from helpers.expectations import compile_expectations
+
+from requests import Request
 from http import HTTPStatus
 
 
@@ -34,10 +43,25 @@ logger.setLevel(logging.DEBUG)
 def pytest_addoption(parser):
     parser.addoption("--config-file", action="store", help="Json configuration file ", dest="config_file")
     parser.addoption("--standard", action="store", help="Oasis standard ", dest="standard")
+    parser.addoption("--record-cassette", action="store", help="Record the HTTP exchanges to this cassette file",
+                     dest="record_cassette")
+    parser.addoption("--replay-cassette", action="store", help="Replay the HTTP exchanges of this cassette file",
+                     dest="replay_cassette")
+    parser.addoption("--verify-signatures", action="store_true",
+                     help="Verify the signature of the tokens with the keys of the test realm", dest="verify_signatures")
 
 
 @pytest.fixture(scope='session')
-def settings(pytestconfig):
+def settings(pytestconfig, tmpdir_factory):
+    """
+    Fixture providing the settings of the config file; in a parallel run (pytest -n) every worker gets
+    its own copies of the test realms and its own SP farm, see helpers.sharding, and the cassette options set
+    the cassette of the transport, see helpers.cassette; the messages of the IDP and SPs are compiled once for
+    the session, see helpers.expectations
+    :param pytestconfig: fixture that provides the path of the config file
+    :param tmpdir_factory: fixture that provides the directory of the realm copies of the worker
+    :return:
+    """
     try:
         with open(pytestconfig.getoption('config_file')) as json_data:
             config = json.load(json_data)
@@ -45,20 +69,77 @@ def settings(pytestconfig):
     except IOError as e:
         raise IOError("Config file {path} not found".format(path=pytestconfig.getoption('config_file')))
 
-    return config
+    suffix = worker_suffix()
+    farm = None
+    if suffix:
+        farm = worker_farm(config, suffix).start_in_thread()
+        config = worker_settings(config, suffix, str(tmpdir_factory.mktemp("realms")), farm)
+        logger.info("Worker realms: {realms}".format(realms=config["sharding"]["realms"]))
+
+    if pytestconfig.getoption('record_cassette'):
+        config["cassette"] = {"path": pytestconfig.getoption('record_cassette'), "mode": "record"}
+    elif pytestconfig.getoption('replay_cassette'):
+        config["cassette"] = {"path": pytestconfig.getoption('replay_cassette'), "mode": "replay"}
+
+    # one token per test: the tokens are checked in the test process, without a pool
+    if pytestconfig.getoption('verify_signatures'):
+        config["signatures"] = {"processes": 0}
+
+    compile_expectations(config)
+
+    yield config
+
+    if farm is not None:
+        logger.info("Worker SP farm: {stats}".format(stats=farm.stats))
+        farm.stop_thread()
+
+
+@pytest.fixture(scope='session')
+def transport(settings):
+    """
+    Fixture providing the HTTP transport shared by all the fixtures and tests: every test gets its own
+    session, hence its own cookies, but the connections to the IDPs and SPs are pooled for the whole run
+    :param settings: settings of the IDP and SP, with the optional sizing of the pools
+    :return:
+    """
+    transport = Transport.from_settings(settings)
+
+    yield transport
+
+    logger.info("Transport: {stats}".format(stats=transport.stats))
+
+    transport.close()
+
+
+@pytest.fixture(scope='session')
+def signature_verifier(settings, transport):
+    """
+    Fixture providing the verifier of the signatures of the tokens, None unless --verify-signatures is given
+    :param settings: settings of the IDP and SP
+    :param transport: shared pooled HTTP transport, used to fetch the keys of the test realm
+    :return:
+    """
+    verifier = SignatureVerifier.from_settings(settings, transport.session())
+
+    yield verifier
+
+    if verifier is not None:
+        verifier.close()
 
 
 @pytest.fixture()
-def login_sso_form(settings, pytestconfig):
+def login_sso_form(settings, transport, signature_verifier, pytestconfig):
     """
     Fixture to perform the log in
     :param settings: settings of the IDP and SP
+    :param transport: shared pooled HTTP transport
+    :param signature_verifier: optional verifier of the signature of the token
     :param pytestconfig: fixture that provides the standard used for log in: WSFED or SAML
     :return:
     """
     standard = pytestconfig.getoption('standard')
 
-    s = Session()
+    s = transport.session()
 
     # Standard
     if standard == "WSFED":
@@ -114,9 +195,7 @@ def login_sso_form(settings, pytestconfig):
 
     keycloak_cookie = response.cookies
 
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    form = soup.find("form", {"id": keycloak_login_form_id})
+    form = extract_form(response.content, form_id=keycloak_login_form_id)
 
     url_form = form.get('action')
     method_form = form.get('method')
@@ -141,8 +220,7 @@ def login_sso_form(settings, pytestconfig):
 
     keycloak_cookie_2 = response.cookies
 
-    soup = BeautifulSoup(response.content, 'html.parser')
-    form = soup.body.form
+    form = extract_form(response.content)
 
     url_form = form.get('action')
     inputs = form.find_all('input')
@@ -153,6 +231,9 @@ def login_sso_form(settings, pytestconfig):
     for input in inputs:
         token[input.get('name')] = input.get('value')
 
+    if signature_verifier is not None:
+        signature_verifier.verify(token)
+
     if standard == "WSFED":
         (response, sp_cookie) = req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme, idp_ip,
                                                          idp_port, method_form, url_form, token, session_cookie,
@@ -166,16 +247,17 @@ def login_sso_form(settings, pytestconfig):
 
 
 @pytest.fixture()
-def login_broker_sso_form(settings, pytestconfig):
+def login_broker_sso_form(settings, transport, pytestconfig):
     """
     Fixture to perform the log in when we have a broker and an external IDP
     :param settings: settings of the IDP and SP
+    :param transport: shared pooled HTTP transport
     :param pytestconfig: fixture that provides the standard used for log in: WSFED or SAML
     :return:
     """
     standard = pytestconfig.getoption('standard')
 
-    s = Session()
+    s = transport.session()
 
     # Standard
     if standard == "WSFED":
@@ -227,16 +309,16 @@ def login_broker_sso_form(settings, pytestconfig):
     response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie)
 
     # In the login page we can choose to login with the external IDP
-    soup = BeautifulSoup(response.content, 'html.parser')
+    providers = extract_social_providers(response.content)
 
-    div = soup.find("div", {"id": "kc-social-providers"})
+    assert providers is not None
 
     # we can have several idp external; choose the one needed for the test
-    all_li = div.find_all('li')
-    for li in all_li:
-        if li.span.text == idp_broker:
-            external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + li.a[
-                'href']
+    external_idp_path = providers.get(idp_broker)
+
+    assert external_idp_path is not None
+
+    external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + external_idp_path
 
     # Select to login with the external IDP
     req_choose_external_idp = Request(
@@ -255,8 +337,7 @@ def login_broker_sso_form(settings, pytestconfig):
     logger.debug(response.status_code)
 
     # get the HTTP binding response with the url to the external IDP
-    soup = BeautifulSoup(response.content, 'html.parser')
-    form = soup.body.form
+    form = extract_form(response.content)
 
     url_form = form.get('action')
     inputs = form.find_all('input')
@@ -306,9 +387,7 @@ def login_broker_sso_form(settings, pytestconfig):
     else:
         keycloak_cookie2 = response.cookies
 
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    form = soup.find("form", {"id": keycloak_login_form_id})
+    form = extract_form(response.content, form_id=keycloak_login_form_id)
 
     url_form = form.get('action')
     method_form = form.get('method')
@@ -329,8 +408,7 @@ def login_broker_sso_form(settings, pytestconfig):
     keycloak_cookie3 = response.cookies
 
     # get the HTTP binding response with the url to the broker IDP
-    soup = BeautifulSoup(response.content, 'html.parser')
-    form = soup.body.form
+    form = extract_form(response.content)
 
     url_form = form.get('action')
     inputs = form.find_all('input')
@@ -360,8 +438,7 @@ def login_broker_sso_form(settings, pytestconfig):
         response = req.broker_fill_in_form(logger, s, response, header, keycloak_cookie, idp_broker, settings)
 
     # Get the token (SAML response) from the broker IDP
-    soup = BeautifulSoup(response.content, 'html.parser')
-    form = soup.body.form
+    form = extract_form(response.content)
 
     url_form = form.get('action')
     inputs = form.find_all('input')
@@ -380,79 +457,52 @@ def login_broker_sso_form(settings, pytestconfig):
 
 
 @pytest.fixture(scope='session')
-def export_realm(settings):
+def admin_tokens(transport):
     """
-    Fixture to perform the export of a realm to a JSON file
-    :param settings:
+    Fixture providing the admin tokens of the IDPs, cached and refreshed for the whole run so that the
+    fixtures do not send a password grant each
+    :param transport: shared pooled HTTP transport
     :return:
     """
+    admin_tokens = AdminTokenProvider(transport)
 
-    # Identity provider settings
-    idp_ip = settings["idp"]["ip"]
-    idp_port = settings["idp"]["port"]
-    idp_scheme = settings["idp"]["http_scheme"]
-
-    idp_username = settings["idp"]["master_realm"]["username"]
-    idp_password = settings["idp"]["master_realm"]["password"]
-    idp_client_id = settings["idp"]["master_realm"]["client_id"]
-
-    idp_realm_id = settings["idp"]["master_realm"]["name"]
-
-    idp_realm_test = settings["idp"]["test_realm"]["name"]
-
-    filename = settings["idp"]["test_realm"]["json_file"]
+    yield admin_tokens
 
-    s = Session()
+    logger.info("Admin tokens: {stats}".format(stats=admin_tokens.stats))
 
-    access_token_data={
-        "client_id": idp_client_id,
-        "username": idp_username,
-        "password": idp_password,
-        "grant_type": "password"
-    }
 
-    access_token = req.get_access_token(logger, s, access_token_data, idp_scheme, idp_port, idp_ip, idp_realm_id)
+@pytest.fixture(scope='session')
+def admin_clients(settings, transport, admin_tokens):
+    """
+    Fixture providing the clients of the admin API of the IDPs, whose requests go through the shared pools
+    :param settings: settings of the IDP and SP
+    :param transport: shared pooled HTTP transport
+    :param admin_tokens: cached admin tokens of the IDPs
+    :return: dict of idp and idp_external to their KeycloakAdminClient
+    """
+    admin_clients = {idp: KeycloakAdminClient(settings[idp], transport, admin_tokens)
+                     for idp in ("idp", "idp_external") if idp in settings}
 
-    header = {
-        'Accept': "application/json,text/plain, */*",
-        'Accept-Encoding': "gzip, deflate",
-        'Accept-Language': "en-US,en;q=0.5",
-        'User-Agent': "Mozilla/5.0 (X11; Fedora; Linux x86_64; rv:59.0) Gecko/20100101 Firefox/59.0",
-        'Connection': "keep-alive",
-        'Content-Type': "application/json",
-        'Referer': "{scheme}://{ip}:{port}/auth/admin/master/console/".format(
-            scheme=idp_scheme,
-            ip=idp_ip,
-            port=idp_port
-        ),
-        'Host': "{ip}:{port}".format(
-            ip=idp_ip,
-            port=idp_port
-        ),
-        "DNT": "1",
-        "Keep-Alive": "timeout=15, max=3",
-        'Authorization': 'Bearer ' + access_token
+    yield admin_clients
 
-    }
+    for idp, admin in admin_clients.items():
+        logger.info("Admin API of {idp}: {stats}".format(idp=idp, stats=admin.stats))
 
-    req_export_realm = Request(
-        method='GET',
-        url="{scheme}://{ip}:{port}/auth/realms/{realm}/export/realm".format(
-            scheme=idp_scheme,
-            ip=idp_ip,
-            port=idp_port,
-            realm=idp_realm_test
-        ),
-        headers=header
-    )
 
-    prepared_request = req_export_realm.prepare()
+@pytest.fixture(scope='session')
+def export_realm(settings, admin_clients):
+    """
+    Fixture to perform the export of a realm to a JSON file
+    :param settings:
+    :param admin_clients: clients of the admin API of the IDPs
+    :return:
+    """
 
-    log_request(logger, req_export_realm)
+    idp_realm_test = settings["idp"]["test_realm"]["name"]
 
-    response = s.send(prepared_request, verify=False)
+    filename = settings["idp"]["test_realm"]["json_file"]
 
-    logger.debug(response.status_code)
+    response = admin_clients["idp"].export_realm(idp_realm_test)
 
     with open(filename, "w") as f:
         f.write(response.text)
@@ -460,235 +510,88 @@ def export_realm(settings):
     return response
 
 
-@pytest.fixture(scope='session')
-def import_realm(settings):
+def setup_realm(settings, transport, admin_clients, idp):
     """
-    Fixture to perform the import of a realm from a JSON file
-    :param settings:
-    :return:
+    Import the test realm of an identity provider from its JSON file, skipped when the realm is unchanged,
+    and wait until the realm answers
+    :param settings: settings of the IDP and SP
+    :param transport: shared pooled HTTP transport
+    :param admin_clients: clients of the admin API of the IDPs
+    :param idp: key of the identity provider in the settings, idp or idp_external
+    :return: response of the import
     """
 
     # Identity provider settings
-    idp_ip = settings["idp"]["ip"]
-    idp_port = settings["idp"]["port"]
-    idp_scheme = settings["idp"]["http_scheme"]
-
-    idp_username = settings["idp"]["master_realm"]["username"]
-    idp_password = settings["idp"]["master_realm"]["password"]
-    idp_client_id = settings["idp"]["master_realm"]["client_id"]
-
-    idp_realm_id = settings["idp"]["master_realm"]["name"]
-
-    filename = settings["idp"]["test_realm"]["json_file"]
-
-    s = Session()
-
-    access_token_data={
-        "client_id": idp_client_id,
-        "username": idp_username,
-        "password": idp_password,
-        "grant_type": "password"
-    }
-
-    access_token = req.get_access_token(logger, s, access_token_data, idp_scheme, idp_port, idp_ip, idp_realm_id)
+    idp_ip = settings[idp]["ip"]
+    idp_port = settings[idp]["port"]
+    idp_scheme = settings[idp]["http_scheme"]
 
-    header = {
-        'Accept': "application/json,text/plain, */*",
-        'Accept-Encoding': "gzip, deflate",
-        'Accept-Language': "en-US,en;q=0.5",
-        'User-Agent': "Mozilla/5.0 (X11; Fedora; Linux x86_64; rv:59.0) Gecko/20100101 Firefox/59.0",
-        'Connection': "keep-alive",
-        'Content-Type': "application/json",
-        'Referer': "{scheme}://{ip}:{port}/auth/admin/master/console/".format(
-            scheme=idp_scheme,
-            ip=idp_ip,
-            port=idp_port
-        ),
-        'Host': "{ip}:{port}".format(
-            ip=idp_ip,
-            port=idp_port
-        ),
-        "DNT": "1",
-        "Keep-Alive": "timeout=15, max=3",
-        'Authorization': 'Bearer ' + access_token
+    idp_realm_test = settings[idp]["test_realm"]["name"]
 
-    }
+    filename = settings[idp]["test_realm"]["json_file"]
 
     with open(filename, "r") as f:
         realm_representation = f.read()
 
-    req_import_realm = Request(
-        method='POST',
-        url="{scheme}://{ip}:{port}/auth/admin/realms".format(
-            scheme=idp_scheme,
-            ip=idp_ip,
-            port=idp_port,
-        ),
-        headers=header,
-        data=realm_representation
-    )
+    # the realm is only imported again when the JSON file changed since the last import
+    (action, response) = import_realm_if_changed(logger, admin_clients[idp], realm_representation)
 
-    prepared_request = req_import_realm.prepare()
+    logger.info("Import of {file}: realm {action}".format(file=filename, action=action))
 
-    log_request(logger, req_import_realm)
+    waited = wait_for_realm(logger, transport.session(), idp_scheme, idp_port, idp_ip, idp_realm_test)
 
-    response = s.send(prepared_request, verify=False)
-
-    logger.debug(response.status_code)
+    logger.info("Realm {realm} ready after {t:.1f}s".format(realm=idp_realm_test, t=waited))
 
     return response
 
 
 @pytest.fixture(scope='session')
-def import_realm_external(settings):
+def testing_environment(settings, transport, admin_clients):
     """
-    Fixture to perform the import of the external realm from a JSON file
-    :param settings:
-    :return:
+    Fixture to set up the realms of the broker IDP and of the external IDP: the two Keycloak instances are
+    independent, so both realms are imported at the same time and the tests start when the slower one is ready
+    :param settings: settings of the IDP and SP
+    :param transport: shared pooled HTTP transport
+    :param admin_clients: clients of the admin API of the IDPs
+    :return: dict of idp and idp_external to the response of the import of their realm
     """
+    idps = [idp for idp in ("idp", "idp_external") if idp in settings]
 
-    # Identity provider settings
-    idp_ip = settings["idp_external"]["ip"]
-    idp_port = settings["idp_external"]["port"]
-    idp_scheme = settings["idp_external"]["http_scheme"]
-
-    idp_username = settings["idp_external"]["master_realm"]["username"]
-    idp_password = settings["idp_external"]["master_realm"]["password"]
-    idp_client_id = settings["idp_external"]["master_realm"]["client_id"]
-
-    idp_realm_id = settings["idp_external"]["master_realm"]["name"]
-
-    filename = settings["idp_external"]["test_realm"]["json_file"]
-
-    s = Session()
-
-    access_token_data={
-        "client_id": idp_client_id,
-        "username": idp_username,
-        "password": idp_password,
-        "grant_type": "password"
-    }
-
-    access_token = req.get_access_token(logger, s, access_token_data, idp_scheme, idp_port, idp_ip, idp_realm_id)
-
-    header = {
-        'Accept': "application/json,text/plain, */*",
-        'Accept-Encoding': "gzip, deflate",
-        'Accept-Language': "en-US,en;q=0.5",
-        'User-Agent': "Mozilla/5.0 (X11; Fedora; Linux x86_64; rv:59.0) Gecko/20100101 Firefox/59.0",
-        'Connection': "keep-alive",
-        'Content-Type': "application/json",
-        'Referer': "{scheme}://{ip}:{port}/auth/admin/master/console/".format(
-            scheme=idp_scheme,
-            ip=idp_ip,
-            port=idp_port
-        ),
-        'Host': "{ip}:{port}".format(
-            ip=idp_ip,
-            port=idp_port
-        ),
-        "DNT": "1",
-        "Keep-Alive": "timeout=15, max=3",
-        'Authorization': 'Bearer ' + access_token
-
-    }
-
-    with open(filename, "r") as f:
-        realm_representation = f.read()
-
-    req_import_realm = Request(
-        method='POST',
-        url="{scheme}://{ip}:{port}/auth/admin/realms".format(
-            scheme=idp_scheme,
-            ip=idp_ip,
-            port=idp_port,
-        ),
-        headers=header,
-        data=realm_representation
-    )
+    with ThreadPoolExecutor(max_workers=len(idps)) as executor:
+        responses = executor.map(lambda idp: setup_realm(settings, transport, admin_clients, idp), idps)
 
-    prepared_request = req_import_realm.prepare()
+        return dict(zip(idps, responses))
 
-    log_request(logger, req_import_realm)
 
-    response = s.send(prepared_request, verify=False)
+@pytest.fixture(scope='session')
+def import_realm(testing_environment):
+    """
+    Fixture to perform the import of a realm from a JSON file, skipped when the realm is unchanged
+    :param testing_environment: fixture that sets up the realms of both IDPs
+    :return:
+    """
+    return testing_environment["idp"]
 
-    logger.debug(response.status_code)
 
-    return response
+@pytest.fixture(scope='session')
+def import_realm_external(testing_environment):
+    """
+    Fixture to perform the import of the external realm from a JSON file, skipped when the realm is unchanged
+    :param testing_environment: fixture that sets up the realms of both IDPs
+    :return:
+    """
+    return testing_environment["idp_external"]
 
 
 
 @pytest.fixture(scope='session')
-def delete_realm(settings):
+def delete_realm(settings, admin_clients):
     """
     Fixture to perform the deletion of a realm from Keycloak
     :param settings:
+    :param admin_clients: clients of the admin API of the IDPs
     :return:
     """
-    # Identity provider settings
-    idp_ip = settings["idp"]["ip"]
-    idp_port = settings["idp"]["port"]
-    idp_scheme = settings["idp"]["http_scheme"]
-
-    idp_username = settings["idp"]["master_realm"]["username"]
-    idp_password = settings["idp"]["master_realm"]["password"]
-    idp_client_id = settings["idp"]["master_realm"]["client_id"]
-
-    idp_realm_id = settings["idp"]["master_realm"]["name"]
-
     idp_realm_test = settings["idp"]["test_realm"]["name"]
 
-    s = Session()
-
-    access_token_data={
-        "client_id": idp_client_id,
-        "username": idp_username,
-        "password": idp_password,
-        "grant_type": "password"
-    }
-
-    access_token = req.get_access_token(logger, s, access_token_data, idp_scheme, idp_port, idp_ip, idp_realm_id)
-
-    header = {
-        'Accept': "application/json,text/plain, */*",
-        'Accept-Encoding': "gzip, deflate",
-        'Accept-Language': "en-US,en;q=0.5",
-        'User-Agent': "Mozilla/5.0 (X11; Fedora; Linux x86_64; rv:59.0) Gecko/20100101 Firefox/59.0",
-        'Connection': "keep-alive",
-        'Content-Type': "application/json",
-        'Referer': "{scheme}://{ip}:{port}/auth/admin/master/console/".format(
-            scheme=idp_scheme,
-            ip=idp_ip,
-            port=idp_port
-        ),
-        'Host': "{ip}:{port}".format(
-            ip=idp_ip,
-            port=idp_port
-        ),
-        "DNT": "1",
-        "Keep-Alive": "timeout=15, max=3",
-        'Authorization': 'Bearer ' + access_token
-
-    }
-
-    req_delete_realm = Request(
-        method='DELETE',
-        url="{scheme}://{ip}:{port}/auth/admin/realms/{realm}".format(
-            scheme=idp_scheme,
-            ip=idp_ip,
-            port=idp_port,
-            realm=idp_realm_test
-        ),
-        headers=header,
-    )
-
-    prepared_request = req_delete_realm.prepare()
-
-    log_request(logger, req_delete_realm)
-
-    response = s.send(prepared_request, verify=False)
-
-    logger.debug(response.status_code)
-
-    return response
+    return admin_clients["idp"].delete_realm(idp_realm_test)
@@ -15,14 +15,14 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
 from http import HTTPStatus
 from helpers.logging import log_request
+from helpers.forms import extract_form, extract_social_providers
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 
 author = "Sonia Bogos"
 maintainer = "Sonia Bogos"
@@ -51,16 +51,17 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
 
     """
 
-    def test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK_SP_initiated(self, settings):
+    def test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK_SP_initiated(self, settings, transport):
         """
         Scenario: User logs in to SP1 where he has the appropriate attribute.
         Same user tries to log in to SP2, SP that he is authorized to access. He should
         be able to access SP2 without authenticating again.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -122,18 +123,12 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie)
 
             # In the login page we can choose to login with the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
+            providers = extract_social_providers(response.content)
 
-            div = soup.find("div", {"id": "kc-social-providers"})
-
-            assert div is not None
+            assert providers is not None
 
             # we can have several idp external; choose the one needed for the test
-            all_li = div.find_all('li')
-            for li in all_li:
-                if li.span.text == idp_broker:
-                    external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + li.a[
-                        'href']
+            external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + providers[idp_broker]
 
             assert external_idp_url is not None
 
@@ -156,8 +151,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             assert response.status_code == HTTPStatus.OK or response.status_code == HTTPStatus.FOUND
 
             # get the HTTP binding response with the url to the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -212,9 +206,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             else:
                 keycloak_cookie_ext = response.cookies
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            form = soup.find("form", {"id": keycloak_login_form_id})
+            form = extract_form(response.content, form_id=keycloak_login_form_id)
 
             assert form is not None
 
@@ -242,8 +234,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             keycloak_cookie2 = response.cookies
 
             # get the HTTP binding response with the url to the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -279,8 +270,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             logger.debug(response.status_code)
 
             # Get the token (SAML response) from the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -298,7 +288,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
             # User is logged in on SP1
 
@@ -321,8 +311,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp,
                                            {**session_cookie2, **keycloak_cookie3})
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -340,18 +329,19 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
 
             assert response.status_code == HTTPStatus.OK
 
-            assert re.search(sp2_message, response.text) is not None
+            assert expect(response, sp2_message)
 
-    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK_IDP_initiated(self, settings):
+    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK_IDP_initiated(self, settings, transport):
         """
         Scenario: User logs in to the IDP. He then accesses SP1 where he has the appropriate attribute.
         Same user tries to log in to SP2, that he is authorized to access. He should
         be able to access SP2 without authenticating again.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -410,7 +400,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             assert response.status_code == HTTPStatus.OK
 
             # Assert we are logged in
-            assert re.search(idp_message, response.text) is not None
+            assert expect(response, idp_message)
 
             (session_cookie, response) = req.access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path, idp_ip,
                                                             idp_port)
@@ -433,8 +423,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
 
             assert response.status_code == HTTPStatus.OK
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -452,7 +441,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
             # User is logged in on SP1
 
@@ -475,8 +464,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
             response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp,
                                            {**session_cookie2, **keycloak_cookie3})
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -494,4 +482,4 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_ABAC_OK():
 
             assert response.status_code == HTTPStatus.OK
 
-            assert re.search(sp2_message, response.text) is not None
\ No newline at end of file
+            assert expect(response, sp2_message)
\ No newline at end of file
@@ -15,14 +15,14 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
 from http import HTTPStatus
 from helpers.logging import log_request
+from helpers.forms import extract_form, extract_social_providers
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 
 author = "Sonia Bogos"
 maintainer = "Sonia Bogos"
@@ -51,16 +51,17 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
     Company A applications are protected by CloudTrust which acts as a broker.
     """
 
-    def test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK_SP_initiated(self, settings):
+    def test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK_SP_initiated(self, settings, transport):
         """
         Scenario: User logs in to SP1 where he has the appropriate role.
         Same user tries to log in to SP2, SP that he is authorized to access. He should
         be able to access SP2 without authenticating again.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -121,18 +122,12 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie)
 
             # In the login page we can choose to login with the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
+            providers = extract_social_providers(response.content)
 
-            div = soup.find("div", {"id": "kc-social-providers"})
-
-            assert div is not None
+            assert providers is not None
 
             # we can have several idp external; choose the one needed for the test
-            all_li = div.find_all('li')
-            for li in all_li:
-                if li.span.text == idp_broker:
-                    external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + li.a[
-                        'href']
+            external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + providers[idp_broker]
 
             assert external_idp_url is not None
 
@@ -155,8 +150,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             assert response.status_code == HTTPStatus.OK or response.status_code == HTTPStatus.FOUND
 
             # get the HTTP binding response with the url to the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -211,9 +205,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             else:
                 keycloak_cookie_ext = response.cookies
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            form = soup.find("form", {"id": keycloak_login_form_id})
+            form = extract_form(response.content, form_id=keycloak_login_form_id)
 
             assert form is not None
 
@@ -241,8 +233,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             keycloak_cookie2 = response.cookies
 
             # get the HTTP binding response with the url to the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -278,8 +269,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             logger.debug(response.status_code)
 
             # Get the token (SAML response) from the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -297,7 +287,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
             # User is logged in on SP1
 
@@ -320,8 +310,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp,
                                            {**session_cookie2, **keycloak_cookie3})
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -339,18 +328,19 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
 
             assert response.status_code == HTTPStatus.OK
 
-        assert re.search(sp2_message, response.text) is not None
+        assert expect(response, sp2_message)
 
-    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_RBAC_OK_IDP_initiated(self, settings):
+    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_RBAC_OK_IDP_initiated(self, settings, transport):
         """
         Scenario: User logs in to the IDP. He then accesses SP1 where he has the appropriate role.
         Same user tries to log in to SP2, that he is authorized to access. He should
         be able to access SP2 without authenticating again.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -409,7 +399,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             assert response.status_code == HTTPStatus.OK
 
             # Assert we are logged in
-            assert re.search(idp_message, response.text) is not None
+            assert expect(response, idp_message)
 
             (session_cookie, response) = req.access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path, idp_ip,
                                                             idp_port)
@@ -432,8 +422,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
 
             assert response.status_code == HTTPStatus.OK
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -451,7 +440,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
             # User is logged in on SP1
 
@@ -474,8 +463,7 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
             response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp,
                                            {**session_cookie2, **keycloak_cookie3})
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -493,4 +481,4 @@ class Test_test_CT_TC_SAML_BROKER_ACCESS_CONTROL_RBAC_OK():
 
             assert response.status_code == HTTPStatus.OK
 
-            assert re.search(sp2_message, response.text) is not None
\ No newline at end of file
+            assert expect(response, sp2_message)
\ No newline at end of file
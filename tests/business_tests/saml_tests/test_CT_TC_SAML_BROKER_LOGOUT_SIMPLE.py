@@ -21,8 +21,7 @@ from urllib.parse import urlencode
 import helpers.requests as req
 from helpers.logging import log_request
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 author = "Sonia Bogos"
@@ -52,7 +51,7 @@ class Test_CT_TC_SAML_SSO_BROKER_LOGOUT_SIMPLE():
     """
     # This code test contains a bit of magic as with the current Keycloak version the logout does not actually works
 
-    def test_CT_TC_SAML_SSO_BROKER_LOGOUT_SIMPLE(self, settings, login_broker_sso_form):
+    def test_CT_TC_SAML_SSO_BROKER_LOGOUT_SIMPLE(self, settings, transport, login_broker_sso_form):
         """
         #TODO:update the description and the comments
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the SP-initiated flow, i.e. the user accesses the application
@@ -60,10 +59,11 @@ class Test_CT_TC_SAML_SSO_BROKER_LOGOUT_SIMPLE():
         The user has to login to keycloak which will give him the SAML token. The token will give him access to the
         application.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -14,16 +14,16 @@
 
 import pytest
 import logging
-import re
 import urllib.parse as urlparse
 from urllib.parse import urlencode
 
 import helpers.requests as req
 from helpers.logging import log_request
+from helpers.forms import extract_form, extract_social_providers
+from helpers.expectations import expect
 
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 author = "Sonia Bogos"
@@ -55,17 +55,18 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
     # and HTTP-POST Binding for AuthnRequest are set to ON
     # Otherwise, instead of post binding we would get 302 redirects
 
-    def test_CT_TC_SAML_SSO_BROKER_SIMPLE_SP_initiated(self, settings):
+    def test_CT_TC_SAML_SSO_BROKER_SIMPLE_SP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_BROKER_SIMPLE use case with the SP-initiated flow, i.e. the user accesses the application
         , which is a service provider (SP), that redirects him to the keycloak, the identity provider (IDP).
         The user has to login to keycloak which will give him the SAML token. The token will give him access to the
         application.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -119,17 +120,12 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
             response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie)
 
             # In the login page we can choose to login with the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
+            providers = extract_social_providers(response.content)
 
-            div = soup.find("div", {"id": "kc-social-providers"})
-
-            assert div is not None
+            assert providers is not None
 
             # we can have several idp external; choose the one needed for the test
-            all_li = div.find_all('li')
-            for li in all_li:
-                if li.span.text == idp_broker:
-                    external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + li.a['href']
+            external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + providers[idp_broker]
 
             assert external_idp_url is not None
 
@@ -152,8 +148,7 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
             assert response.status_code == HTTPStatus.OK or response.status_code == HTTPStatus.FOUND
 
             # get the HTTP binding response with the url to the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -208,9 +203,7 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
             else:
                 keycloak_cookie_ext = response.cookies
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            form = soup.find("form", {"id": keycloak_login_form_id})
+            form = extract_form(response.content, form_id=keycloak_login_form_id)
 
             assert form is not None
 
@@ -236,8 +229,7 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
             assert response.status_code == HTTPStatus.OK or response.status_code == HTTPStatus.FOUND
 
             # get the HTTP binding response with the url to the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -271,8 +263,7 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
                                                    idp_form_id)
 
             # Get the token (SAML response) from the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -290,18 +281,19 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
-    def test_CT_TC_SAML_SSO_BROKER_SIMPLE_IDP_initiated(self, settings):
+    def test_CT_TC_SAML_SSO_BROKER_SIMPLE_IDP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_BROKER_SIMPLE use case with the IDP-initiated flow, i.e. the user logs in keycloak,
         the identity provider (IDP), and then accesses the application, which is a service provider (SP).
         The application redirects towards keycloak to obtain the SAML token.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -353,7 +345,7 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
             assert response.status_code == HTTPStatus.OK
 
             # Assert we are logged in
-            assert re.search(idp_message, response.text) is not None
+            assert expect(response, idp_message)
 
             (session_cookie, response) = req.access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path, idp_ip, idp_port)
 
@@ -374,8 +366,7 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -392,4 +383,4 @@ class Test_CT_TC_SAML_SSO_BROKER_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
@@ -15,13 +15,13 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
+from helpers.forms import extract_form
+from helpers.expectations import expect
 from http import HTTPStatus
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 
 author = "Sonia Bogos"
 maintainer = "Sonia Bogos"
@@ -47,16 +47,17 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO():
      than the allowed single sign on time span, to access applications they are not entitled to access.
     """
 
-    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO_SP_initiated(self, settings):
+    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO_SP_initiated(self, settings, transport):
         """
         Scenario: User logs in to SP1 where he has the appropriate attribute.
         Same user tries to access to SP2, SP that he is not authorized to access. He should receive an
         error message saying he has not the authorization.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -106,9 +107,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO():
 
         response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie)
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.find("form", {"id": keycloak_login_form_id})
+        form = extract_form(response.content, form_id=keycloak_login_form_id)
 
         assert form is not None
 
@@ -137,8 +136,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO():
 
         keycloak_cookie_2 = response.cookies
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -156,7 +154,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO():
         assert response.status_code == HTTPStatus.OK
 
         # assert that we are logged in
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
         # User is logged in on SP1
 
@@ -180,19 +178,20 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO():
         # Assert that the client is not authorized to access SP2
         assert response.status_code == HTTPStatus.FORBIDDEN
 
-        assert re.search(sp2_message, response.text) is not None
+        assert expect(response, sp2_message)
 
 
-    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO_IDP_initiated(self, settings):
+    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO_IDP_initiated(self, settings, transport):
         """
         Scenario: User logs in to the IDP. He then accesses SP1 where he has the appropriate attribute.
         Same user tries to access SP2, that he is not authorized to access. He should receive an
         error message saying he has not the authorization.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -233,7 +232,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO():
         assert response.status_code == HTTPStatus.OK
 
         # Assert we are logged in to IDP
-        assert re.search(idp_message, response.text) is not None
+        assert expect(response, idp_message)
 
         # Access SP1
         (session_cookie, response) = req.access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path,
@@ -257,8 +256,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO():
 
         assert response.status_code == HTTPStatus.OK
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -275,7 +273,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO():
 
         assert response.status_code == HTTPStatus.OK
 
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
         # User can access SP1
 
@@ -301,5 +299,5 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_KO():
         # Assert that the client is not authorized to access SP2
         assert response.status_code == HTTPStatus.FORBIDDEN
 
-        assert re.search(sp2_message, response.text) is not None
+        assert expect(response, sp2_message)
 
@@ -14,13 +14,13 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
+from helpers.forms import extract_form
+from helpers.expectations import expect
 
 from http import HTTPStatus
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 
 author = "Sonia Bogos"
 maintainer = "Sonia Bogos"
@@ -46,16 +46,17 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
     I need the solution to grant access to applications whose access I am entitled to have without re-authenticating.
     """
 
-    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK_SP_initiated(self, settings):
+    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK_SP_initiated(self, settings, transport):
         """
         Scenario: User logs in to SP1 where he has the appropriate attribute.
         Same user tries to log in to SP2, SP that he is authorized to access. He should
         be able to access SP2 without authenticating again.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -105,9 +106,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
 
         response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie)
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.find("form", {"id": keycloak_login_form_id})
+        form = extract_form(response.content, form_id=keycloak_login_form_id)
 
         assert form is not None
 
@@ -135,8 +134,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
 
         keycloak_cookie_2 = response.cookies
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -154,7 +152,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
         assert response.status_code == HTTPStatus.OK
 
         # assert that we are logged in
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
         # User is logged in on SP1
 
@@ -175,8 +173,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
 
         response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, {**session_cookie2, **keycloak_cookie_2})
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -194,18 +191,19 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
         assert response.status_code == HTTPStatus.OK
 
         # assert that we are logged in
-        assert re.search(sp2_message, response.text) is not None
+        assert expect(response, sp2_message)
 
-    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK_IDP_initiated(self, settings):
+    def test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK_IDP_initiated(self, settings, transport):
         """
         Scenario: User logs in to the IDP. He then accesses SP1 where he has the appropriate attribute.
         Same user tries to log in to SP2, SP that he is authorized to access. He should
         be able to access SP2 without authenticating again.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -246,7 +244,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
         assert response.status_code == HTTPStatus.OK
 
         # Assert we are logged in to IDP
-        assert re.search(idp_message, response.text) is not None
+        assert expect(response, idp_message)
 
         # Access SP1
         (session_cookie, response) = req.access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path,
@@ -270,8 +268,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
 
         assert response.status_code == HTTPStatus.OK
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -288,7 +285,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
 
         assert response.status_code == HTTPStatus.OK
 
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
         # User can access SP1
 
@@ -311,8 +308,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
         response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp,
                                        {**session_cookie2, **keycloak_cookie2})
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -329,7 +325,7 @@ class Test_test_CT_TC_SAML_IDP_ACCESS_CONTROL_ABAC_OK():
 
         assert response.status_code == HTTPStatus.OK
 
-        assert re.search(sp2_message, response.text) is not None
+        assert expect(response, sp2_message)
 
 
 
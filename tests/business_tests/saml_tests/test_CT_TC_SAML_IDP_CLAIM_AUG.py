@@ -14,14 +14,14 @@
 
 import pytest
 import logging
-import re
-import base64
 
 import helpers.requests as req
 from helpers.logging import log_request
+from helpers.saml import parse_saml_response
+from helpers.forms import extract_form
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 author = "Sonia Bogos"
@@ -48,17 +48,18 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
    In these tests, IP at the time of authentication and claims from external applications are checked.
     """
 
-    def test_CT_TC_SAML_SSO_FORM_SIMPLE_SP_initiated(self, settings):
+    def test_CT_TC_SAML_SSO_FORM_SIMPLE_SP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the SP-initiated flow, i.e. the user accesses the application
         , which is a service provider (SP), that redirects him to the keycloak, the identity provider (IDP).
         The user has to login to keycloak which will give him the SAML token. The token will give him access to the
         application. The token contains builtin and external claims.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -77,7 +78,6 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
         idp_password = settings["idp"]["test_realm"]["password"]
         idp_attr_name = settings["idp"]["test_realm"]["attr_name"]
         idp_attr_name_external = settings["idp"]["test_realm"]["external_attr_name"]
-        idp_attr_tag = settings["idp"]["test_realm"]["attr_xml_elem"]
 
         keycloak_login_form_id = settings["idp"]["login_form_id"]
 
@@ -102,9 +102,7 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
 
         response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie)
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.find("form", {"id": keycloak_login_form_id})
+        form = extract_form(response.content, form_id=keycloak_login_form_id)
 
         assert form is not None
 
@@ -131,8 +129,7 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
 
         keycloak_cookie_2 = response.cookies
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -143,15 +140,13 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
         for input in inputs:
             token[input.get('name')] = input.get('value')
 
-        decoded_token = base64.b64decode(token['SAMLResponse']).decode("utf-8")
+        saml_response = parse_saml_response(token['SAMLResponse'])
 
-        val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name)
         # assert that the IDP added the location attribute in the token
-        assert re.search(val, decoded_token) is not None
+        assert idp_attr_name in saml_response.attributes
 
         # assert that the external claim is also in the token
-        val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name_external)
-        assert re.search(val, decoded_token) is not None
+        assert idp_attr_name_external in saml_response.attributes
 
 
         (response, sp_cookie) = req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme,
@@ -161,19 +156,20 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
         assert response.status_code == HTTPStatus.OK
 
         # assert that we are logged in
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
-    def test_CT_TC_SAML_SSO_FORM_SIMPLE_IDP_initiated(self, settings):
+    def test_CT_TC_SAML_SSO_FORM_SIMPLE_IDP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the IDP-initiated flow, i.e. the user logs in keycloak,
         the identity provider (IDP), and then accesses the application, which is a service provider (SP).
         The application redirect towards keycloak to obtain the SAML token.
         The token contains builtin and external claims.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -194,7 +190,6 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
         idp_username = settings["idp"]["test_realm"]["username"]
         idp_password = settings["idp"]["test_realm"]["password"]
         idp_attr_name = settings["idp"]["test_realm"]["attr_name"]
-        idp_attr_tag = settings["idp"]["test_realm"]["attr_xml_elem"]
         idp_attr_name_external = settings["idp"]["test_realm"]["external_attr_name"]
 
         # Common header for all the requests
@@ -206,7 +201,7 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
         assert response.status_code == HTTPStatus.OK
 
         # Assert we are logged in
-        assert re.search(idp_message, response.text) is not None
+        assert expect(response, idp_message)
 
         (session_cookie, response) = req.access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path, idp_ip, idp_port)
 
@@ -227,8 +222,7 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
 
         assert response.status_code == HTTPStatus.OK
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -239,15 +233,13 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
         for input in inputs:
             token[input.get('name')] = input.get('value')
 
-        decoded_token = base64.b64decode(token['SAMLResponse']).decode("utf-8")
+        saml_response = parse_saml_response(token['SAMLResponse'])
 
-        val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name)
         # assert that the IDP added the location attribute in the token
-        assert re.search(val, decoded_token) is not None
+        assert idp_attr_name in saml_response.attributes
 
         # assert that the external claim is also in the token
-        val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name_external)
-        assert re.search(val, decoded_token) is not None
+        assert idp_attr_name_external in saml_response.attributes
 
         (response, sp_cookie) = req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme,
                                                          idp_ip, idp_port, method_form, url_form, token, session_cookie,
@@ -255,9 +247,9 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
 
         assert response.status_code == HTTPStatus.OK
 
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
-    def test_CT_TC_SAML_SSO_FORM_SIMPLE_IDP_initiated_keycloak_endpoint(self, settings):
+    def test_CT_TC_SAML_SSO_FORM_SIMPLE_IDP_initiated_keycloak_endpoint(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the IDP-initiated flow, where we set up an endpoint
         on Keycloak with IDP Initiated SSO URL Name.
@@ -266,10 +258,11 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
         to authenticate to Keycloak and obtain the token (SAML response) and gets redirected
         to the SP that he can access.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -290,7 +283,6 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
         idp_username = settings["idp"]["test_realm"]["username"]
         idp_password = settings["idp"]["test_realm"]["password"]
         idp_attr_name = settings["idp"]["test_realm"]["attr_name"]
-        idp_attr_tag = settings["idp"]["test_realm"]["attr_xml_elem"]
         idp_attr_name_external = settings["idp"]["test_realm"]["external_attr_name"]
 
         keycloak_login_form_id = settings["idp"]["login_form_id"]
@@ -317,9 +309,7 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
 
         keycloak_cookie = response.cookies
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.find("form", {"id": keycloak_login_form_id})
+        form = extract_form(response.content, form_id=keycloak_login_form_id)
 
         assert form is not None
 
@@ -347,8 +337,7 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
 
         keycloak_cookie_2 = response.cookies
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -359,15 +348,13 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
         for input in inputs:
             token[input.get('name')] = input.get('value')
 
-        decoded_token = base64.b64decode(token['SAMLResponse']).decode("utf-8")
+        saml_response = parse_saml_response(token['SAMLResponse'])
 
-        val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name)
         # assert that the IDP added the location attribute in the token
-        assert re.search(val, decoded_token) is not None
+        assert idp_attr_name in saml_response.attributes
 
         # assert that the external claim is also in the token
-        val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name_external)
-        assert re.search(val, decoded_token) is not None
+        assert idp_attr_name_external in saml_response.attributes
 
         (response, sp_cookie) = req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme,
                                                          idp_ip, idp_port, method_form, url_form, token,
@@ -404,5 +391,5 @@ class Test_CT_TC_SAML_IDP_CLAIM_AUG():
 
         assert response.status_code == HTTPStatus.OK
 
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
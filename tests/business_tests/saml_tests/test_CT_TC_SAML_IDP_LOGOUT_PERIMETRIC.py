@@ -15,14 +15,14 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
 from helpers.logging import log_request
+from helpers.forms import extract_form
+from helpers.expectations import expect
 from http import HTTPStatus
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 
 author = "Sonia Bogos"
 maintainer = "Sonia Bogos"
@@ -48,15 +48,16 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_PERIMETRIC():
     are invalidated and not usable anymore after the user has proceeded to a logout on the target application.
     """
 
-    def test_CT_TC_SAML_IDP_LOGOUT_PERIMETRIC(self, settings, login_sso_form):
+    def test_CT_TC_SAML_IDP_LOGOUT_PERIMETRIC(self, settings, transport, login_sso_form):
         """
         Scenario: user is logged in on several SPs.
         The user logs out of one SP. Access to all the other SPs should require a new log in.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp1 = settings["sps_saml"][0]
@@ -102,8 +103,7 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_PERIMETRIC():
 
         response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, {**keycloak_cookie, **session_cookie2})
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -182,9 +182,7 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_PERIMETRIC():
         session_cookie2 = response.cookies
 
         # SP redirects me to IDP with a SAML request
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.body.form
+        form = extract_form(response.content)
         url_form = form.get('action')
         method_form = form.get('method')
         inputs = form.find_all('input')
@@ -218,8 +216,7 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_PERIMETRIC():
 
         assert response.status_code == HTTPStatus.OK
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -271,7 +268,7 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_PERIMETRIC():
         assert response.status_code == HTTPStatus.OK
 
         # Assert the logout page is displayed
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
         # Check that when the user accesses the secured page of SP1 with the old session cookie,
         # he receives a 200 with the SAML request
@@ -305,9 +302,7 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_PERIMETRIC():
         assert response.status_code == HTTPStatus.OK
 
         # Response should return a form that requests a post with RelayState and SAMLRequest as input
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.body.form
+        form = extract_form(response.content)
         inputs = form.find_all('input')
 
         # Check we get RelayState and SAMLRequest
@@ -350,9 +345,7 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_PERIMETRIC():
         assert response.status_code == HTTPStatus.OK
 
         # Response should return a form that requests a post with RelayState and SAMLRequest as input
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.body.form
+        form = extract_form(response.content)
         inputs = form.find_all('input')
 
         # Check we get a form with input RelayState and SAMLRequest
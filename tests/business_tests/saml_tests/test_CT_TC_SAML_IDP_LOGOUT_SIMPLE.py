@@ -14,14 +14,14 @@
 
 import pytest
 import logging
-import re
 
 from helpers.logging import log_request
+from helpers.forms import extract_form
 import helpers.requests as req
+from helpers.expectations import expect
 
 from http import HTTPStatus
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 
 author = "Sonia Bogos"
 maintainer = "Sonia Bogos"
@@ -47,16 +47,17 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_SIMPLE():
     anymore after the user has proceeded to a logout on the target application.
     """
 
-    def test_CT_TC_SAML_IDP_LOGOUT_SIMPLE(self, settings, login_sso_form):
+    def test_CT_TC_SAML_IDP_LOGOUT_SIMPLE(self, settings, transport, login_sso_form):
         """
         Test the CT_TC_SAML_IDP_LOGOUT_SIMPLE use case with the SP-initiated flow, i.e. the user that accessed the SP
         asks to be logged out. This will trigger the logout to be performed on the IDP side and the user will
         be able to see the "You're logged out" page.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_saml"][0]
@@ -109,9 +110,7 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_SIMPLE():
         assert response.status_code == HTTPStatus.OK
 
         # SP redirects me to IDP with a SAML request
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.body.form
+        form = extract_form(response.content)
         url_form = form.get('action')
         method_form = form.get('method')
         inputs = form.find_all('input')
@@ -144,8 +143,7 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_SIMPLE():
 
         assert response.status_code == HTTPStatus.OK
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -197,4 +195,4 @@ class Test_test_CT_TC_SAML_IDP_LOGOUT_SIMPLE():
         assert response.status_code == HTTPStatus.OK
 
         # Assert the logout page is displayed
-        assert re.search(sp_message, response.text) is not None
\ No newline at end of file
+        assert expect(response, sp_message)
\ No newline at end of file
@@ -14,13 +14,13 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
 from helpers.logging import log_request
+from helpers.forms import extract_form
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 author = "Sonia Bogos"
@@ -51,17 +51,18 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
     # one where the Force Post Binding is ON and Front Channel Logout is ON (as set by default)
     # one where the Force Post Binding is OFF and Front Channel Logout is OFF
 
-    def test_CT_TC_SAML_SSO_FORM_SIMPLE_SP_initiated(self, settings):
+    def test_CT_TC_SAML_SSO_FORM_SIMPLE_SP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the SP-initiated flow, i.e. the user accesses the application
         , which is a service provider (SP), that redirects him to the keycloak, the identity provider (IDP).
         The user has to login to keycloak which will give him the SAML token. The token will give him access to the
         application.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sps = [settings["sps_saml"][0], settings["sps_saml"][1]]
@@ -103,9 +104,7 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
 
             response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, keycloak_cookie)
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            form = soup.find("form", {"id": keycloak_login_form_id})
+            form = extract_form(response.content, form_id=keycloak_login_form_id)
 
             assert form is not None
 
@@ -132,8 +131,7 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
 
             keycloak_cookie_2 = response.cookies
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -151,18 +149,19 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
-    def test_CT_TC_SAML_SSO_FORM_SIMPLE_IDP_initiated(self, settings):
+    def test_CT_TC_SAML_SSO_FORM_SIMPLE_IDP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the IDP-initiated flow, i.e. the user logs in keycloak,
         the identity provider (IDP), and then accesses the application, which is a service provider (SP).
         The application redirect towards keycloak to obtain the SAML token.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sps = [settings["sps_saml"][0], settings["sps_saml"][1]]
@@ -194,7 +193,7 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
             assert response.status_code == HTTPStatus.OK
 
             # Assert we are logged in
-            assert re.search(idp_message, response.text) is not None
+            assert expect(response, idp_message)
 
             (session_cookie, response) = req.access_sp_saml(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path, idp_ip, idp_port)
 
@@ -215,8 +214,7 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -233,9 +231,9 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
-    def test_CT_TC_SAML_SSO_FORM_SIMPLE_IDP_initiated_keycloak_endpoint(self, settings):
+    def test_CT_TC_SAML_SSO_FORM_SIMPLE_IDP_initiated_keycloak_endpoint(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the IDP-initiated flow, where we set up an endpoint
         on Keycloak with IDP Initiated SSO URL Name.
@@ -244,10 +242,11 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
         to authenticate to Keycloak and obtain the token (SAML response) and gets redirected
         to the SP that he can access
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sps = [settings["sps_saml"][0], settings["sps_saml"][1]]
@@ -293,9 +292,7 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
 
             keycloak_cookie = response.cookies
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            form = soup.find("form", {"id": keycloak_login_form_id})
+            form = extract_form(response.content, form_id=keycloak_login_form_id)
 
             assert form is not None
 
@@ -323,8 +320,7 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
 
             keycloak_cookie_2 = response.cookies
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -370,5 +366,5 @@ class Test_CT_TC_SAML_SSO_FORM_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
@@ -14,15 +14,15 @@
 
 import pytest
 import logging
-import re
 import urllib.parse as urlparse
 from urllib.parse import urlencode
 
 import helpers.requests as req
 from helpers.logging import log_request
+from helpers.forms import extract_form, extract_social_providers
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 author = "Sonia Bogos"
@@ -51,16 +51,17 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
     Company A applications are protected by CloudTrust which acts as a broker.
     """
 
-    def test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO_SP_initiated(self, settings):
+    def test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO_SP_initiated(self, settings, transport):
         """
         Scenario: User logs in to SP1 where he has the appropriate role.
         Same user tries to log in to SP2, SP that he is not authorized to access. He should receive an
         error message saying he has not the authorization.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_wsfed"][0]
@@ -119,18 +120,12 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             keycloak_cookie = response.cookies
 
             # In the login page we can choose to login with the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
+            providers = extract_social_providers(response.content)
 
-            div = soup.find("div", {"id": "kc-social-providers"})
-
-            assert div is not None
+            assert providers is not None
 
             # we can have several idp external; choose the one needed for the test
-            all_li = div.find_all('li')
-            for li in all_li:
-                if li.span.text == idp_broker:
-                    external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + li.a[
-                        'href']
+            external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + providers[idp_broker]
 
             assert external_idp_url is not None
 
@@ -153,8 +148,7 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             assert response.status_code == HTTPStatus.OK or response.status_code == HTTPStatus.FOUND
 
             # get the HTTP binding response with the url to the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -209,9 +203,7 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             else:
                 keycloak_cookie2 = response.cookies
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            form = soup.find("form", {"id": keycloak_login_form_id})
+            form = extract_form(response.content, form_id=keycloak_login_form_id)
 
             assert form is not None
 
@@ -237,8 +229,7 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             assert response.status_code == HTTPStatus.OK or response.status_code == HTTPStatus.FOUND
 
             # get the HTTP binding response with the url to the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -274,8 +265,7 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             logger.debug(response.status_code)
 
             # Get the token from the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -293,7 +283,7 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
             # User is logged in on SP1
 
@@ -316,18 +306,19 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             # Assert that the client is not authorized to access SP2
             assert response.status_code == HTTPStatus.FORBIDDEN
 
-            assert re.search(sp2_message, response.text) is not None
+            assert expect(response, sp2_message)
 
-    def test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO_IDP_initiated(self, settings):
+    def test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO_IDP_initiated(self, settings, transport):
         """
         Scenario: User logs in to the IDP. He then accesses SP1 where he has the appropriate role.
         Same user tries to log in to SP2, that he is not authorized to access. He should receive an
         error message saying he has not the authorization.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_wsfed"][0]
@@ -387,7 +378,7 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             assert response.status_code == HTTPStatus.OK
 
             # Assert we are logged in
-            assert re.search(idp_message, response.text) is not None
+            assert expect(response, idp_message)
 
             response = req.access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path)
 
@@ -409,8 +400,7 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
 
             assert response.status_code == HTTPStatus.OK
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -428,7 +418,7 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
             # User can access SP1
 
@@ -451,4 +441,4 @@ class Test_CT_TC_WS_FED_BROKER_ACCESS_CONTROL_RBAC_KO():
             # Assert that the client is not authorized to access SP2
             assert response.status_code == HTTPStatus.FORBIDDEN
 
-            assert re.search(sp2_message, response.text) is not None
+            assert expect(response, sp2_message)
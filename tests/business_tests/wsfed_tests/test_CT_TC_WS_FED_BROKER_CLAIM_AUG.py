@@ -14,15 +14,16 @@
 
 import pytest
 import logging
-import re
 import urllib.parse as urlparse
 from urllib.parse import urlencode
 
 import helpers.requests as req
+from helpers.saml import parse_wresult
 from helpers.logging import log_request
+from helpers.forms import extract_form, extract_social_providers
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 author = "Sonia Bogos"
@@ -50,17 +51,18 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
     Company A applications are protected by Cloudtrust which acts as a broker.
     """
 
-    def test_CT_TC_WS_FED_BROKER_SIMPLE_SP_initiated(self, settings):
+    def test_CT_TC_WS_FED_BROKER_SIMPLE_SP_initiated(self, settings, transport):
         """
         Test the CT_TC_WS_FED_BROKER_SIMPLE use case with the SP-initiated flow, i.e. the user accesses the application
         , which is a service provider (SP), that redirects him to the keycloak, the identity provider (IDP).
         The user has to login to keycloak which will give him the SAML token. The token will give him access to the
         application.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_wsfed"][0]
@@ -85,10 +87,8 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
 
         idp_attr_name = settings["idp"]["test_realm"]["attr_name"]
         idp_attr_name_external = settings["idp"]["test_realm"]["external_attr_name"]
-        idp_attr_tag = settings["idp"]["test_realm"]["attr_xml_elem"]
 
         idp_attr_name_broker = settings["idp_external"]["test_realm"]["attr_name"]
-        idp_attr_tag_broker = settings["idp_external"]["test_realm"]["attr_xml_elem"]
 
         keycloak_login_form_id = settings["idp"]["login_form_id"]
 
@@ -117,18 +117,12 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
             keycloak_cookie = response.cookies
 
             # In the login page we can choose to login with the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
+            providers = extract_social_providers(response.content)
 
-            div = soup.find("div", {"id": "kc-social-providers"})
-
-            assert div is not None
+            assert providers is not None
 
             # we can have several idp external; choose the one needed for the test
-            all_li = div.find_all('li')
-            for li in all_li:
-                if li.span.text == idp_broker:
-                    external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + li.a[
-                        'href']
+            external_idp_url = "{scheme}://{ip}:{port}".format(scheme=idp_scheme, ip=idp_ip, port=idp_port) + providers[idp_broker]
 
             assert external_idp_url is not None
 
@@ -151,8 +145,7 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
             assert response.status_code == HTTPStatus.OK or response.status_code == HTTPStatus.FOUND
 
             # get the HTTP binding response with the url to the external IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -203,9 +196,7 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
                 keycloak_cookie2 = response.cookies
 
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            form = soup.find("form", {"id": keycloak_login_form_id})
+            form = extract_form(response.content, form_id=keycloak_login_form_id)
 
             assert form is not None
 
@@ -231,8 +222,7 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
             assert response.status_code == HTTPStatus.OK or response.status_code == HTTPStatus.FOUND
 
             # get the HTTP binding response with the url to the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -266,8 +256,7 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
                                                    idp_form_id)
 
             # Get the token from the broker IDP
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -277,19 +266,18 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
             for input in inputs:
                 token[input.get('name')] = input.get('value')
 
-            val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name)
+            wresult = parse_wresult(token['wresult'])
+
             # assert that the IDP added the location attribute in the token
-            assert re.search(val, token['wresult']) is not None
+            assert idp_attr_name in wresult.attributes
 
             # assert that the external claim is also in the token
-            val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name_external)
-            assert re.search(val, token['wresult']) is not None
+            assert idp_attr_name_external in wresult.attributes
 
 
             # assert that the claims that come from the external IDP are well in the token
-            val = idp_attr_tag_broker + "=\"{v}\"".format(v=idp_attr_name_broker)
             # assert that the IDP added the location attribute in the token
-            assert re.search(val, token['wresult']) is not None
+            assert idp_attr_name_broker in wresult.attributes
 
             # Access SP with the token
             (response, sp_cookie) = req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme,
@@ -299,18 +287,19 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
-    def test_CT_TC_WS_FED_BROKER_SIMPLE_IDP_initiated(self, settings):
+    def test_CT_TC_WS_FED_BROKER_SIMPLE_IDP_initiated(self, settings, transport):
         """
         Test the CT_TC_WS_FED_BROKER_SIMPLE use case with the IDP-initiated flow, i.e. the user logs in keycloak,
         the identity provider (IDP), and then accesses the application, which is a service provider (SP).
         The application redirect towards keycloak to obtain the SAML token.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_wsfed"][0]
@@ -343,10 +332,8 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
 
         idp_attr_name = settings["idp"]["test_realm"]["attr_name"]
         idp_attr_name_external = settings["idp"]["test_realm"]["external_attr_name"]
-        idp_attr_tag = settings["idp"]["test_realm"]["attr_xml_elem"]
 
         idp_attr_name_broker = settings["idp_external"]["test_realm"]["attr_name"]
-        idp_attr_tag_broker = settings["idp_external"]["test_realm"]["attr_xml_elem"]
 
         keycloak_login_form_id = settings["idp"]["login_form_id"]
 
@@ -368,7 +355,7 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
             assert response.status_code == HTTPStatus.OK
 
             # Assert we are logged in
-            assert re.search(idp_message, response.text) is not None
+            assert expect(response, idp_message)
 
             response = req.access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path)
 
@@ -390,8 +377,7 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -402,19 +388,18 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
             for input in inputs:
                 token[input.get('name')] = input.get('value')
 
-            val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name)
+            wresult = parse_wresult(token['wresult'])
+
             # assert that the IDP added the location attribute in the token
-            assert re.search(val, token['wresult']) is not None
+            assert idp_attr_name in wresult.attributes
 
             # assert that the external claim is also in the token
-            val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name_external)
-            assert re.search(val, token['wresult']) is not None
+            assert idp_attr_name_external in wresult.attributes
 
 
             # assert that the claims that come from the external IDP are well in the token
-            val = idp_attr_tag_broker + "=\"{v}\"".format(v=idp_attr_name_broker)
             # assert that the IDP added the location attribute in the token
-            assert re.search(val, token['wresult']) is not None
+            assert idp_attr_name_broker in wresult.attributes
 
             (response, sp_cookie) = req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme,
                                                              idp_ip, idp_port, method_form, url_form, token, keycloak_cookie5,
@@ -422,4 +407,4 @@ class Test_CT_TC_WS_FED_BROKER_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
@@ -14,13 +14,13 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
+from helpers.forms import extract_form
+from helpers.expectations import expect
 from http import HTTPStatus
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 
 author = "Sonia Bogos"
 maintainer = "Sonia Bogos"
@@ -46,16 +46,17 @@ class Test_test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO():
     smaller than the allowed single sign on time span, to access applications they are not entitled to access.
     """
 
-    def test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO_SP_initiated(self, settings):
+    def test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO_SP_initiated(self, settings, transport):
         """
         Scenario: User logs in to SP1 where he has the appropriate attribute.
         Same user tries to access SP2, SP that he is not authorized to access. He should receive an
         error message saying he has not the authorization.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_wsfed"][0]
@@ -104,9 +105,7 @@ class Test_test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO():
 
         keycloak_cookie = response.cookies
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.find("form", {"id": keycloak_login_form_id})
+        form = extract_form(response.content, form_id=keycloak_login_form_id)
 
         assert form is not None
 
@@ -135,8 +134,7 @@ class Test_test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO():
 
         keycloak_cookie_2 = response.cookies
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -154,7 +152,7 @@ class Test_test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO():
         assert response.status_code == HTTPStatus.OK
 
         # assert that we are logged in
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
         # User is logged in on SP1
 
@@ -177,18 +175,19 @@ class Test_test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO():
         # Assert that the client is not authorized to access SP2
         assert response.status_code == HTTPStatus.FORBIDDEN
 
-        assert re.search(sp2_message, response.text) is not None
+        assert expect(response, sp2_message)
 
-    def test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO_IDP_initiated(self, settings):
+    def test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO_IDP_initiated(self, settings, transport):
         """
         Scenario: User logs in to the IDP. He then accesses SP1 where he has the appropriate attribute.
         Same user tries to log in to SP2, that he is not authorized to access. He should receive an
         error message saying he has not the authorization to access SP2.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_wsfed"][0]
@@ -228,7 +227,7 @@ class Test_test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO():
         assert response.status_code == HTTPStatus.OK
 
         # Assert we are logged in
-        assert re.search(idp_message, response.text) is not None
+        assert expect(response, idp_message)
 
         response = req.access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path)
 
@@ -249,8 +248,7 @@ class Test_test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO():
 
         assert response.status_code == HTTPStatus.OK
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -267,7 +265,7 @@ class Test_test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO():
 
         assert response.status_code == HTTPStatus.OK
 
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
         # User can access SP1
 
@@ -290,6 +288,6 @@ class Test_test_CT_TC_WS_FED_IDP_ACCESS_CONTROL_ABAC_KO():
         # Assert that the client is not authorized to access SP2
         assert response.status_code == HTTPStatus.FORBIDDEN
 
-        assert re.search(sp2_message, response.text) is not None
+        assert expect(response, sp2_message)
 
 
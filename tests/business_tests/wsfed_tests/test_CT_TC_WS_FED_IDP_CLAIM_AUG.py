@@ -14,13 +14,14 @@
 
 import pytest
 import logging
-import re
 import xml.etree.ElementTree as ET
 
 import helpers.requests as req
+from helpers.forms import extract_form
+from helpers.saml import parse_wresult
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 
@@ -49,17 +50,18 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
     In these tests, IP at the time of authentication and claims from external applications are checked.
     """
 
-    def test_CT_TC_WS_FED_IDP_CLAIM_AUG_SP_initiated(self, settings):
+    def test_CT_TC_WS_FED_IDP_CLAIM_AUG_SP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the SP-initiated flow, i.e. the user accesses the application
         , which is a service provider (SP), that redirects him to the keycloak, the identity provider (IDP).
         The user has to login to keycloak which will give him the WSFED token. The token will give him access to the
         application. The token contains builtin and external claims.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_wsfed"][0]
@@ -79,7 +81,6 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
 
         keycloak_login_form_id = settings["idp"]["login_form_id"]
         idp_attr_name =  settings["idp"]["test_realm"]["attr_name"]
-        idp_attr_tag = settings["idp"]["test_realm"]["attr_xml_elem"]
         idp_attr_name_external = settings["idp"]["test_realm"]["external_attr_name"]
 
         # Common header for all the requests
@@ -101,9 +102,7 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
 
         keycloak_cookie = response.cookies
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.find("form", {"id": keycloak_login_form_id})
+        form = extract_form(response.content, form_id=keycloak_login_form_id)
 
         assert form is not None
 
@@ -131,8 +130,7 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
 
         keycloak_cookie_2 = response.cookies
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -143,13 +141,13 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
         for input in inputs:
             token[input.get('name')] = input.get('value')
 
-        val = idp_attr_tag+"=\"{v}\"".format(v=idp_attr_name)
+        wresult = parse_wresult(token['wresult'])
+
         # assert that the IDP added the location attribute in the token
-        assert re.search(val, token['wresult']) is not None
+        assert idp_attr_name in wresult.attributes
 
         # assert that the external claim is also in the token
-        val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name_external)
-        assert re.search(val, token['wresult']) is not None
+        assert idp_attr_name_external in wresult.attributes
 
 
         (response, sp_cookie) = req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme, idp_ip,
@@ -159,20 +157,21 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
         assert response.status_code == HTTPStatus.OK
 
         # assert that we are logged in
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
 
-    def test_CT_TC_WS_FED_SSO_FORM_SIMPLE_IDP_initiated(self, settings):
+    def test_CT_TC_WS_FED_SSO_FORM_SIMPLE_IDP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the IDP-initiated flow, i.e. the user logs in keycloak,
         the identity provider (IDP), and then accesses the application, which is a service provider (SP).
         The application redirect towards keycloak to obtain the WSFED token.
         The token contains builtin and external claims.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp = settings["sps_wsfed"][0]
@@ -193,7 +192,6 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
         idp_username = settings["idp"]["test_realm"]["username"]
         idp_password = settings["idp"]["test_realm"]["password"]
         idp_attr_name = settings["idp"]["test_realm"]["attr_name"]
-        idp_attr_tag = settings["idp"]["test_realm"]["attr_xml_elem"]
         idp_attr_name_external = settings["idp"]["test_realm"]["external_attr_name"]
 
         # Common header for all the requests
@@ -206,7 +204,7 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
         assert response.status_code == HTTPStatus.OK
 
         # Assert we are logged in
-        assert re.search(idp_message, response.text) is not None
+        assert expect(response, idp_message)
 
         response = req.access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path)
 
@@ -227,8 +225,7 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
 
         assert response.status_code == HTTPStatus.OK
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -239,13 +236,13 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
         for input in inputs:
             token[input.get('name')] = input.get('value')
 
-        val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name)
+        wresult = parse_wresult(token['wresult'])
+
         # assert that the IDP added the location attribute in the token
-        assert re.search(val, token['wresult']) is not None
+        assert idp_attr_name in wresult.attributes
 
         # assert that the external claim is also in the token
-        val = idp_attr_tag + "=\"{v}\"".format(v=idp_attr_name_external)
-        assert re.search(val, token['wresult']) is not None
+        assert idp_attr_name_external in wresult.attributes
 
         (response, sp_cookie) = req.access_sp_with_token(logger, s, header, sp_ip, sp_port, sp_scheme, idp_scheme, idp_ip,
                                                          idp_port, method_form, url_form, token, session_cookie,
@@ -253,6 +250,6 @@ class Test_CT_TC_WS_FED_IDP_CLAIM_AUG():
 
         assert response.status_code == HTTPStatus.OK
 
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
 
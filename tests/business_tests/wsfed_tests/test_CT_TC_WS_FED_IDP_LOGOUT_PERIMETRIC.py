@@ -14,13 +14,13 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
 from helpers.logging import log_request
+from helpers.forms import extract_form
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 author = "Sonia Bogos"
@@ -47,15 +47,16 @@ class Test_test_CT_TC_WS_FED_IDP_LOGOUT_PERIMETRIC():
     are invalidated and not usable anymore after the user has proceeded to a logout on the target application.
     """
 
-    def test_CT_TC_WS_FED_IDP_LOGOUT_PERIMETRIC(self, settings, login_sso_form):
+    def test_CT_TC_WS_FED_IDP_LOGOUT_PERIMETRIC(self, settings, transport, login_sso_form):
         """
         Scenario: user is logged in on several SPs.
         The user logs out of one SP. Access to all SPs should require a new log in.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sp1 = settings["sps_wsfed"][0]
@@ -101,8 +102,7 @@ class Test_test_CT_TC_WS_FED_IDP_LOGOUT_PERIMETRIC():
 
         response = req.redirect_to_idp(logger, s, redirect_url, header_redirect_idp, {**keycloak_cookie})
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        form = soup.body.form
+        form = extract_form(response.content)
 
         url_form = form.get('action')
         inputs = form.find_all('input')
@@ -201,9 +201,7 @@ class Test_test_CT_TC_WS_FED_IDP_LOGOUT_PERIMETRIC():
 
         assert response.status_code == HTTPStatus.OK
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        form = soup.body.form
+        form = extract_form(response.content)
         url_form = form.get('action')
         method_form = form.get('method')
         inputs = form.find_all('input')
@@ -218,7 +216,7 @@ class Test_test_CT_TC_WS_FED_IDP_LOGOUT_PERIMETRIC():
 
         assert response.status_code == HTTPStatus.OK
 
-        assert re.search(sp_message, response.text) is not None
+        assert expect(response, sp_message)
 
         # Check that when the user accesses the secured page of SP1 with the old session cookie,
         # he is redirected to log in
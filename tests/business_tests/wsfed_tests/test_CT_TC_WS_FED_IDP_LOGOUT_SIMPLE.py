@@ -14,13 +14,13 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
 from helpers.logging import log_request
+from helpers.forms import extract_form
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 author = "Sonia Bogos"
@@ -51,16 +51,17 @@ class Test_test_CT_TC_WS_FED_IDP_LOGOUT_SIMPLE():
     # one where the SAML Assertion Token Format is set to SAML 2.0 and Front Channel Logout is OFF (as set by default)
     # one where the SAML Assertion Token Format is set to SAML 1.1 and Front Channel Logout is ON
 
-    def test_CT_TC_WS_FED_IDP_LOGOUT_SIMPLE(self, settings, login_sso_form):
+    def test_CT_TC_WS_FED_IDP_LOGOUT_SIMPLE(self, settings, transport, login_sso_form):
         """
         Test the CT_TC_WS_FED_IDP_LOGOUT_SIMPLE use case with the SP-initiated flow, i.e. the user that accessed the SP
         asks to be logged out. This will trigger the logout to be performed on the IDP side and the user will
         be able to see the "You're logged out" page.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sps = [settings["sps_wsfed"][0], settings["sps_wsfed"][1]]
@@ -134,9 +135,7 @@ class Test_test_CT_TC_WS_FED_IDP_LOGOUT_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            form = soup.body.form
+            form = extract_form(response.content)
             url_form = form.get('action')
             method_form = form.get('method')
             inputs = form.find_all('input')
@@ -151,4 +150,4 @@ class Test_test_CT_TC_WS_FED_IDP_LOGOUT_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
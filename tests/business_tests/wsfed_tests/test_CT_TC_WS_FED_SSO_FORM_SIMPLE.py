@@ -14,12 +14,12 @@
 
 import pytest
 import logging
-import re
 
 import helpers.requests as req
+from helpers.forms import extract_form
+from helpers.expectations import expect
 
-from bs4 import BeautifulSoup
-from requests import Request, Session
+from requests import Request
 from http import HTTPStatus
 
 author = "Sonia Bogos"
@@ -50,17 +50,18 @@ class Test_CT_TC_WS_FED_SSO_FORM_SIMPLE():
     # one where the SAML Assertion Token Format is set to SAML 2.0 and Front Channel Logout is OFF (as set by default)
     # one where the SAML Assertion Token Format is set to SAML 1.1 and Front Channel Logout is ON
 
-    def test_CT_TC_WS_FED_SSO_FORM_SIMPLE_SP_initiated(self, settings):
+    def test_CT_TC_WS_FED_SSO_FORM_SIMPLE_SP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the SP-initiated flow, i.e. the user accesses the application
         , which is a service provider (SP), that redirects him to the keycloak, the identity provider (IDP).
         The user has to login to keycloak which will give him the WSFED token. The token will give him access to the
         application.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sps = [settings["sps_wsfed"][0], settings["sps_wsfed"][1]]
@@ -100,9 +101,7 @@ class Test_CT_TC_WS_FED_SSO_FORM_SIMPLE():
 
             keycloak_cookie = response.cookies
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            form = soup.find("form", {"id": keycloak_login_form_id})
+            form = extract_form(response.content, form_id=keycloak_login_form_id)
 
             assert form is not None
 
@@ -130,8 +129,7 @@ class Test_CT_TC_WS_FED_SSO_FORM_SIMPLE():
 
             keycloak_cookie_2 = response.cookies
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -149,18 +147,19 @@ class Test_CT_TC_WS_FED_SSO_FORM_SIMPLE():
             assert response.status_code == HTTPStatus.OK
 
             # assert that we are logged in
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
-    def test_CT_TC_WS_FED_SSO_FORM_SIMPLE_IDP_initiated(self, settings):
+    def test_CT_TC_WS_FED_SSO_FORM_SIMPLE_IDP_initiated(self, settings, transport):
         """
         Test the CT_TC_SAML_SSO_FORM_SIMPLE use case with the IDP-initiated flow, i.e. the user logs in keycloak,
         the identity provider (IDP), and then accesses the application, which is a service provider (SP).
         The application redirect towards keycloak to obtain the WSFED token.
         :param settings:
+        :param transport: shared pooled HTTP transport
         :return:
         """
 
-        s = Session()
+        s = transport.session()
 
         # Service provider settings
         sps = [settings["sps_wsfed"][0], settings["sps_wsfed"][1]]
@@ -192,7 +191,7 @@ class Test_CT_TC_WS_FED_SSO_FORM_SIMPLE():
             assert response.status_code == HTTPStatus.OK
 
             # Assert we are logged in
-            assert re.search(idp_message, response.text) is not None
+            assert expect(response, idp_message)
 
             response = req.access_sp_ws_fed(logger, s, header, sp_ip, sp_port, sp_scheme, sp_path)
 
@@ -213,8 +212,7 @@ class Test_CT_TC_WS_FED_SSO_FORM_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            form = soup.body.form
+            form = extract_form(response.content)
 
             url_form = form.get('action')
             inputs = form.find_all('input')
@@ -231,6 +229,6 @@ class Test_CT_TC_WS_FED_SSO_FORM_SIMPLE():
 
             assert response.status_code == HTTPStatus.OK
 
-            assert re.search(sp_message, response.text) is not None
+            assert expect(response, sp_message)
 
 
@@ -11,6 +11,7 @@
 # DEALINGS IN THE SOFTWARE.
 #
 
+import os
 import sys
 import json
 import logging
@@ -19,6 +20,11 @@ import argparse
 from http import HTTPStatus
 from requests import Request, Session
 
+# the script is run from its directory, the helpers are at the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from helpers.tokens import get_provider
+
 logging.basicConfig(
     format='%(asctime)s %(name)s %(levelname)s %(message)s',
     datefmt='%m/%d/%Y %I:%M:%S %p'
@@ -81,42 +87,6 @@ def log_request(logger, req):
     )
 
 
-def get_access_token(logger, s, data, idp_scheme, idp_port, idp_ip, realm_id):
-    """
-    Helper dedicated to obtain the access token for Keycloak
-    :param logger:
-    :param s: session s
-    :param data: payload of the request
-    :param idp_scheme: identity provider http scheme
-    :param idp_port: identity provider port
-    :param idp_ip: identity provider ip
-    :param realm_id: id of the realm
-    :return:
-    """
-    req_get_access_token = Request(
-        method='POST',
-        url="{scheme}://{ip}:{port}/auth/realms/{realm}/protocol/openid-connect/token".format(
-            scheme=idp_scheme,
-            ip=idp_ip,
-            port=idp_port,
-            realm=realm_id
-        ),
-        data=data
-    )
-
-    prepared_request = req_get_access_token.prepare()
-
-    log_request(logger, req_get_access_token)
-
-    response = s.send(prepared_request, verify=False)
-
-    logger.debug(response.status_code)
-
-    access_token = json.loads(response.text)['access_token']
-
-    return access_token
-
-
 if __name__ == "__main__":
 
     args = parser.parse_args()
@@ -146,14 +116,8 @@ if __name__ == "__main__":
 
     s = Session()
 
-    access_token_data={
-        "client_id": idp_client_id,
-        "username": idp_username,
-        "password": idp_password,
-        "grant_type": "password"
-    }
-
-    access_token = get_access_token(logger, s, access_token_data, idp_scheme, idp_port, idp_ip, idp_realm_id)
+    access_token = get_provider().get_token(idp_scheme, idp_ip, idp_port, idp_realm_id, idp_client_id,
+                                            idp_username, idp_password)
 
     header = {
         'Accept': "application/json,text/plain, */*",
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+import os
+
+import pytest
+
+from helpers.results import ResultsWriter, load_results
+
+
+def write_rows(path, rows, start=0, chunk_rows=1000):
+    with ResultsWriter(path, chunk_rows=chunk_rows) as writer:
+        for i in range(start, start + rows):
+            writer.record("sp.final_get", 1000.0 + i, 0.01, 200, i, flow_id=i, flow="saml.sp_saml1")
+
+
+def test_results_round_trip(tmpdir):
+    path = str(tmpdir.join("run.results"))
+    write_rows(path, 2500)
+
+    results = load_results(path)
+
+    assert len(results["timestamp"]) == 2500
+    assert list(results["bytes"][:3]) == [0, 1, 2]
+    assert results["hops"] == ["sp.final_get"]
+    assert results["flows"] == ["saml.sp_saml1"]
+
+
+def test_results_append_after_crash(tmpdir):
+    path = str(tmpdir.join("run.results"))
+    write_rows(path, 4000)
+
+    # a crash cuts the last chunk
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 100)
+
+    write_rows(path, 10, start=4000)
+
+    results = load_results(path)
+
+    assert len(results["timestamp"]) == 3010
+    assert list(results["flow_id"][-10:]) == list(range(4000, 4010))
+
+
+def test_results_append_to_other_file(tmpdir):
+    path = tmpdir.join("run.results")
+    path.write_binary(b"timestamp,duration\n1000.0,0.01\n")
+
+    with pytest.raises(ValueError):
+        ResultsWriter(str(path))
+
+    assert path.read_binary() == b"timestamp,duration\n1000.0,0.01\n"
+
+
+def test_results_append_after_first_chunk_cut(tmpdir):
+    path = str(tmpdir.join("run.results"))
+    write_rows(path, 10)
+
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 10)
+
+    with pytest.raises(ValueError):
+        ResultsWriter(path)
+
+    assert os.path.getsize(path) == size - 10
+
+
+def test_results_append_to_complete_file(tmpdir):
+    path = str(tmpdir.join("run.results"))
+    write_rows(path, 1500)
+    size = os.path.getsize(path)
+
+    write_rows(path, 10, start=1500)
+
+    assert os.path.getsize(path) > size
+    assert len(load_results(path)["timestamp"]) == 1510
+
+
+def test_results_of_several_workers(tmpdir):
+    # every worker numbers its flows from 0
+    paths = [str(tmpdir.join("run.results.{i}".format(i=i))) for i in range(2)]
+    for path in paths:
+        write_rows(path, 100)
+
+    results = load_results(*paths)
+
+    assert len(results["timestamp"]) == 200
+    assert len(set(results["flow_id"].tolist())) == 200
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+import json
+import logging
+
+import pytest
+import requests
+
+import helpers.requests as req
+from helpers.flows import sp_initiated_login
+from helpers.idp_stand_in import IdpStandIn
+from helpers.sharding import worker_farm, worker_settings
+
+logger = logging.getLogger('acceptance-tool.tests.unit_tests.test_sharding')
+
+CONFIG_FILE = "tests_config/dev.json"
+
+WORKERS = ("_gw0", "_gw1")
+
+
+@pytest.fixture()
+def stand_in():
+    stand_in = IdpStandIn().start_in_thread()
+    yield stand_in
+    stand_in.stop_thread()
+
+
+@pytest.fixture()
+def settings(stand_in):
+    with open(CONFIG_FILE) as f:
+        settings = json.load(f)
+
+    test_realm = settings["idp"]["test_realm"]
+    idp = stand_in.idp_settings(test_realm["name"], test_realm["username"], test_realm["password"])
+    idp["test_realm"]["json_file"] = test_realm["json_file"]
+    settings["idp"] = {**settings["idp"], **idp}
+    return settings
+
+
+def test_workers_log_in_with_their_farm_and_realm(stand_in, settings, tmpdir):
+    farms = []
+    try:
+        for suffix in WORKERS:
+            farm = worker_farm(settings, suffix, port=0).start_in_thread()
+            farms.append(farm)
+            worker = worker_settings(settings, suffix, str(tmpdir.mkdir(suffix)), farm)
+
+            with open(worker["idp"]["test_realm"]["json_file"]) as f:
+                realm = json.load(f)
+            stand_in.add_realm(realm)
+
+            assert realm["realm"] == settings["idp"]["test_realm"]["name"] + suffix
+            clients = {client["clientId"]: client for client in realm["clients"]}
+            for sp in worker["sps_saml"] + worker["sps_wsfed"]:
+                assert clients[sp["name"]]["baseUrl"] == "http://127.0.0.1:{port}".format(port=sp["port"])
+
+            for standard, section in (("SAML", "sps_saml"), ("WSFED", "sps_wsfed")):
+                for sp in worker[section]:
+                    response = sp_initiated_login(logger, requests.Session(), req.get_header(), standard, sp,
+                                                  worker["idp"], worker["idp"]["test_realm"]["username"],
+                                                  worker["idp"]["test_realm"]["password"])
+                    assert sp["logged_in_message"] in response.text
+
+            assert farm.stats["logins"] == len(worker["sps_saml"] + worker["sps_wsfed"])
+    finally:
+        for farm in farms:
+            farm.stop_thread()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+import base64
+import hashlib
+
+import pytest
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from lxml import etree
+
+from helpers.saml import SAMLP, SAML, SAML11, WST
+from helpers.signatures import DSIG, EXC_C14N, ENVELOPED, RSA_SHA256, SignatureError, verify_xml
+
+SHA256 = "http://www.w3.org/2001/04/xmlenc#sha256"
+
+RESPONSE = """<samlp:Response xmlns:samlp="{samlp}" xmlns:saml="{saml}" ID="_response" Version="2.0">
+<saml:Issuer>http://localhost/auth/realms/automatic_keycloak_testing</saml:Issuer>
+<samlp:Status><samlp:StatusCode Value="urn:oasis:names:tc:SAML:2.0:status:Success"/></samlp:Status>
+<saml:Assertion ID="_assertion" Version="2.0">
+<saml:Issuer>http://localhost/auth/realms/automatic_keycloak_testing</saml:Issuer>
+<saml:Subject><saml:NameID>alice</saml:NameID></saml:Subject>
+</saml:Assertion>
+</samlp:Response>""".format(samlp=SAMLP, saml=SAML)
+
+WRESULT = """<t:RequestSecurityTokenResponse xmlns:t="{wst}"><t:RequestedSecurityToken>
+<saml:Assertion xmlns:saml="{saml11}" AssertionID="_assertion11" MajorVersion="1" MinorVersion="1">
+<saml:AttributeStatement><saml:Subject><saml:NameIdentifier>alice</saml:NameIdentifier></saml:Subject>
+</saml:AttributeStatement>
+</saml:Assertion>
+</t:RequestedSecurityToken></t:RequestSecurityTokenResponse>""".format(wst=WST, saml11=SAML11)
+
+
+def ds(name):
+    return "{%s}%s" % (DSIG, name)
+
+
+def sign(element, private_key):
+    """
+    Add an enveloped signature of element, as the IDP does
+    """
+    digest = hashlib.sha256(etree.tostring(element, method="c14n", exclusive=True)).digest()
+
+    signature = etree.Element(ds("Signature"), nsmap={"ds": DSIG})
+    signed_info = etree.SubElement(signature, ds("SignedInfo"))
+    etree.SubElement(signed_info, ds("CanonicalizationMethod"), Algorithm=EXC_C14N)
+    etree.SubElement(signed_info, ds("SignatureMethod"), Algorithm=RSA_SHA256)
+    reference = etree.SubElement(signed_info, ds("Reference"),
+                                 URI="#" + (element.get("ID") or element.get("AssertionID")))
+    transforms = etree.SubElement(reference, ds("Transforms"))
+    etree.SubElement(transforms, ds("Transform"), Algorithm=ENVELOPED)
+    etree.SubElement(transforms, ds("Transform"), Algorithm=EXC_C14N)
+    etree.SubElement(reference, ds("DigestMethod"), Algorithm=SHA256)
+    etree.SubElement(reference, ds("DigestValue")).text = base64.b64encode(digest).decode()
+    element.insert(1, signature)
+
+    data = etree.tostring(signed_info, method="c14n", exclusive=True)
+    value = private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+    etree.SubElement(signature, ds("SignatureValue")).text = base64.b64encode(value).decode()
+
+
+def assertion(root, namespace=SAML):
+    return root.find(".//{%s}Assertion" % namespace)
+
+
+@pytest.fixture(scope='module')
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+
+
+@pytest.fixture(scope='module')
+def keys(private_key):
+    return [private_key.public_key()]
+
+
+def test_signed_assertion(private_key, keys):
+    root = etree.fromstring(RESPONSE)
+    sign(assertion(root), private_key)
+
+    assert verify_xml(etree.tostring(root), keys) == 1
+
+
+def test_signed_response(private_key, keys):
+    root = etree.fromstring(RESPONSE)
+    sign(root, private_key)
+
+    assert verify_xml(etree.tostring(root), keys) == 1
+
+
+def test_signed_saml11_wresult(private_key, keys):
+    root = etree.fromstring(WRESULT)
+    sign(assertion(root, SAML11), private_key)
+
+    assert verify_xml(etree.tostring(root), keys) == 1
+
+
+def test_tampered_assertion(private_key, keys):
+    root = etree.fromstring(RESPONSE)
+    sign(assertion(root), private_key)
+    root.find(".//{%s}NameID" % SAML).text = "mallory"
+
+    with pytest.raises(SignatureError, match="Digest mismatch"):
+        verify_xml(etree.tostring(root), keys)
+
+
+def test_wrong_key(private_key):
+    root = etree.fromstring(RESPONSE)
+    sign(assertion(root), private_key)
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+
+    with pytest.raises(SignatureError, match="does not match the keys"):
+        verify_xml(etree.tostring(root), [other_key.public_key()])
+
+
+def test_unsigned_token(keys):
+    with pytest.raises(SignatureError, match="not signed"):
+        verify_xml(RESPONSE.encode(), keys)
+
+
+def test_unsigned_extra_assertion(private_key, keys):
+    root = etree.fromstring(RESPONSE)
+    signed_assertion = assertion(root)
+    sign(signed_assertion, private_key)
+
+    extra = etree.fromstring(etree.tostring(signed_assertion))
+    extra.set("ID", "_extra")
+    extra.remove(extra.find(ds("Signature")))
+    extra.find(".//{%s}NameID" % SAML).text = "mallory"
+    root.append(extra)
+
+    with pytest.raises(SignatureError, match="Assertion _extra is not signed"):
+        verify_xml(etree.tostring(root), keys)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2018:
+#     Sonia Bogos, sonia.bogos@elca.ch
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+#
+
+import json
+import logging
+
+import pytest
+
+import helpers.requests as req
+from helpers.flows import sp_initiated_login
+from helpers.idp_stand_in import IdpStandIn
+from helpers.sp_farm import SpFarm, local_sp
+from helpers.transport import Transport
+
+logger = logging.getLogger('acceptance-tool.tests.unit_tests.test_sp_farm')
+
+CONFIG_FILE = "tests_config/dev.json"
+
+with open(CONFIG_FILE) as json_data:
+    CONFIG = json.load(json_data)
+
+# the 8 SPs of the config file: dev-saml1..4 and dev-wsfed1..4
+TEMPLATES = [("SAML", sp) for sp in CONFIG["sps_saml"]] + [("WSFED", sp) for sp in CONFIG["sps_wsfed"]]
+
+
+@pytest.fixture(scope='module')
+def stand_in():
+    realms = []
+    for idp in ("idp", "idp_external"):
+        with open(CONFIG[idp]["test_realm"]["json_file"]) as f:
+            realms.append(json.load(f))
+
+    stand_in = IdpStandIn(realms=realms).start_in_thread()
+    yield stand_in
+    stand_in.stop_thread()
+
+
+@pytest.fixture(scope='module')
+def idp(stand_in):
+    test_realm = CONFIG["idp"]["test_realm"]
+    return stand_in.idp_settings(test_realm["name"], test_realm["username"], test_realm["password"])
+
+
+@pytest.fixture(scope='module')
+def farm(idp):
+    farm = SpFarm([local_sp(sp, sp["name"]) for _, sp in TEMPLATES], idp).start_in_thread()
+    yield farm
+    farm.stop_thread()
+
+
+@pytest.fixture(scope='module')
+def transport():
+    transport = Transport()
+    yield transport
+    transport.close()
+
+
+@pytest.mark.parametrize("standard,template", TEMPLATES, ids=[sp["name"] for _, sp in TEMPLATES])
+def test_sp_initiated_login(idp, farm, transport, standard, template):
+    sp = next(sp.sp for sp in farm.sps if sp.sp["name"] == template["name"])
+    logins = farm.stats["logins"]
+
+    response = sp_initiated_login(logger, transport.session(), req.get_header(), standard, sp, idp,
+                                  idp["test_realm"]["username"], idp["test_realm"]["password"])
+
+    assert response.url == "http://127.0.0.1:{port}/{path}".format(port=sp["port"], path=sp["path"])
+    assert template["logged_in_message"] in response.text
+    assert idp["test_realm"]["username"] in response.text
+    assert farm.stats["logins"] == logins + 1